@@ -0,0 +1,219 @@
+import os
+import sqlite3
+import argparse
+from pathlib import Path
+from typing import TypedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from timeit import default_timer as timer
+
+import numpy as np
+
+from audio_chunking import SAMPLE_RATE, decode_audio
+from utils import get_timestamp
+from metrics import METRICS
+
+
+## -- DECODED AUDIO CACHE ----
+## -- every audio file decoded once to 16kHz mono float32 `.npy`, which transcription and diarization memory map
+## -- instead of running ffmpeg again; an sqlite index holds each file's duration and what its decode cost
+
+AUDIO_CACHE_DIR = os.path.join("data", "audio_cache")
+INDEX_FILENAME = "index.sqlite"
+
+
+class CachedAudio(TypedDict):
+    id: str
+    source_filepath: str
+    source_size: int
+    source_mtime: float
+    cache_filepath: str
+    num_samples: int
+    duration: float
+    decode_time: float
+    num_reads: int  # <- reads served from the cache by downstream stages
+    created_at: str
+
+
+def load_cached_audio(cache_filepath: Path | str) -> np.ndarray:
+    # copy-on-write mapping: nothing is read until a page is touched, and consumers that need a
+    # writable buffer (e.g. `torch.from_numpy`) get one without copying the file up front
+    return np.load(cache_filepath, mmap_mode="c")
+
+
+class AudioCache:
+
+    def __init__(self, cache_dir: Path | str = AUDIO_CACHE_DIR):
+        self.cache_dir = str(cache_dir)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(self.cache_dir, INDEX_FILENAME))
+        self.conn.row_factory = sqlite3.Row
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS audio (
+                    id TEXT PRIMARY KEY,
+                    source_filepath TEXT NOT NULL,
+                    source_size INTEGER NOT NULL,
+                    source_mtime REAL NOT NULL,
+                    cache_filepath TEXT NOT NULL,
+                    num_samples INTEGER NOT NULL,
+                    duration REAL NOT NULL,
+                    decode_time REAL NOT NULL,
+                    num_reads INTEGER NOT NULL DEFAULT 0,
+                    created_at TEXT NOT NULL
+                )
+            """)
+
+    def get_cache_filepath(self, audio_id: str) -> str:
+        return os.path.join(self.cache_dir, f"{audio_id}.npy")
+
+    def get(self, audio_id: str, source_filepath: Path | str | None = None) -> CachedAudio | None:
+        """Cache entry for `audio_id`. With `source_filepath`, entries decoded from a different version of the file count as missing."""
+        row = self.conn.execute("SELECT * FROM audio WHERE id = ?", (audio_id,)).fetchone()
+        if row is None or not os.path.exists(row["cache_filepath"]):
+            return None
+        if source_filepath is not None:
+            stat = os.stat(source_filepath)
+            if (row["source_size"], row["source_mtime"]) != (stat.st_size, stat.st_mtime):
+                return None
+        return CachedAudio(**row)
+
+    def add(self, audio_id: str, source_filepath: Path | str) -> CachedAudio:
+        """Decode `source_filepath` and (re)place it in the cache."""
+        entry = _decode_to_cache(audio_id, str(source_filepath), self.get_cache_filepath(audio_id))
+        self._put(entry)
+        return entry
+
+    def _put(self, entry: CachedAudio) -> None:
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO audio VALUES (:id, :source_filepath, :source_size, :source_mtime, :cache_filepath, :num_samples, :duration, :decode_time, :num_reads, :created_at)",
+                entry
+            )
+
+    def ensure(self, audio_files: list[tuple[str, str]], workers: int = 4) -> tuple[dict[str, CachedAudio], dict[str, Exception]]:
+        """Make sure every (id, source filepath) in `audio_files` is cached, decoding missing or stale files across `workers` threads
+        (the decoding itself happens in ffmpeg subprocesses). Returns the cache entries and the errors of files that failed to decode."""
+        assert isinstance(workers, int) and workers > 0, f"Input '{workers}' for argument `workers` must be a positive int."
+        entries = {}
+        to_decode = []
+        for audio_id, source_filepath in audio_files:
+            entry = self.get(audio_id, source_filepath)
+            if entry is None:
+                to_decode.append((audio_id, source_filepath))
+            else:
+                entries[audio_id] = entry
+        METRICS.increment("audio_cache", "hits", len(entries))
+
+        errors = {}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(_decode_to_cache, audio_id, source_filepath, self.get_cache_filepath(audio_id)): audio_id
+                for audio_id, source_filepath in to_decode
+            }
+            for future in as_completed(futures):
+                audio_id = futures[future]
+                try:
+                    entries[audio_id] = future.result()
+                    self._put(entries[audio_id])  # <- sqlite connection stays on this thread
+                    METRICS.observe("audio_cache", "decode_time", entries[audio_id]["decode_time"], id=audio_id)
+                except Exception as e:
+                    errors[audio_id] = e
+                    METRICS.increment("audio_cache", "errors")
+        return entries, errors
+
+    def record_reads(self, audio_ids: list[str]) -> float:
+        """Count one cache read for each of `audio_ids`. Returns the decode time those reads saved: a file's first read
+        stands in for the one decode it would have needed anyway, so only repeat reads count."""
+        if not audio_ids:
+            return 0.0
+        placeholders = ", ".join("?" for _ in audio_ids)
+        rows = self.conn.execute(f"SELECT decode_time, num_reads FROM audio WHERE id IN ({placeholders})", audio_ids).fetchall()
+        with self.conn:
+            self.conn.executemany("UPDATE audio SET num_reads = num_reads + 1 WHERE id = ?", [(audio_id,) for audio_id in audio_ids])
+        return sum(row["decode_time"] for row in rows if row["num_reads"] > 0)
+
+    def summary(self) -> dict:
+        row = self.conn.execute("""
+            SELECT COUNT(*) AS num_files, COALESCE(SUM(duration), 0) AS total_duration, COALESCE(SUM(decode_time), 0) AS total_decode_time,
+                   COALESCE(SUM(num_reads), 0) AS total_reads, COALESCE(SUM(decode_time * MAX(num_reads - 1, 0)), 0) AS decode_time_saved,
+                   COALESCE(SUM(num_samples), 0) * 4 AS total_bytes
+            FROM audio
+        """).fetchone()
+        return dict(row)
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def _decode_to_cache(audio_id: str, source_filepath: str, cache_filepath: str) -> CachedAudio:
+    stat = os.stat(source_filepath)
+    start_time = timer()
+    audio = decode_audio(source_filepath)
+    decode_time = timer() - start_time
+
+    # written to a temp file and renamed, so a crash never leaves a truncated array behind
+    tmp_filepath = f"{cache_filepath}.tmp.npy"
+    np.save(tmp_filepath, audio.astype(np.float32, copy=False))
+    os.replace(tmp_filepath, cache_filepath)
+
+    return CachedAudio(
+        id=audio_id,
+        source_filepath=source_filepath,
+        source_size=stat.st_size,
+        source_mtime=stat.st_mtime,
+        cache_filepath=cache_filepath,
+        num_samples=len(audio),
+        duration=len(audio) / SAMPLE_RATE,
+        decode_time=decode_time,
+        num_reads=0,
+        created_at=get_timestamp()
+    )
+
+
+def open_audio_cache(cache_dir: Path | str, audio_files: list[tuple[str, str]], workers: int = 4) -> tuple[AudioCache, dict[str, CachedAudio]]:
+    """Open the cache at `cache_dir` and make sure (id, source filepath) `audio_files` are in it. Files that fail to decode are
+    left out of the returned entries, so stages fall back on handing the model the source file."""
+    cache = AudioCache(cache_dir)
+    start_time = timer()
+    entries, errors = cache.ensure(audio_files, workers=workers)
+    for audio_id, error in errors.items():
+        print(f"!! Failed to decode '{audio_id}' into the audio cache: {type(error).__name__}: {error}")
+    print(f"-> {len(entries):,} of {len(audio_files):,} file(s) ready in the audio cache after {timer() - start_time:.1f}s.")
+    return cache, entries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Decode audio files once into the shared 16kHz mono cache, or report on the cache.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    preprocess_parser = subparsers.add_parser("preprocess", help="Decode every new or changed file in an audio directory.")
+    preprocess_parser.add_argument("--audio-dir", type=str, default=os.path.join("data", "audio_files"))
+    preprocess_parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of files decoded in parallel.")
+
+    report_parser = subparsers.add_parser("report", help="Show cache size and the decode time saved by cache reads so far.")
+
+    for subparser in [preprocess_parser, report_parser]:
+        subparser.add_argument("--cache-dir", type=str, default=AUDIO_CACHE_DIR)
+
+    args = parser.parse_args()
+    cache = AudioCache(args.cache_dir)
+
+    if args.command == "preprocess":
+        audio_files = [
+            (os.path.splitext(file)[0], os.path.join(args.audio_dir, file))
+            for file in sorted(os.listdir(args.audio_dir))
+            if file.endswith((".mp3", ".wav"))
+        ]
+        start_time = timer()
+        entries, errors = cache.ensure(audio_files, workers=args.workers)
+        for audio_id, error in errors.items():
+            print(f"!! Failed to decode '{audio_id}': {type(error).__name__}: {error}")
+        print(f"-> {len(entries):,} of {len(audio_files):,} file(s) cached in {timer() - start_time:.1f}s.")
+
+    summary = cache.summary()
+    print(
+        f"-> Audio cache '{args.cache_dir}': {summary['num_files']:,} file(s), {summary['total_duration'] / 3600:.2f} audio hours, "
+        f"{summary['total_bytes'] / 1e9:.2f} GB. Decoding took {summary['total_decode_time']:.1f}s once; "
+        f"{summary['total_reads']:,} cache read(s) since have saved {summary['decode_time_saved']:.1f}s."
+    )
+    cache.close()
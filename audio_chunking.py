@@ -0,0 +1,150 @@
+import wave
+import subprocess
+from typing import TypedDict
+
+import numpy as np
+
+SAMPLE_RATE = 16_000
+
+
+## -- DECODING ----
+
+def _read_wav(filepath: str) -> np.ndarray:
+    with wave.open(filepath, mode="rb") as wav_file:
+        assert wav_file.getframerate() == SAMPLE_RATE and wav_file.getnchannels() == 1 and wav_file.getsampwidth() == 2, (
+            f"Reading '{filepath}' without ffmpeg requires 16kHz mono 16-bit wav."
+        )
+        pcm = wav_file.readframes(wav_file.getnframes())
+    return np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+def decode_audio(filepath: str) -> np.ndarray:
+    """Decode any ffmpeg-readable file to 16kHz mono float32 (the same preprocessing whisper applies).
+    Falls back on the `wave` module for 16kHz mono wav files when ffmpeg isn't installed."""
+    cmd = [
+        "ffmpeg", "-nostdin", "-threads", "0", "-i", filepath,
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE), "-"
+    ]
+    try:
+        pcm = subprocess.run(cmd, capture_output=True, check=True).stdout
+    except FileNotFoundError:
+        return _read_wav(filepath)
+    return np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+## -- ENERGY-BASED VOICE ACTIVITY DETECTION ----
+
+def get_frame_energy_db(audio: np.ndarray, frame_length: int) -> np.ndarray:
+    num_frames = len(audio) // frame_length
+    frames = audio[:num_frames * frame_length].reshape(num_frames, frame_length)
+    rms = np.sqrt(np.mean(frames ** 2, axis=1))
+    return 20 * np.log10(rms + 1e-10)
+
+
+def find_silences(audio: np.ndarray, frame_ms: int = 30, threshold_db: float = -35.0, min_silence_s: float = 0.3) -> list[tuple[float, float]]:
+    """Returns (start, end) seconds of stretches at least `min_silence_s` long whose energy is `threshold_db` below the loud (95th percentile) frames."""
+    frame_length = SAMPLE_RATE * frame_ms // 1000
+    energy_db = get_frame_energy_db(audio, frame_length)
+    if len(energy_db) == 0:
+        return []
+
+    is_silent = energy_db < (np.percentile(energy_db, 95) + threshold_db)
+
+    # find runs of silent frames
+    padded = np.concatenate([[False], is_silent, [False]])
+    edges = np.flatnonzero(np.diff(padded.astype(np.int8)))
+    run_starts, run_ends = edges[0::2], edges[1::2]
+
+    frame_s = frame_length / SAMPLE_RATE
+    return [
+        (float(start * frame_s), float(end * frame_s))
+        for start, end in zip(run_starts, run_ends)
+        if (end - start) * frame_s >= min_silence_s
+    ]
+
+
+## -- CHUNK PLANNING ----
+
+class AudioChunk(TypedDict):
+    index: int
+    start: float        # <- region of the episode this chunk is responsible for
+    end: float
+    audio_start: float  # <- region actually transcribed; includes overlap with neighbouring chunks
+    audio_end: float
+
+
+def plan_chunks(duration: float, silences: list[tuple[float, float]], max_chunk_s: float = 300.0, min_chunk_s: float | None = None, overlap_s: float = 1.0) -> list[AudioChunk]:
+    """Split `duration` seconds into chunks no longer than `max_chunk_s`, cutting in the middle of the last silence
+    between `min_chunk_s` (default: half of `max_chunk_s`) and `max_chunk_s` into each chunk, or at `max_chunk_s` if there is none.
+    Chunks are padded by `overlap_s` on either side."""
+    if min_chunk_s is None:
+        min_chunk_s = max_chunk_s / 2
+    assert max_chunk_s > min_chunk_s, f"Input '{max_chunk_s}' for argument `max_chunk_s` must be greater than `min_chunk_s` ('{min_chunk_s}')."
+    silence_midpoints = [(start + end) / 2 for start, end in silences]
+
+    split_points = [0.0]
+    while duration - split_points[-1] > max_chunk_s:
+        window_start, window_end = split_points[-1] + min_chunk_s, split_points[-1] + max_chunk_s
+        candidates = [midpoint for midpoint in silence_midpoints if window_start <= midpoint <= window_end]
+        split_points.append(candidates[-1] if candidates else window_end)
+    split_points.append(duration)
+
+    return [
+        AudioChunk(
+            index=idx,
+            start=start,
+            end=end,
+            audio_start=max(0.0, start - overlap_s),
+            audio_end=min(duration, end + overlap_s)
+        )
+        for idx, (start, end) in enumerate(zip(split_points[:-1], split_points[1:]))
+    ]
+
+
+def split_audio(audio: np.ndarray, max_chunk_s: float = 300.0, min_chunk_s: float | None = None, overlap_s: float = 1.0) -> tuple[list[AudioChunk], list[np.ndarray]]:
+    duration = len(audio) / SAMPLE_RATE
+    chunks = plan_chunks(duration, find_silences(audio), max_chunk_s=max_chunk_s, min_chunk_s=min_chunk_s, overlap_s=overlap_s)
+    chunk_audio = [
+        audio[int(chunk["audio_start"] * SAMPLE_RATE):int(chunk["audio_end"] * SAMPLE_RATE)]
+        for chunk in chunks
+    ]
+    return chunks, chunk_audio
+
+
+## -- STITCHING ----
+
+WHISPER_FRAMES_PER_SECOND = 100  # <- `seek` is measured in 10ms mel frames
+
+def stitch_transcriptions(chunks: list[AudioChunk], transcriptions: list[dict]) -> dict:
+    """Merge per-chunk whisper output into one transcription with episode-level timestamps.
+    Segments are shifted by their chunk's offset; a segment in an overlap is kept only by the chunk whose region contains its midpoint."""
+    stitched_segments = []
+    for chunk, transcribed in zip(chunks, transcriptions):
+        offset = chunk["audio_start"]
+        is_last_chunk = chunk["index"] == len(chunks) - 1
+
+        for segment in transcribed["segments"]:
+            start, end = segment["start"] + offset, segment["end"] + offset
+            midpoint = (start + end) / 2
+            if not (chunk["start"] <= midpoint < chunk["end"] or (is_last_chunk and midpoint >= chunk["end"])):
+                continue
+
+            stitched_segment = {
+                **segment,
+                "id": len(stitched_segments),
+                "seek": segment.get("seek", 0) + round(offset * WHISPER_FRAMES_PER_SECOND),
+                "start": start,
+                "end": end,
+            }
+            if "words" in segment:
+                stitched_segment["words"] = [
+                    {**word, "start": word["start"] + offset, "end": word["end"] + offset}
+                    for word in segment["words"]
+                ]
+            stitched_segments.append(stitched_segment)
+
+    return {
+        "text": "".join(segment["text"] for segment in stitched_segments),
+        "segments": stitched_segments,
+        "language": transcriptions[0].get("language") if transcriptions else None,
+    }
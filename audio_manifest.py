@@ -0,0 +1,307 @@
+import os
+import struct
+import sqlite3
+import hashlib
+import argparse
+from pathlib import Path
+from typing import TypedDict
+from concurrent.futures import ThreadPoolExecutor
+from timeit import default_timer as timer
+
+from utils import get_timestamp
+
+
+## -- AUDIO MANIFEST ----
+## -- size, sha256 and duration of every downloaded mp3, keyed by url, plus which url each programme uses. re-runs skip
+## -- urls whose file is still on disk at its recorded size, `verify` re-hashes every file to find corrupt or truncated
+## -- ones, and audio that turns out byte-identical to an existing file (e.g. a repeat broadcast published under a new
+## -- url) points at that file instead of being stored twice
+
+AUDIO_MANIFEST_DB = os.path.join("data", "audio_manifest.sqlite")
+
+HASH_CHUNK_SIZE = 1024 * 1024
+DURATION_TOLERANCE_S = 90.0  # <- listed durations are rounded to the minute
+
+
+class AudioFile(TypedDict):
+    url: str
+    filename: str  # <- file in the audio directory; shared by urls with identical audio
+    size: int
+    sha256: str
+    duration: float | None
+    downloaded_at: str
+    verified_at: str
+
+
+class AudioFileCheck(TypedDict):
+    size: int
+    sha256: str
+    duration: float | None
+    problem: str | None  # <- why the file can't be trusted, if it can't
+
+
+class AudioManifest:
+
+    def __init__(self, filepath: Path | str = AUDIO_MANIFEST_DB):
+        self.conn = sqlite3.connect(filepath)
+        self.conn.row_factory = sqlite3.Row
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS audio_files (
+                    url TEXT PRIMARY KEY,
+                    filename TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    duration REAL,
+                    downloaded_at TEXT NOT NULL,
+                    verified_at TEXT NOT NULL
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS audio_files_sha256 ON audio_files (sha256)")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS programme_audio (
+                    programme_id TEXT PRIMARY KEY,
+                    url TEXT NOT NULL
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS programme_audio_url ON programme_audio (url)")
+
+    def set_programme_urls(self, programme_urls: dict[str, str]) -> None:
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO programme_audio (programme_id, url) VALUES (?, ?)", programme_urls.items())
+
+    def get(self, url: str) -> AudioFile | None:
+        row = self.conn.execute("SELECT * FROM audio_files WHERE url = ?", (url,)).fetchone()
+        return AudioFile(**row) if row is not None else None
+
+    def get_all(self) -> list[AudioFile]:
+        return [AudioFile(**row) for row in self.conn.execute("SELECT * FROM audio_files ORDER BY url").fetchall()]
+
+    def find_by_sha256(self, sha256: str) -> AudioFile | None:
+        row = self.conn.execute("SELECT * FROM audio_files WHERE sha256 = ? ORDER BY downloaded_at LIMIT 1", (sha256,)).fetchone()
+        return AudioFile(**row) if row is not None else None
+
+    def add(self, audio_file: AudioFile) -> None:
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO audio_files (url, filename, size, sha256, duration, downloaded_at, verified_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (audio_file["url"], audio_file["filename"], audio_file["size"], audio_file["sha256"], audio_file["duration"], audio_file["downloaded_at"], audio_file["verified_at"])
+            )
+
+    def remove(self, url: str) -> None:
+        with self.conn:
+            self.conn.execute("DELETE FROM audio_files WHERE url = ?", (url,))
+
+    def is_filename_used(self, filename: str) -> bool:
+        return self.conn.execute("SELECT 1 FROM audio_files WHERE filename = ?", (filename,)).fetchone() is not None
+
+    def mark_verified(self, urls: list[str]) -> None:
+        verified_at = get_timestamp()
+        with self.conn:
+            self.conn.executemany("UPDATE audio_files SET verified_at = ? WHERE url = ?", [(verified_at, url) for url in urls])
+
+    def is_stored(self, url: str, audio_dir: Path | str) -> bool:
+        """Whether `url` has been downloaded and its file is still on disk at the recorded size (a stat, not a re-hash)."""
+        audio_file = self.get(url)
+        if audio_file is None:
+            return False
+        filepath = os.path.join(audio_dir, audio_file["filename"])
+        return os.path.exists(filepath) and os.path.getsize(filepath) == audio_file["size"]
+
+    def summary(self) -> dict[str, int]:
+        row = self.conn.execute("""
+            SELECT COUNT(*) AS num_urls, COUNT(DISTINCT filename) AS num_files, COALESCE(SUM(size), 0) AS total_bytes
+            FROM audio_files
+        """).fetchone()
+        num_programmes = self.conn.execute("SELECT COUNT(*) FROM programme_audio").fetchone()[0]
+        stored_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT filename, size FROM audio_files)").fetchone()[0]
+        return {**row, "num_programmes": num_programmes, "stored_bytes": stored_bytes}
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+#### -- MP3 HEADERS ----
+#### -- enough of the MPEG audio layer III frame header to get a file's duration without decoding it: from the
+#### -- Xing/Info header's frame count when there is one (which also gives the expected byte count), else from the bitrate
+
+_BITRATES_KBPS = {
+    "mpeg1": (None, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    "mpeg2": (None, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}  # <- keyed by version bits
+_MAX_HEADER_SEARCH_BYTES = 64 * 1024
+
+
+class Mp3Info(TypedDict):
+    duration: float
+    bitrate_kbps: int
+    sample_rate: int
+    expected_size: int | None  # <- from the Xing/Info header, when it records the byte count
+
+
+def _parse_frame_header(header: bytes) -> tuple[int, int, int, int, int] | None:
+    """Returns (version bits, bitrate in kbps, sample rate, frame length, channel mode) for a layer III frame header."""
+    if len(header) < 4:
+        return None
+    value = struct.unpack(">I", header[:4])[0]
+    if value >> 21 != 0x7FF:
+        return None
+    version_bits, layer_bits = (value >> 19) & 0b11, (value >> 17) & 0b11
+    bitrate_index, sample_rate_index = (value >> 12) & 0b1111, (value >> 10) & 0b11
+    if version_bits == 1 or layer_bits != 0b01 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    bitrate_kbps = _BITRATES_KBPS["mpeg1" if version_bits == 3 else "mpeg2"][bitrate_index]
+    sample_rate = _SAMPLE_RATES[version_bits][sample_rate_index]
+    padding = (value >> 9) & 1
+    frame_length = (144 if version_bits == 3 else 72) * bitrate_kbps * 1000 // sample_rate + padding
+    return version_bits, bitrate_kbps, sample_rate, frame_length, (value >> 6) & 0b11
+
+
+def get_mp3_info(filepath: Path | str) -> Mp3Info | None:
+    """Read the first frame header of an mp3 (after any ID3v2 tag). Returns None if no valid frame is found."""
+    file_size = os.path.getsize(filepath)
+    with open(filepath, mode="rb") as infile:
+        audio_start = 0
+        tag_header = infile.read(10)
+        if tag_header[:3] == b"ID3" and len(tag_header) == 10:
+            tag_size = (tag_header[6] << 21) | (tag_header[7] << 14) | (tag_header[8] << 7) | tag_header[9]
+            audio_start = 10 + tag_size + (10 if tag_header[5] & 0x10 else 0)  # <- plus the footer, if present
+        infile.seek(audio_start)
+        data = infile.read(_MAX_HEADER_SEARCH_BYTES)
+
+    offset = data.find(b"\xff")
+    while offset != -1:
+        frame = _parse_frame_header(data[offset:offset + 4])
+        # a sync word can occur by chance, so the next frame must follow where this one says it ends
+        if frame is not None and offset + frame[3] + 4 <= len(data) and _parse_frame_header(data[offset + frame[3]:offset + frame[3] + 4]) is not None:
+            break
+        offset = data.find(b"\xff", offset + 1)
+    else:
+        return None
+
+    version_bits, bitrate_kbps, sample_rate, _, channel_mode = frame
+    samples_per_frame = 1152 if version_bits == 3 else 576
+    side_info_size = (32 if channel_mode != 3 else 17) if version_bits == 3 else (17 if channel_mode != 3 else 9)
+    xing_offset = offset + 4 + side_info_size
+    if data[xing_offset:xing_offset + 4] in (b"Xing", b"Info"):
+        flags = struct.unpack(">I", data[xing_offset + 4:xing_offset + 8])[0]
+        fields = data[xing_offset + 8:]
+        num_frames = struct.unpack(">I", fields[:4])[0] if flags & 0x1 else None
+        num_bytes = struct.unpack(">I", fields[4:8] if flags & 0x1 else fields[:4])[0] if flags & 0x2 else None
+        if num_frames is not None:
+            return Mp3Info(
+                duration=num_frames * samples_per_frame / sample_rate,
+                bitrate_kbps=bitrate_kbps,
+                sample_rate=sample_rate,
+                expected_size=audio_start + offset + num_bytes if num_bytes is not None else None
+            )
+
+    # constant bitrate: duration follows from the size of the audio data
+    return Mp3Info(
+        duration=(file_size - audio_start - offset) * 8 / (bitrate_kbps * 1000),
+        bitrate_kbps=bitrate_kbps,
+        sample_rate=sample_rate,
+        expected_size=None
+    )
+
+
+#### -- VERIFICATION ----
+
+def get_file_sha256(filepath: Path | str, chunk_size: int = HASH_CHUNK_SIZE) -> str:
+    # hashlib releases the GIL on large buffers, so threads hash files in parallel
+    sha256 = hashlib.sha256()
+    with open(filepath, mode="rb") as infile:
+        while chunk := infile.read(chunk_size):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def inspect_audio_file(filepath: Path | str, expected_duration: float | None = None) -> AudioFileCheck:
+    """Hash an mp3 and check it isn't truncated, against its own Xing/Info header and against the listed duration if given."""
+    size = os.path.getsize(filepath)
+    sha256 = get_file_sha256(filepath)
+    mp3_info = get_mp3_info(filepath)
+    duration = mp3_info["duration"] if mp3_info is not None else None
+
+    problem = None
+    if mp3_info is not None and mp3_info["expected_size"] is not None and size < mp3_info["expected_size"]:
+        problem = f"truncated: {size:,} of {mp3_info['expected_size']:,} bytes"
+    elif duration is not None and expected_duration is not None and duration < expected_duration - DURATION_TOLERANCE_S:
+        problem = f"truncated: {duration:.0f}s of {expected_duration:.0f}s"
+    return AudioFileCheck(size=size, sha256=sha256, duration=duration, problem=problem)
+
+
+def _verify_file(audio_file: AudioFile, audio_dir: Path | str, expected_duration: float | None) -> str | None:
+    filepath = os.path.join(audio_dir, audio_file["filename"])
+    if not os.path.exists(filepath):
+        return "missing"
+    if os.path.getsize(filepath) != audio_file["size"]:
+        return f"size changed: {os.path.getsize(filepath):,} bytes, recorded {audio_file['size']:,}"
+    check = inspect_audio_file(filepath, expected_duration)
+    if check["sha256"] != audio_file["sha256"]:
+        return "sha256 mismatch"
+    return check["problem"]
+
+
+def verify_audio_files(manifest: AudioManifest, audio_dir: Path | str, workers: int | None = None, expected_durations: dict[str, float] | None = None) -> dict[str, str]:
+    """Re-hash every file in the manifest in parallel (each shared file once), marking good ones verified. Returns the
+    problem found for each url whose file is missing, changed or truncated."""
+    expected_durations = expected_durations or {}
+    audio_files = manifest.get_all()
+    urls_by_filename = {}
+    for audio_file in audio_files:
+        urls_by_filename.setdefault(audio_file["filename"], []).append(audio_file)
+
+    def verify_filename(filename: str) -> str | None:
+        file_urls = urls_by_filename[filename]
+        expected_duration = max((expected_durations.get(audio_file["url"]) or 0 for audio_file in file_urls), default=0) or None
+        return _verify_file(file_urls[0], audio_dir, expected_duration)
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        problems_by_filename = dict(zip(urls_by_filename, executor.map(verify_filename, urls_by_filename)))
+
+    problems = {}
+    verified_urls = []
+    for filename, problem in problems_by_filename.items():
+        for audio_file in urls_by_filename[filename]:
+            if problem is None:
+                verified_urls.append(audio_file["url"])
+            else:
+                problems[audio_file["url"]] = problem
+    manifest.mark_verified(verified_urls)
+    return problems
+
+
+if __name__ == "__main__":
+    from download_audio_files import PROGRAMME_MP3_DIR
+
+    parser = argparse.ArgumentParser(description="Inspect and verify the manifest of downloaded mp3s.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    verify_parser = subparsers.add_parser("verify", help="Re-hash every downloaded mp3 and report missing, changed or truncated files.")
+    verify_parser.add_argument("--workers", type=int, default=None, help="Files hashed in parallel. Defaults to the number of CPUs.")
+
+    stats_parser = subparsers.add_parser("stats", help="Show how many urls, files and bytes the manifest holds.")
+
+    for subparser in [verify_parser, stats_parser]:
+        subparser.add_argument("--manifest", type=str, default=AUDIO_MANIFEST_DB)
+        subparser.add_argument("--audio-dir", type=str, default=PROGRAMME_MP3_DIR)
+
+    args = parser.parse_args()
+    manifest = AudioManifest(args.manifest)
+
+    if args.command == "verify":
+        start_time = timer()
+        problems = verify_audio_files(manifest, args.audio_dir, workers=args.workers)
+        total_time = timer() - start_time
+        summary = manifest.summary()
+        for url, problem in problems.items():
+            print(f"!! {url}: {problem}")
+        print(f"-> Verified {summary['num_files']:,} files ({summary['stored_bytes'] / 1e9:,.2f}GB) in {total_time:.1f}s ({summary['stored_bytes'] / 1e6 / max(total_time, 1e-9):,.0f}MB/sec); {len(problems):,} urls need re-downloading.")
+    elif args.command == "stats":
+        summary = manifest.summary()
+        print(f"-> {summary['num_urls']:,} urls for {summary['num_programmes']:,} programmes, stored in {summary['num_files']:,} files ({summary['stored_bytes'] / 1e9:,.2f}GB, {summary['total_bytes'] / 1e9:,.2f}GB before deduplication)")
+
+    manifest.close()
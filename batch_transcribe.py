@@ -1,16 +1,25 @@
 import os
-import time
-import json
 import argparse
 from pathlib import Path
 from typing import TypedDict
+from functools import partial
 from timeit import default_timer as timer
 
-import mlx_whisper
-from tqdm import tqdm
+from transcription import (
+    TRANSCRIPTION_BACKENDS,
+    DEFAULT_TRANSCRIPTION_BACKEND,
+    create_transcription_job,
+    is_complete_transcription,
+    record_transcription_metrics,
+    run_transcription_jobs,
+    run_chunked_transcription_jobs
+)
+from job_ledger import open_job_ledger, select_jobs_to_run
+from metrics import add_metrics_arguments, start_metrics, finish_metrics
+from download_audio_files import PARTIAL_FILE_SUFFIX
 
-MODEL_CHECKPOINT = "mlx-community/distil-whisper-large-v3"
 SUPPORTED_AUDIO_FORMATS = [".mp3", ".wav"]
+LEDGER_FILENAME = ".transcription_ledger.sqlite"
 
 
 parser = argparse.ArgumentParser()
@@ -38,7 +47,83 @@ parser.add_argument(
     help="Flag for performing backfill of transcriptions. With this enabled, will only transcribe files from provided data directory which are not already transcribed in output directory."
 )
 
-args = parser.parse_args()
+parser.add_argument(
+    "--backend",
+    type=str,
+    choices=list(TRANSCRIPTION_BACKENDS),
+    default=DEFAULT_TRANSCRIPTION_BACKEND,
+    help="Transcription backend. Use 'faster_whisper' on CPU-only machines and 'fake' for testing."
+)
+
+parser.add_argument(
+    "--model",
+    type=str,
+    required=False,
+    default=None,
+    help="Model checkpoint for the chosen backend. Defaults to the backend's distil-whisper-large-v3 checkpoint."
+)
+
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=1,
+    help="Number of transcription worker processes. Each loads its own copy of the model."
+)
+
+parser.add_argument(
+    "--retry-failed",
+    action="store_true",
+    help="With `--backfill`, also retry files whose transcription previously failed (up to `--max-attempts`)."
+)
+
+parser.add_argument(
+    "--max-attempts",
+    type=int,
+    default=3,
+    help="Maximum number of attempts per file when using `--retry-failed`."
+)
+
+parser.add_argument(
+    "--chunked",
+    action="store_true",
+    help="Split each file on silence and transcribe the chunks in parallel, so one long episode is shared across workers."
+)
+
+parser.add_argument(
+    "--max-chunk-length",
+    type=float,
+    default=300.0,
+    help="Maximum chunk length in seconds when using `--chunked`."
+)
+
+parser.add_argument(
+    "--chunk-overlap",
+    type=float,
+    default=1.0,
+    help="Seconds of audio shared between neighbouring chunks when using `--chunked`."
+)
+
+parser.add_argument(
+    "--audio-cache",
+    type=str,
+    default=None,
+    help="Directory of the decoded audio cache (see `audio_cache.py`). Files are decoded into it once, and read from it by every later run and stage."
+)
+
+parser.add_argument(
+    "--decode-workers",
+    type=int,
+    default=4,
+    help="Number of files decoded in parallel when filling the audio cache."
+)
+
+parser.add_argument(
+    "--dry-run",
+    action="store_true",
+    help="List the files a run would transcribe (e.g. with `--backfill`) and the ledger status, without loading a model or changing the ledger."
+)
+
+add_metrics_arguments(parser)
 
 
 def is_valid_audio_file(filename: Path | str) -> bool:
@@ -46,6 +131,16 @@ def is_valid_audio_file(filename: Path | str) -> bool:
     return os.path.splitext(os.path.basename(filename))[1] in SUPPORTED_AUDIO_FORMATS
 
 
+def list_audio_files(audio_dir: Path | str) -> list[str]:
+    """Supported audio files in `audio_dir`, skipping partial downloads and anything else."""
+    filenames = sorted(os.listdir(audio_dir))
+    audio_filenames = [file for file in filenames if is_valid_audio_file(file) and not file.endswith(PARTIAL_FILE_SUFFIX)]
+    if len(audio_filenames) < len(filenames):
+        num_partial = sum(file.endswith(PARTIAL_FILE_SUFFIX) for file in filenames)
+        print(f"!! skipping {len(filenames) - len(audio_filenames)} non-audio files in '{audio_dir}' ({num_partial} partial downloads)")
+    return [os.path.join(audio_dir, file) for file in audio_filenames]
+
+
 
 class AudioFile(TypedDict):
     filepath: str
@@ -62,7 +157,16 @@ def create_audio_file_dict(filepath: str) -> AudioFile:
     )
 
 
-def main():
+def get_existing_transcription(output_dir: str, file_id: str) -> str | None:
+    output_filepath = os.path.join(output_dir, f"{file_id}.json")
+    if os.path.exists(output_filepath) and is_complete_transcription(output_filepath):
+        return output_filepath
+    return None
+
+
+def main(args: argparse.Namespace):
+    start_metrics(args)
+
     ## ---- PROCESS INPUTS ------
 
     ## quality control check on input audio directory
@@ -70,46 +174,92 @@ def main():
     assert os.path.exists(audio_dir) and os.path.isdir(audio_dir), f"Invalid input for audio directory."
 
     ## get list of audio files from input directory + quality control check
-    audio_files = [os.path.join(audio_dir, file) for file in os.listdir(audio_dir)]
-    audio_files = [create_audio_file_dict(audio_filepath) for audio_filepath in audio_files]
-    assert len(audio_files) > 0, f"Audio directory '{audio_dir}' is empty. Must contain audio files."
-    assert all([is_valid_audio_file(file["filepath"]) for file in audio_files]), f"Detected a file in directory '{audio_dir}' with a file extension other than '.mp3' or '.wav'. This script expects only audio files."
+    audio_files = [create_audio_file_dict(audio_filepath) for audio_filepath in list_audio_files(audio_dir)]
+    assert len(audio_files) > 0, f"Audio directory '{audio_dir}' has no '.mp3' or '.wav' files. Must contain audio files."
 
     ## check on provided output directory
     output_dir = args.outdir
 
     # conditionally create output directory if it doesn't exist
-    if not os.path.exists(output_dir):
+    if not os.path.exists(output_dir) and not args.dry_run:
         os.mkdir(output_dir)
 
-    # for backfill mode, check which audio files need to be transcribed
-    if args.backfill:
-        already_transcribed_files = os.listdir(output_dir)
-        already_transcribed_ids = [get_file_id(file) for file in already_transcribed_files]
-
-        not_yet_transcribed_files = [file for file in audio_files if file["id"] not in already_transcribed_ids]
-        audio_files = not_yet_transcribed_files
-
-
+    # every file is tracked in a persistent ledger; a killed run leaves its in-progress files as 'running'
+    ledger = open_job_ledger(
+        os.path.join(output_dir, LEDGER_FILENAME),
+        jobs=[(file["id"], file["filepath"]) for file in audio_files],
+        get_existing_output=partial(get_existing_transcription, output_dir),
+        dry_run=args.dry_run
+    )
 
+    # for backfill mode, only transcribe files the ledger doesn't have as done
+    ids_to_transcribe = select_jobs_to_run(
+        ledger,
+        [file["id"] for file in audio_files],
+        backfill=args.backfill,
+        retry_failed=args.retry_failed,
+        max_attempts=args.max_attempts
+    )
+    audio_files = [file for file in audio_files if file["id"] in ids_to_transcribe]
+
+    if args.dry_run:
+        print(f"-> [DRY RUN] Would transcribe {len(audio_files):,} file(s).")
+        for file in audio_files:
+            print(f"| {file['filepath']}")
+        print(f"-> Ledger status: {ledger.status_counts()}")
+        ledger.close()
+        return
+
+    # decode-once cache: models read memory mapped samples instead of running ffmpeg on the mp3 themselves
+    audio_cache, cached_audio = None, {}
+    if args.audio_cache is not None:
+        from audio_cache import open_audio_cache  # <- numpy; only loaded when the cache is used
+        audio_cache, cached_audio = open_audio_cache(args.audio_cache, [(file["id"], file["filepath"]) for file in audio_files], workers=args.decode_workers)
 
     ## ---- BEGIN TRANSCRIPTION ------
     num_audio_files = len(audio_files)
     print(f"## Transcribing {num_audio_files:,} Audio File(s)\n{'-' * 35}")
 
-    for idx, file in enumerate(audio_files):
-        start_time = timer()
-        transcribed = mlx_whisper.transcribe(file["filepath"], path_or_hf_repo=MODEL_CHECKPOINT)
-        total_time = timer() - start_time
-
-        # save to json file
-        output_filepath = os.path.join(output_dir, f"{file['id']}.json")
-        with open(output_filepath, mode="w") as outfile:
-            json.dump(transcribed, outfile)
-            outfile.close()
-
-        print(f"-> file {idx+1}/{num_audio_files} | transcribed '{file['filepath']}' in {round(total_time)}s | saved to '{output_filepath}'")
-
+    transcription_jobs = [create_transcription_job(file["id"], file["filepath"], cached_audio.get(file["id"])) for file in audio_files]
+    ledger.mark_running([job["id"] for job in transcription_jobs])
+
+    start_time = timer()
+    total_audio_duration = 0.0
+    num_errors = 0
+    if args.chunked:
+        transcription_results = run_chunked_transcription_jobs(
+            transcription_jobs, output_dir,
+            backend_name=args.backend, model=args.model, workers=args.workers,
+            max_chunk_s=args.max_chunk_length, overlap_s=args.chunk_overlap
+        )
+    else:
+        transcription_results = run_transcription_jobs(transcription_jobs, output_dir, backend_name=args.backend, model=args.model, workers=args.workers)
+
+    for idx, result in enumerate(transcription_results):
+        record_transcription_metrics(result)
+        if result["error"] is not None:
+            ledger.mark_failed(result["id"], result["error"])
+            print(f"!! file {idx+1}/{num_audio_files} | error transcribing '{result['filepath']}'.")
+            print(result["error"])
+            num_errors += 1
+            continue
+
+        ledger.mark_done(result["id"], result["output_filepath"])
+
+        total_audio_duration += result["audio_duration"] or 0.0
+        realtime_factor = f"{result['realtime_factor']:.3f}" if result["realtime_factor"] is not None else "n/a"
+        print(f"-> file {idx+1}/{num_audio_files} | transcribed '{result['filepath']}' in {round(result['transcribe_time'])}s (RTF {realtime_factor}) | saved to '{result['output_filepath']}'")
+
+    total_time = timer() - start_time
+    print(f"-> {num_errors} errors.")
+    print(f"-> Ledger status: {ledger.status_counts()}")
+    ledger.close()
+    if audio_cache is not None:
+        decode_time_saved = audio_cache.record_reads([job["id"] for job in transcription_jobs if job["cached_audio_filepath"]])
+        print(f"-> Read {len(cached_audio):,} file(s) from the audio cache, saving {decode_time_saved:.1f}s of decoding (see `audio_cache.py report` for the whole pipeline).")
+        audio_cache.close()
+    print(f"-> Transcribed {total_audio_duration / 3600:.2f} audio hours in {total_time / 3600:.2f} hours ({total_audio_duration / max(total_time, 1e-9):.1f} audio-hours/hour, {args.workers} workers).")
+    finish_metrics()
     print("Done.")
 
 
@@ -117,4 +267,5 @@ def main():
     return
 
 if __name__ == '__main__':
-    main()
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,364 @@
+import os
+import json
+import time
+import wave
+import random
+import hashlib
+import threading
+from datetime import date, timedelta
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+
+from audio_chunking import SAMPLE_RATE
+
+
+## -- SYNTHETIC PROGRAMME + LISTING HTML ----
+## -- pages carry every section the parsers read (with the same optional sections missing as on the real site),
+## -- padded with navigation/script boilerplate so page size and parse cost are close to real BBC pages
+
+PROGRAMME_ID_TEMPLATE = "p{index:07d}"
+
+_WORDS = (
+    "philosophy history science religion culture empire poetry novel revolution theory mathematics physics "
+    "medieval ancient modern enlightenment renaissance war kingdom dynasty discovery evolution economics"
+).split()
+
+
+def get_programme_id(index: int) -> str:
+    return PROGRAMME_ID_TEMPLATE.format(index=index)
+
+
+def _get_sentence(rng: random.Random, num_words: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(num_words)).capitalize() + "."
+
+
+def _get_boilerplate(rng: random.Random, size_kb: int) -> str:
+    parts = []
+    size = 0
+    while size < size_kb * 1024:
+        part = (
+            f'<li class="nav__item"><a href="/programmes/{get_programme_id(rng.randrange(10_000))}" class="nav__link">{_get_sentence(rng, 3)}</a></li>'
+            f'<script type="text/javascript">window.__data_{rng.randrange(10**6)} = {{"id": {rng.randrange(10**6)}, "label": "{_get_sentence(rng, 4)}"}};</script>'
+        )
+        parts.append(part)
+        size += len(part)
+    return f'<nav class="nav"><ul>{"".join(parts)}</ul></nav>'
+
+
+def generate_programme_html(index: int, audio_url_prefix: str = "//open.live.bbc.co.uk/mediaselector/download", seed: int = 0, boilerplate_kb: int = 60) -> str:
+    rng = random.Random(seed * 1_000_003 + index)
+    programme_id = get_programme_id(index)
+
+    # NOTE: like the real site, newer episodes have no download button and older ones have no credits
+    download_button = f'<div class="buttons__download"><a href="{audio_url_prefix}/{programme_id}.mp3">Download</a></div>' if rng.random() < 0.9 else ""
+    credits = ""
+    if rng.random() < 0.7:
+        rows = "".join(f"<tr><td>{role}</td><td> {_get_sentence(rng, 2)} </td></tr>" for role in ("Presenter", "Producer", "Interviewed Guest", "Interviewed Guest"))
+        credits = f'<div id="credits"><table><tbody>{rows}</tbody></table></div>'
+    collections = ""
+    if rng.random() < 0.5:
+        items = "".join(f'<li><span class="programme__title">{_get_sentence(rng, 2)}</span><p class="programme__synopsis">{_get_sentence(rng, 8)}</p></li>' for _ in range(rng.randint(1, 3)))
+        collections = f'<div id="collections"><ul>{items}</ul></div>'
+    related_links = ""
+    if rng.random() < 0.5:
+        items = "".join(f'<li><a href="https://www.example.com/{programme_id}/{i}">{_get_sentence(rng, 3)}</a></li>' for i in range(rng.randint(1, 5)))
+        related_links = f'<div id="related_links"><ul>{items}</ul></div>'
+    broadcasts = "".join(
+        f'<div class="broadcast-event__time"><span>Thu {rng.randint(1, 28)} Dec {rng.randint(1998, 2024)}</span><span>{rng.choice(["09:00", "21:30"])}</span></div>'
+        for _ in range(rng.randint(1, 4))
+    )
+    long_description = "".join(f"<p>{_get_sentence(rng, rng.randint(10, 40))}</p>" for _ in range(rng.randint(2, 6)))
+
+    return f'''<!DOCTYPE html>
+<html lang="en"><head><title>{programme_id}</title></head><body>
+{_get_boilerplate(rng, boilerplate_kb)}
+<div class="island"><h1 class="no-margin"> {_get_sentence(rng, 3)} </h1></div>
+<div class="map__intro"><p>BBC Radio 4</p><p>{rng.choice(["43 minutes", "45 minutes", "1 hour"])}</p></div>
+<div class="synopsis-toggle__short"><p>{_get_sentence(rng, 15)}</p></div>
+<div class="synopsis-toggle__long">{long_description}<script>var toggle = true;</script></div>
+{download_button}
+<img class="image lazy" src="https://ichef.bbci.co.uk/images/ic/480x270/{programme_id}.jpg"/>
+<div id="broadcasts">{broadcasts}</div>
+{credits}{collections}{related_links}
+</body></html>'''
+
+
+def generate_listing_html(page_num: int, programme_urls: list[str], max_page: int) -> str:
+    programmes = "".join(
+        f'<div class="programme"><h2 class="programme__titles"><a href="{url}"><span>{os.path.basename(url)}</span></a></h2></div>'
+        for url in programme_urls
+    )
+    return f'''<!DOCTYPE html>
+<html lang="en"><body>
+{programmes}
+<ul class="pagination"><li class="pagination__page">{page_num}</li><li class="pagination__page--last">{max_page}</li></ul>
+</body></html>'''
+
+
+def write_programme_html_files(output_dir: str, num_pages: int, seed: int = 0, boilerplate_kb: int = 60) -> list[str]:
+    os.makedirs(output_dir, exist_ok=True)
+    filepaths = []
+    for index in range(num_pages):
+        filepath = os.path.join(output_dir, f"{get_programme_id(index)}.html")
+        with open(filepath, mode="w") as outfile:
+            outfile.write(generate_programme_html(index, seed=seed, boilerplate_kb=boilerplate_kb))
+        filepaths.append(filepath)
+    return filepaths
+
+
+## -- SYNTHETIC PROGRAMME DATA ----
+## -- rows matching `PROGRAMME_SCHEMA` directly (no html), so query benchmarks can use many more programmes than exist
+
+CONTRIBUTOR_NAMES = [f"{first} {last}" for first in ("Melvyn", "Anna", "David", "Helen", "Simon", "Rebecca", "John", "Mary") for last in ("Bragg", "Smith", "Jones", "Taylor", "Brown", "Wilson", "Evans", "Clarke")]
+COLLECTION_TITLES = ["History", "Science", "Philosophy", "Religion", "Culture", "Mathematics"]
+
+
+def write_programme_data_parquet(filepath: str, num_programmes: int, seed: int = 0, row_group_size: int = 1_000) -> str:
+    import polars as pl
+    from programme_schema import PROGRAMME_SCHEMA
+
+    rng = random.Random(seed)
+    rows = []
+    for index in range(num_programmes):
+        first_broadcast = date(1998, 10, 15) + timedelta(days=7 * (index % 1_400))
+        num_repeats = rng.choice([0, 0, 1, 2])
+        duration_seconds = rng.choice([2580, 2640, 2700, 3000, 3600])
+        rows.append({
+            "programme_id": get_programme_id(index),
+            "title": _get_sentence(rng, 4),
+            "duration": f"{duration_seconds // 60} minutes",
+            "duration_seconds": duration_seconds,
+            "short_description": _get_sentence(rng, 15),
+            "long_description": " ".join(_get_sentence(rng, 20) for _ in range(10)),
+            "audio_url": f"https://open.live.bbc.co.uk/mediaselector/download/{get_programme_id(index)}.mp3" if rng.random() < 0.9 else None,
+            "photo_url": f"https://ichef.bbci.co.uk/images/{get_programme_id(index)}.jpg",
+            "previous_broadcasts": [
+                {"date": first_broadcast + timedelta(days=rng.randrange(30, 3_000) * repeat), "time": "21:30"}
+                for repeat in range(num_repeats + 1)
+            ],
+            "credits": [{"role": "Presenter", "name": "Melvyn Bragg"}] + [
+                {"role": "Interviewed Guest", "name": rng.choice(CONTRIBUTOR_NAMES)} for _ in range(3)
+            ] if rng.random() < 0.7 else None,
+            "featured_collections": [{"title": rng.choice(COLLECTION_TITLES), "description": _get_sentence(rng, 6)}] if rng.random() < 0.5 else None,
+            "related_links": [{"title": _get_sentence(rng, 3), "url": f"https://example.org/{index}/{link}"} for link in range(rng.randrange(4))] or None,
+        })
+
+    pl.DataFrame(rows, schema=PROGRAMME_SCHEMA, strict=True).write_parquet(filepath, row_group_size=row_group_size)
+    return filepath
+
+
+## -- SYNTHETIC TRANSCRIPTIONS ----
+## -- whisper-style json files, as written by `batch_transcribe.py`
+
+def generate_transcription(num_segments: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    segments = []
+    start = 0.0
+    for index in range(num_segments):
+        end = start + rng.uniform(2.0, 8.0)
+        segments.append({
+            "id": index,
+            "seek": int(start * 100),
+            "start": round(start, 2),
+            "end": round(end, 2),
+            "text": " " + " ".join(_get_sentence(rng, rng.randrange(6, 20)) for _ in range(2)),
+            "tokens": [rng.randrange(50_000) for _ in range(20)],
+            "temperature": 0.0,
+            "avg_logprob": -rng.random(),
+            "compression_ratio": 1.5,
+            "no_speech_prob": rng.random() / 10,
+        })
+        start = end
+    return {"text": "".join(segment["text"] for segment in segments), "segments": segments, "language": "en"}
+
+
+def write_transcription_files(output_dir: str, num_episodes: int, num_segments: int = 400, seed: int = 0) -> list[str]:
+    os.makedirs(output_dir, exist_ok=True)
+    filepaths = []
+    for index in range(num_episodes):
+        filepath = os.path.join(output_dir, f"{get_programme_id(index)}.json")
+        with open(filepath, mode="w") as outfile:
+            json.dump(generate_transcription(num_segments, seed=seed * 1_000_003 + index), outfile)
+        filepaths.append(filepath)
+    return filepaths
+
+
+## -- SYNTHETIC AUDIO ----
+
+def generate_speech_like_audio(duration_s: float, seed: int = 0) -> np.ndarray:
+    """16kHz mono float32: bursts of modulated tones ('utterances') separated by short, quiet pauses, so the
+    silence-based chunking has realistic split points."""
+    rng = np.random.default_rng(seed)
+    audio = np.zeros(int(duration_s * SAMPLE_RATE), dtype=np.float32)
+    position = 0
+    while position < len(audio):
+        utterance_length = int(rng.uniform(1.0, 6.0) * SAMPLE_RATE)
+        t = np.arange(min(utterance_length, len(audio) - position)) / SAMPLE_RATE
+        pitch = rng.uniform(90, 250)
+        envelope = 0.5 * (1 + np.sin(2 * np.pi * rng.uniform(2, 6) * t))
+        audio[position:position + len(t)] = 0.3 * envelope * np.sin(2 * np.pi * pitch * t) + 0.02 * rng.standard_normal(len(t))
+        position += len(t) + int(rng.uniform(0.3, 1.2) * SAMPLE_RATE)
+    return audio
+
+
+def write_wav_file(filepath: str, audio: np.ndarray) -> str:
+    pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+    with wave.open(filepath, mode="wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(SAMPLE_RATE)
+        wav_file.writeframes(pcm.tobytes())
+    return filepath
+
+
+def write_audio_files(output_dir: str, num_files: int, duration_s: float, seed: int = 0) -> list[str]:
+    os.makedirs(output_dir, exist_ok=True)
+    return [
+        write_wav_file(os.path.join(output_dir, f"{get_programme_id(index)}.wav"), generate_speech_like_audio(duration_s, seed=seed + index))
+        for index in range(num_files)
+    ]
+
+
+## -- LOCAL BBC SITE ----
+## -- serves listing pages, programme pages (with ETag revalidation) and mp3s (with Range requests) on localhost,
+## -- with a fixed per-request latency and a fraction of requests failing with 503s. with `drop_audio_after`, full
+## -- (non-range) mp3 responses are cut off after that many bytes, as if the connection dropped mid-download.
+## -- listing pages in `failing_listing_pages` always fail with a 500
+
+class FakeBBCServer:
+
+    def __init__(self, num_pages: int = 5, programmes_per_page: int = 10, latency: float = 0.02, error_rate: float = 0.0, mp3_size: int = 1_000_000, seed: int = 0, boilerplate_kb: int = 60, drop_audio_after: int | None = None, failing_listing_pages: tuple[int, ...] = ()):
+        assert 0.0 <= error_rate < 1.0, f"Input '{error_rate}' for argument `error_rate` must be in [0, 1)."
+        self.num_pages = num_pages
+        self.programmes_per_page = programmes_per_page
+        self.latency = latency
+        self.error_rate = error_rate
+        self.drop_audio_after = drop_audio_after
+        self.failing_listing_pages = failing_listing_pages
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.num_requests = 0
+        self.num_errors = 0
+        self.num_range_requests = 0
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.listing_url_template = f"{self.base_url}/programmes/b006qykl/episodes/player?page={{page_num}}"
+
+        num_programmes = num_pages * programmes_per_page
+        self.programme_html = {
+            get_programme_id(index): generate_programme_html(index, audio_url_prefix=f"//{urlparse(self.base_url).netloc}/audio", seed=seed, boilerplate_kb=boilerplate_kb).encode("utf-8")
+            for index in range(num_programmes)
+        }
+        self.mp3 = np.random.default_rng(seed).integers(0, 256, size=mp3_size, dtype=np.uint8).tobytes()
+        self.thread: threading.Thread | None = None
+
+    @property
+    def programme_urls(self) -> list[str]:
+        return [f"{self.base_url}/programmes/{programme_id}" for programme_id in self.programme_html]
+
+    @property
+    def audio_urls(self) -> list[str]:
+        # NOTE: the pages' download links are protocol-relative and `programme.get_download_url` makes them https;
+        # this server is plain http, so benchmarks fetch audio from these urls instead
+        return [f"{self.base_url}/audio/{programme_id}.mp3" for programme_id in self.programme_html]
+
+    def get_listing_urls(self) -> list[str]:
+        return [self.listing_url_template.format(page_num=page_num) for page_num in range(1, self.num_pages + 1)]
+
+    def _should_fail(self) -> bool:
+        with self.rng_lock:
+            self.num_requests += 1
+            failed = self.rng.random() < self.error_rate
+            self.num_errors += failed
+            return failed
+
+    def _make_handler(self) -> type[BaseHTTPRequestHandler]:
+        site = self
+
+        class BBCRequestHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # <- keep-alive, like the real site
+            wbufsize = -1                  # <- headers + body in one write
+            disable_nagle_algorithm = True # <- otherwise each response's last segment waits on the client's delayed ack
+
+            def _send(self, status: int, body: bytes = b"", headers: dict[str, str] = {}) -> None:
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                self.wfile.flush()
+
+            def _send_truncated(self, status: int, body: bytes, num_bytes: int, headers: dict[str, str] = {}) -> None:
+                # headers announce the whole body, then the connection closes part-way through it
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body[:num_bytes])
+                self.wfile.flush()
+                self.close_connection = True
+
+            def do_GET(self):
+                time.sleep(site.latency)
+                if site._should_fail():
+                    return self._send(503, headers={"Retry-After": "0"})
+
+                url = urlparse(self.path)
+                if url.path.endswith("/episodes/player"):
+                    page_num = int(parse_qs(url.query).get("page", ["1"])[0])
+                    if page_num in site.failing_listing_pages:
+                        return self._send(500)
+                    programme_urls = []
+                    if 1 <= page_num <= site.num_pages:
+                        programme_urls = site.programme_urls[(page_num - 1) * site.programmes_per_page:page_num * site.programmes_per_page]
+                    return self._send(200, generate_listing_html(page_num, programme_urls, site.num_pages).encode("utf-8"), {"Content-Type": "text/html; charset=utf-8"})
+
+                if url.path.startswith("/programmes/"):
+                    body = site.programme_html.get(os.path.basename(url.path))
+                    if body is None:
+                        return self._send(404)
+                    etag = f'"{hashlib.md5(body).hexdigest()}"'
+                    if self.headers.get("If-None-Match") == etag:
+                        return self._send(304, headers={"ETag": etag})
+                    return self._send(200, body, {"ETag": etag, "Content-Type": "text/html; charset=utf-8"})
+
+                if url.path.startswith("/audio/"):
+                    range_header = self.headers.get("Range")
+                    if range_header is not None and range_header.startswith("bytes="):
+                        with site.rng_lock:
+                            site.num_range_requests += 1
+                        start = int(range_header.removeprefix("bytes=").split("-")[0])
+                        if start >= len(site.mp3):
+                            return self._send(416, headers={"Content-Range": f"bytes */{len(site.mp3)}"})
+                        return self._send(206, site.mp3[start:], {"Content-Range": f"bytes {start}-{len(site.mp3) - 1}/{len(site.mp3)}", "Content-Type": "audio/mpeg"})
+                    if site.drop_audio_after is not None:
+                        return self._send_truncated(200, site.mp3, site.drop_audio_after, {"Content-Type": "audio/mpeg"})
+                    return self._send(200, site.mp3, {"Content-Type": "audio/mpeg"})
+
+                self._send(404)
+
+            def log_message(self, format, *args):
+                pass
+
+        return BBCRequestHandler
+
+    def start(self) -> "FakeBBCServer":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "FakeBBCServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,566 @@
+import os
+import sys
+import json
+import random
+import shutil
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from typing import Callable, TypedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from timeit import default_timer as timer
+
+from utils import DEFAULT_HEADERS, SESSION_CONFIG, crawl_urls, configure_session, http_get
+from listings import collect_listed_programme_urls_from_single_page
+from collect_programme_html import fetch_programme_page
+from fetch_metadata import FetchMetadataStore
+from html_archive import HtmlArchive, import_html_files, get_directory_footprint
+from programme_parsers import PARSER_BACKENDS, get_parser_backend
+from download_audio_files import download_mp3_files
+from audio_manifest import AudioFile, AudioManifest, inspect_audio_file, verify_audio_files
+from audio_chunking import decode_audio
+from transcription import create_transcription_job, run_transcription_jobs, run_chunked_transcription_jobs
+from cli import COMMANDS
+from transcript_store import TranscriptStore, convert_transcription_dir, get_index_filepath
+from search_index import SearchIndex
+from programme_queries import write_exploded_tables, get_audio_urls, episodes_by_contributor, episodes_by_year, episodes_in_collection, duration_stats
+
+from benchmarks.fixtures import FakeBBCServer, write_programme_html_files, write_audio_files, write_programme_data_parquet, write_transcription_files
+
+## -- usage (from the repo root): python -m benchmarks.run [--only parse_lxml listings ...] [--compare]
+## -- every run is appended to `benchmarks/results.jsonl` under the current commit; commit that file with your change
+
+RESULTS_JSONL = os.path.join(os.path.dirname(__file__), "results.jsonl")
+CLI_PY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cli.py")
+
+parser = argparse.ArgumentParser(description="Throughput benchmarks for each pipeline stage, against synthetic fixtures and a local stand-in for the BBC site.")
+parser.add_argument("--only", type=str, nargs="+", default=None, help="Only run these benchmarks.")
+parser.add_argument("--repeat", type=int, default=3, help="Timed runs per benchmark; the median is recorded.")
+parser.add_argument("--num-pages", type=int, default=200, help="Programme html pages to parse.")
+parser.add_argument("--listing-pages", type=int, default=5, help="Listing pages served by the local site.")
+parser.add_argument("--programmes-per-page", type=int, default=10)
+parser.add_argument("--latency", type=float, default=0.02, help="Seconds the local site waits before answering each request.")
+parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests the local site fails with a 503 (retried by the session).")
+parser.add_argument("--mp3-size", type=int, default=1_000_000, help="Bytes per mp3 served by the local site.")
+parser.add_argument("--concurrency", type=int, default=8)
+parser.add_argument("--num-audio-files", type=int, default=4)
+parser.add_argument("--audio-duration", type=float, default=120.0, help="Seconds of audio per synthetic file.")
+parser.add_argument("--transcription-workers", type=int, default=2)
+parser.add_argument("--num-transcripts", type=int, default=100, help="Synthetic transcriptions for the transcript store and search index benchmarks.")
+parser.add_argument("--segments-per-transcript", type=int, default=400)
+parser.add_argument("--num-programmes", type=int, default=10_000, help="Rows in the synthetic programme data queried by the query benchmarks.")
+parser.add_argument("--results-file", type=str, default=RESULTS_JSONL)
+parser.add_argument("--no-record", action="store_true", help="Don't append this run to the results file.")
+parser.add_argument("--compare", action="store_true", help="Compare with the latest recorded run from another commit; exits non-zero on a regression.")
+parser.add_argument("--threshold", type=float, default=0.1, help="Relative throughput drop counted as a regression.")
+
+
+@dataclass
+class BenchmarkContext:
+    args: argparse.Namespace
+    work_dir: str
+    server: FakeBBCServer
+    html_dir: str
+    html_pages: list[str]
+    archive_dir: str
+    audio_files: list[str]
+    audio_manifest: str
+    programme_data: str
+    transcripts_dir: str
+    transcript_store: str
+    search_index: str
+
+    def make_output_dir(self, name: str) -> str:
+        """Fresh, empty directory for one timed run."""
+        output_dir = os.path.join(self.work_dir, name)
+        shutil.rmtree(output_dir, ignore_errors=True)
+        os.makedirs(output_dir)
+        return output_dir
+
+
+class BenchmarkResult(TypedDict):
+    items: int
+    times: list[float]
+    median: float
+    min: float
+    items_per_second: float
+
+
+## -- BENCHMARKS ----
+## -- each returns the number of items it processed; setup that shouldn't be timed lives in `BenchmarkContext`
+
+def _make_parse_benchmark(parser_name: str) -> Callable[[BenchmarkContext], int]:
+    def bench_parse(context: BenchmarkContext) -> int:
+        backend = get_parser_backend(parser_name)
+        for html in context.html_pages:
+            backend.parse(html)
+        return len(context.html_pages)
+    return bench_parse
+
+
+def bench_listings(context: BenchmarkContext) -> int:
+    listing_urls = context.server.get_listing_urls()
+    results = crawl_urls(collect_listed_programme_urls_from_single_page, listing_urls, max_concurrency=context.args.concurrency, requests_per_second=1_000.0, return_exceptions=False)
+    assert sum(len(programme_urls) for programme_urls in results) == len(context.server.programme_urls)
+    return len(listing_urls)
+
+
+## -- HTTP SESSION ----
+## -- programme pages fetched one after another through the pooled keep-alive session, and with a new connection per
+## -- request (plain `requests.get`, as every fetcher did before `utils.http_get`)
+
+def bench_http_session(context: BenchmarkContext) -> int:
+    for url in context.server.programme_urls:
+        http_get(url)
+    return len(context.server.programme_urls)
+
+
+def bench_http_new_connections(context: BenchmarkContext) -> int:
+    import requests
+    for url in context.server.programme_urls:
+        requests.get(url, headers=DEFAULT_HEADERS, timeout=SESSION_CONFIG.timeout)
+    return len(context.server.programme_urls)
+
+
+def bench_programme_html(context: BenchmarkContext) -> int:
+    output_dir = context.make_output_dir("programme_html")
+    fetch_metadata = FetchMetadataStore(os.path.join(output_dir, "fetch_metadata.sqlite"))
+    archive = HtmlArchive(os.path.join(output_dir, "archive"))
+    run_id = fetch_metadata.start_run()
+    for url in context.server.programme_urls:
+        fetch_programme_page(url, fetch_metadata, run_id, archive)
+    archive.close()
+    fetch_metadata.close()
+    return len(context.server.programme_urls)
+
+
+def bench_html_files_read(context: BenchmarkContext) -> int:
+    files = os.listdir(context.html_dir)
+    for file in files:
+        with open(os.path.join(context.html_dir, file), mode="r") as infile:
+            infile.read()
+    return len(files)
+
+
+def bench_html_archive_read(context: BenchmarkContext) -> int:
+    archive = HtmlArchive(context.archive_dir, readonly=True)
+    num_pages = sum(1 for _ in archive.iter_pages())
+    archive.close()
+    return num_pages
+
+
+def bench_html_archive_random_read(context: BenchmarkContext) -> int:
+    archive = HtmlArchive(context.archive_dir, readonly=True)
+    programme_ids = archive.programme_ids()
+    random.Random(0).shuffle(programme_ids)
+    for programme_id in programme_ids:
+        archive.get(programme_id)
+    archive.close()
+    return len(programme_ids)
+
+
+def bench_audio_download(context: BenchmarkContext) -> int:
+    output_dir = context.make_output_dir("audio_download")
+    errors = download_mp3_files(context.server.audio_urls, output_dir, workers=context.args.concurrency, requests_per_second=None)
+    assert not errors, f"{len(errors)} downloads failed: {next(iter(errors.values()))}"
+    return len(context.server.audio_urls)
+
+
+def bench_audio_download_manifest(context: BenchmarkContext) -> int:
+    output_dir = context.make_output_dir("audio_download_manifest")
+    manifest = AudioManifest(os.path.join(output_dir, "audio_manifest.sqlite"))
+    errors = download_mp3_files(context.server.audio_urls, output_dir, workers=context.args.concurrency, requests_per_second=None, manifest=manifest)
+    assert not errors, f"{len(errors)} downloads failed: {next(iter(errors.values()))}"
+    # the local site serves the same bytes for every url, so they should all be stored in one file
+    summary = manifest.summary()
+    assert summary["num_urls"] == len(context.server.audio_urls) and summary["num_files"] == 1, f"Expected {len(context.server.audio_urls)} urls in 1 file, got {summary}."
+    assert all(manifest.is_stored(url, output_dir) for url in context.server.audio_urls), "Downloaded urls would be fetched again on a re-run."
+    manifest.close()
+    return len(context.server.audio_urls)
+
+
+def bench_audio_verify(context: BenchmarkContext) -> int:
+    manifest = AudioManifest(context.audio_manifest)
+    problems = verify_audio_files(manifest, os.path.dirname(context.audio_files[0]))
+    manifest.close()
+    assert not problems, f"{len(problems)} files failed verification: {problems}"
+    return len(context.audio_files)
+
+
+def bench_audio_decode(context: BenchmarkContext) -> int:
+    for filepath in context.audio_files:
+        decode_audio(filepath)
+    return len(context.audio_files)
+
+
+def bench_transcription(context: BenchmarkContext) -> int:
+    output_dir = context.make_output_dir("transcription")
+    jobs = [create_transcription_job(os.path.splitext(os.path.basename(filepath))[0], filepath) for filepath in context.audio_files]
+    results = list(run_transcription_jobs(jobs, output_dir, backend_name="fake", workers=context.args.transcription_workers))
+    assert all(result["error"] is None for result in results)
+    return len(results)
+
+
+def bench_chunked_transcription(context: BenchmarkContext) -> int:
+    output_dir = context.make_output_dir("chunked_transcription")
+    jobs = [create_transcription_job(os.path.splitext(os.path.basename(filepath))[0], filepath) for filepath in context.audio_files]
+    results = list(run_chunked_transcription_jobs(jobs, output_dir, backend_name="fake", workers=context.args.transcription_workers, max_chunk_s=30.0))
+    assert all(result["error"] is None for result in results)
+    return len(results)
+
+
+## -- CLI STARTUP ----
+## -- `--help`, `status` and `--dry-run` never touch pages, parquet or audio (tests/test_cli_startup.py checks they don't import the libraries that do)
+
+def bench_cli_startup(context: BenchmarkContext) -> int:
+    output_dir = context.make_output_dir("cli_startup")
+    audio_dir = os.path.dirname(context.audio_files[0])
+    commands = [
+        ["--help"],
+        *([name, "--help"] for name in COMMANDS),
+        ["status", "--data-dir", output_dir],
+        ["transcribe", "--audio-dir", audio_dir, "-o", output_dir, "--backfill", "--dry-run"],
+    ]
+    for argv in commands:
+        process = subprocess.run([sys.executable, CLI_PY, *argv], cwd=output_dir, capture_output=True, text=True)
+        assert process.returncode == 0, f"`cli.py {' '.join(argv)}` failed:\n{process.stderr}"
+    return len(commands)
+
+
+## -- TRANSCRIPTS ----
+## -- every episode's segments, read from the per-episode whisper json files and from the consolidated transcript store
+
+TRANSCRIPT_BENCHMARKS = {"transcripts_json_read", "transcript_store_read"}
+
+
+def bench_transcripts_json_read(context: BenchmarkContext) -> int:
+    files = sorted(file for file in os.listdir(context.transcripts_dir) if file.endswith(".json"))
+    for file in files:
+        with open(os.path.join(context.transcripts_dir, file), mode="r") as infile:
+            json.load(infile)
+    return len(files)
+
+
+def bench_transcript_store_read(context: BenchmarkContext) -> int:
+    store = TranscriptStore(context.transcript_store)
+    episode_ids = store.episode_ids()
+    for episode_id in episode_ids:
+        store.get_segments(episode_id)
+    return len(episode_ids)
+
+
+## -- SEARCH INDEX ----
+
+SEARCH_QUERIES = ["philosophy", "ancient empire", "science revolution", "medieval poetry", "mathematics", "dynasty war"]
+SEARCH_BENCHMARKS = {"search_index_build", "search_index_update", "search_index_query"}
+
+
+def bench_search_index_build(context: BenchmarkContext) -> int:
+    output_dir = context.make_output_dir("search_index_build")
+    search_index = SearchIndex(os.path.join(output_dir, "search_index.sqlite"))
+    num_indexed = search_index.index_transcripts(TranscriptStore(context.transcript_store))
+    search_index.close()
+    return num_indexed
+
+
+def bench_search_index_update(context: BenchmarkContext) -> int:
+    # every transcript changed since the index was built: each one's old documents are deleted and replaced
+    output_dir = context.make_output_dir("search_index_update")
+    index_filepath = os.path.join(output_dir, "search_index.sqlite")
+    shutil.copy(context.search_index, index_filepath)
+    search_index = SearchIndex(index_filepath)
+    with search_index.conn:
+        search_index.conn.execute("UPDATE indexed_sources SET content_hash = ''")
+    num_indexed = search_index.index_transcripts(TranscriptStore(context.transcript_store))
+    search_index.close()
+    return num_indexed
+
+
+def bench_search_index_query(context: BenchmarkContext) -> int:
+    search_index = SearchIndex(context.search_index)
+    num_queries = 0
+    for _ in range(2):
+        for query in SEARCH_QUERIES:
+            assert search_index.search(query, limit=10), f"No hits for '{query}'."
+            search_index.search(query, limit=10, phrase=True)
+            num_queries += 2
+    search_index.close()
+    return num_queries
+
+
+## -- PROGRAMME DATA QUERIES ----
+## -- typical downstream queries, run eagerly (read the whole parquet file, then explode nested lists, as downstream code
+## -- did) and lazily through `programme_queries`. peak memory of each is measured once, in a fresh process
+
+def run_eager_queries(programme_data_path: str) -> int:
+    import polars as pl
+
+    audio_urls = pl.read_parquet(programme_data_path).select(pl.col("audio_url")).to_series().to_list()
+
+    programmes = pl.read_parquet(programme_data_path)
+    credits = programmes.select("programme_id", "credits").explode("credits").drop_nulls("credits").unnest("credits")
+    by_contributor = programmes.join(credits.filter(pl.col("name").str.to_lowercase().str.contains("clarke", literal=True)), on="programme_id")
+
+    programmes = pl.read_parquet(programme_data_path)
+    broadcasts = programmes.select("programme_id", "previous_broadcasts").explode("previous_broadcasts").drop_nulls("previous_broadcasts").unnest("previous_broadcasts")
+    first_broadcasts = broadcasts.group_by("programme_id").agg(year=pl.col("date").min().dt.year())
+    by_year = programmes.join(first_broadcasts.filter(pl.col("year") == 2005), on="programme_id", how="semi")
+
+    programmes = pl.read_parquet(programme_data_path)
+    in_collection = programmes.filter(
+        pl.col("featured_collections").list.eval(pl.element().struct.field("title").str.to_lowercase().str.contains("philosophy", literal=True)).list.any().fill_null(False)
+    )
+
+    programmes = pl.read_parquet(programme_data_path)
+    durations = programmes.join(first_broadcasts, on="programme_id").group_by("year").agg(mean=pl.col("duration_seconds").mean(), max=pl.col("duration_seconds").max())
+
+    assert audio_urls and len(by_contributor) and len(by_year) and len(in_collection) and len(durations)
+    return 5
+
+
+def run_lazy_queries(programme_data_path: str) -> int:
+    audio_urls = get_audio_urls(programme_data_path).collect()["audio_url"].to_list()
+    by_contributor = episodes_by_contributor("clarke", programme_data_path=programme_data_path).collect()
+    by_year = episodes_by_year(2005, programme_data_path=programme_data_path).collect()
+    in_collection = episodes_in_collection("philosophy", programme_data_path=programme_data_path).collect()
+    durations = duration_stats(by_year=True, programme_data_path=programme_data_path).collect()
+
+    assert audio_urls and len(by_contributor) and len(by_year) and len(in_collection) and len(durations)
+    return 5
+
+
+QUERY_RUNNERS = {"queries_eager": run_eager_queries, "queries_lazy": run_lazy_queries}
+
+# VmHWM (peak RSS) rather than `ru_maxrss`, which linux carries over from the parent across exec
+_PEAK_MEMORY_SCRIPT = """
+import sys
+from benchmarks.run import QUERY_RUNNERS
+def get_peak_rss_kb():
+    with open("/proc/self/status") as infile:
+        return int(infile.read().split("VmHWM:")[1].split()[0])
+baseline = get_peak_rss_kb()
+QUERY_RUNNERS[sys.argv[1]](sys.argv[2])
+print(get_peak_rss_kb() - baseline)
+"""
+
+
+def get_query_peak_memory(name: str, programme_data_path: str) -> float:
+    """Growth in peak RSS (MB) while running one set of queries, after imports, in a fresh process."""
+    process = subprocess.run([sys.executable, "-c", _PEAK_MEMORY_SCRIPT, name, programme_data_path], cwd=os.path.dirname(CLI_PY), capture_output=True, text=True)
+    assert process.returncode == 0, f"Measuring memory of '{name}' failed:\n{process.stderr}"
+    return int(process.stdout.strip()) / 1024
+
+
+def bench_queries_eager(context: BenchmarkContext) -> int:
+    return run_eager_queries(context.programme_data)
+
+
+def bench_queries_lazy(context: BenchmarkContext) -> int:
+    return run_lazy_queries(context.programme_data)
+
+
+BENCHMARKS: dict[str, Callable[[BenchmarkContext], int]] = {
+    **{f"parse_{parser_name}": _make_parse_benchmark(parser_name) for parser_name in PARSER_BACKENDS},
+    "listings": bench_listings,
+    "http_session": bench_http_session,
+    "http_new_connections": bench_http_new_connections,
+    "programme_html": bench_programme_html,
+    "html_files_read": bench_html_files_read,
+    "html_archive_read": bench_html_archive_read,
+    "html_archive_random_read": bench_html_archive_random_read,
+    "audio_download": bench_audio_download,
+    "audio_download_manifest": bench_audio_download_manifest,
+    "audio_verify": bench_audio_verify,
+    "audio_decode": bench_audio_decode,
+    "transcription": bench_transcription,
+    "chunked_transcription": bench_chunked_transcription,
+    "transcripts_json_read": bench_transcripts_json_read,
+    "transcript_store_read": bench_transcript_store_read,
+    "search_index_build": bench_search_index_build,
+    "search_index_update": bench_search_index_update,
+    "search_index_query": bench_search_index_query,
+    "queries_eager": bench_queries_eager,
+    "queries_lazy": bench_queries_lazy,
+    "cli_startup": bench_cli_startup,
+}
+
+
+def run_benchmark(benchmark: Callable[[BenchmarkContext], int], context: BenchmarkContext, repeat: int) -> BenchmarkResult:
+    times = []
+    for _ in range(repeat):
+        start_time = timer()
+        num_items = benchmark(context)
+        times.append(timer() - start_time)
+    median = statistics.median(times)
+    return BenchmarkResult(items=num_items, times=times, median=median, min=min(times), items_per_second=num_items / median)
+
+
+## -- RESULTS PER COMMIT ----
+
+def get_git_commit() -> tuple[str | None, bool]:
+    """Current commit and whether the working tree has uncommitted changes."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True, check=True).stdout.strip()
+    except (FileNotFoundError, subprocess.CalledProcessError):
+        return None, False
+    return commit, bool(status)
+
+
+def read_results(filepath: str) -> list[dict]:
+    if not os.path.exists(filepath):
+        return []
+    with open(filepath, mode="r") as infile:
+        return [json.loads(line) for line in infile if line.strip()]
+
+
+def append_result(filepath: str, run: dict) -> None:
+    with open(filepath, mode="a") as outfile:
+        outfile.write(json.dumps(run) + "\n")
+
+
+def compare_runs(baseline: dict, run: dict, threshold: float) -> list[str]:
+    """Prints the throughput change for every benchmark in both runs. Returns the benchmarks that regressed by more than `threshold`."""
+    print(f"-> Comparing with {baseline['commit']}{' (dirty)' if baseline['dirty'] else ''} from {baseline['timestamp']}.")
+    regressions = []
+    for name, result in run["results"].items():
+        baseline_result = baseline["results"].get(name)
+        if baseline_result is None:
+            continue
+        change = result["items_per_second"] / baseline_result["items_per_second"] - 1
+        regressed = change < -threshold
+        print(f"{'!!' if regressed else '| '} {name:<24} {baseline_result['items_per_second']:>10,.2f} -> {result['items_per_second']:>10,.2f} items/s ({change:+.1%})")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    names = args.only or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    assert not unknown, f"Unknown benchmarks {unknown}. Available benchmarks: {list(BENCHMARKS)}."
+
+    # fast retries, so an `--error-rate` run measures retry overhead rather than backoff sleeps
+    configure_session(pool_size=args.concurrency, backoff_factor=0.01)
+
+    commit, dirty = get_git_commit()
+    print(f"-> Running {len(names)} benchmarks at {commit}{' (dirty)' if dirty else ''}, {args.repeat} repeats each.")
+
+    with tempfile.TemporaryDirectory(prefix="iot_benchmarks_") as work_dir, FakeBBCServer(
+        num_pages=args.listing_pages,
+        programmes_per_page=args.programmes_per_page,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        mp3_size=args.mp3_size
+    ) as server:
+        html_dir = os.path.join(work_dir, "html")
+        html_files = write_programme_html_files(html_dir, args.num_pages)
+        html_pages = []
+        for filepath in html_files:
+            with open(filepath, mode="r") as infile:
+                html_pages.append(infile.read())
+
+        archive_dir = os.path.join(work_dir, "html_archive")
+        archive = HtmlArchive(archive_dir)
+        import_html_files(archive, html_dir)
+        archive_summary = archive.summary()
+        archive.close()
+        num_files, num_bytes, num_allocated_bytes = get_directory_footprint(html_dir)
+        footprint = {
+            "html_files": {"num_files": num_files, "bytes": num_bytes, "allocated_bytes": num_allocated_bytes},
+            "html_archive": {"num_shards": archive_summary["num_shards"], "bytes": archive_summary["compressed_bytes"]},
+        }
+        print(
+            f"-> {num_files:,} loose html files: {num_bytes / 1e6:.1f} MB ({num_allocated_bytes / 1e6:.1f} MB allocated). "
+            f"Archived: {archive_summary['compressed_bytes'] / 1e6:.1f} MB in {archive_summary['num_shards']} shard(s)."
+        )
+
+        audio_files = write_audio_files(os.path.join(work_dir, "audio"), args.num_audio_files, args.audio_duration)
+        audio_manifest = os.path.join(work_dir, "audio_manifest.sqlite")
+        manifest = AudioManifest(audio_manifest)
+        for filepath in audio_files:
+            check = inspect_audio_file(filepath)
+            manifest.add(AudioFile(url=filepath, filename=os.path.basename(filepath), size=check["size"], sha256=check["sha256"], duration=check["duration"], downloaded_at="", verified_at=""))
+        manifest.close()
+
+        programme_data = os.path.join(work_dir, "programme_data.parquet")
+        if any(name in QUERY_RUNNERS for name in names):
+            write_programme_data_parquet(programme_data, args.num_programmes)
+            write_exploded_tables(programme_data)
+
+        transcripts_dir = os.path.join(work_dir, "transcriptions")
+        transcript_store = os.path.join(work_dir, "transcripts.arrow")
+        search_index_filepath = os.path.join(work_dir, "search_index.sqlite")
+        if any(name in TRANSCRIPT_BENCHMARKS | SEARCH_BENCHMARKS for name in names):
+            write_transcription_files(transcripts_dir, args.num_transcripts, args.segments_per_transcript)
+            convert_transcription_dir(transcripts_dir, transcript_store)
+            num_files, num_bytes, num_allocated_bytes = get_directory_footprint(transcripts_dir)
+            store_bytes = os.path.getsize(transcript_store) + os.path.getsize(get_index_filepath(transcript_store))
+            footprint["transcripts_json"] = {"num_files": num_files, "bytes": num_bytes, "allocated_bytes": num_allocated_bytes}
+            footprint["transcript_store"] = {"bytes": store_bytes}
+            print(f"-> {num_files:,} transcription json files: {num_bytes / 1e6:.1f} MB ({num_allocated_bytes / 1e6:.1f} MB allocated). Transcript store: {store_bytes / 1e6:.1f} MB.")
+        if any(name in SEARCH_BENCHMARKS for name in names):
+            search_index = SearchIndex(search_index_filepath)
+            search_index.index_transcripts(TranscriptStore(transcript_store))
+            search_index.close()
+
+        context = BenchmarkContext(
+            args=args,
+            work_dir=work_dir,
+            server=server,
+            html_dir=html_dir,
+            html_pages=html_pages,
+            archive_dir=archive_dir,
+            audio_files=audio_files,
+            audio_manifest=audio_manifest,
+            programme_data=programme_data,
+            transcripts_dir=transcripts_dir,
+            transcript_store=transcript_store,
+            search_index=search_index_filepath
+        )
+
+        results = {}
+        for name in names:
+            results[name] = run_benchmark(BENCHMARKS[name], context, args.repeat)
+            print(f"| {name:<24} {results[name]['items']:>6,} items | median {results[name]['median']:.3f}s | min {results[name]['min']:.3f}s | {results[name]['items_per_second']:,.2f} items/s")
+        peak_memory = {name: get_query_peak_memory(name, programme_data) for name in names if name in QUERY_RUNNERS}
+        for name, memory in peak_memory.items():
+            print(f"| {name:<24} peak memory +{memory:,.1f} MB")
+        if args.error_rate > 0:
+            print(f"-> Local site failed {server.num_errors:,} of {server.num_requests:,} requests.")
+
+    run = {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.node(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("only", "results_file", "no_record", "compare", "threshold")},
+        "footprint": footprint,
+        "peak_memory": peak_memory,
+        "results": results,
+    }
+
+    regressions = []
+    if args.compare:
+        # latest run of another commit on this machine; runs on other machines aren't comparable
+        baselines = [previous for previous in read_results(args.results_file) if previous["commit"] != commit and previous["machine"] == run["machine"]]
+        if baselines:
+            regressions = compare_runs(baselines[-1], run, args.threshold)
+        else:
+            print("-> No earlier commit recorded on this machine to compare with.")
+
+    if not args.no_record:
+        append_result(args.results_file, run)
+        print(f"-> Recorded results for {commit} in '{args.results_file}'.")
+
+    if regressions:
+        raise SystemExit(f"!! Throughput regressed by more than {args.threshold:.0%} for {regressions}.")
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    main()
@@ -0,0 +1,42 @@
+import argparse
+import importlib
+from typing import TypedDict
+
+
+## -- UNIFIED CLI ----
+## -- one entry point for every stage: `python cli.py <command> [args]`. each command's module (and the heavy libraries
+## -- it needs, e.g. polars, bs4, numpy, model backends) is only imported once that command runs, and the modules themselves
+## -- defer those imports until they're used, so `--help`, `--dry-run` and `status` return without loading them
+
+class Command(TypedDict):
+    module: str  # <- exposes a module-level `parser` and `main(args)`
+    help: str
+
+
+COMMANDS: dict[str, Command] = {
+    "listings": Command(module="listings", help="Crawl the listing pages for every programme url."),
+    "collect": Command(module="collect_programme_html", help="Download programme pages into the html archive."),
+    "parse": Command(module="parse_programmes", help="Parse archived programme pages into the programme data parquet file."),
+    "download": Command(module="download_audio_files", help="Download the mp3 of every parsed programme."),
+    "transcribe": Command(module="batch_transcribe", help="Transcribe a directory of audio files."),
+    "diarize": Command(module="diarize", help="Diarize a directory of audio files and label transcripts with speakers."),
+    "pipeline": Command(module="pipeline", help="Refresh the whole dataset in one streaming run."),
+    "status": Command(module="status", help="Summarise how far each stage of the dataset has got."),
+}
+
+parser = argparse.ArgumentParser(description="In Our Time dataset tools. Run `<command> --help` for a command's options.")
+subparsers = parser.add_subparsers(dest="command", required=True, metavar="<command>")
+for name, command in COMMANDS.items():
+    # a command's options are left for its own parser, so every command keeps one definition of its arguments
+    subparsers.add_parser(name, help=command["help"], add_help=False)
+
+
+def run_command(name: str, argv: list[str]) -> None:
+    module = importlib.import_module(COMMANDS[name]["module"])
+    module.parser.prog = f"{parser.prog} {name}"
+    module.main(module.parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    args, command_argv = parser.parse_known_args()
+    run_command(args.command, command_argv)
@@ -1,28 +1,69 @@
 import os
-import time
 import argparse
+from functools import partial
 
-import polars as pl
-
-from utils import get_html_from_url, save_html_to_file
+from utils import http_get, configure_session, get_host
+from work_queue import WorkQueue, ThreadLocalStore
+from fetch_metadata import FetchMetadataStore, get_content_hash
+from html_archive import HTML_ARCHIVE_DIR, HtmlArchive
+from metrics import METRICS, add_metrics_arguments, start_metrics, finish_metrics
 
 parser = argparse.ArgumentParser()
 
 parser.add_argument("--file", type=str, required=False, help="Path to csv file containing starting programme urls.")
 parser.add_argument("--url", type=str, required=False, help="URL for specific programme webpage.")
 parser.add_argument("--test", action="store_true", help="Flag for testing on small number of urls.")
-args = parser.parse_args()
+parser.add_argument("--force", action="store_true", help="Re-download every page, ignoring stored ETag/Last-Modified metadata.")
+parser.add_argument("--workers", type=int, default=1, help="Number of pages fetched in parallel.")
+parser.add_argument("--rate-limit", type=float, default=2.0, help="Maximum requests per second sent to each host, across all workers.")
+add_metrics_arguments(parser)
 
 ## set data directory
 DATA_DIR = "data"
-PROGRAMME_HTML_DIR = os.path.join(DATA_DIR, "programme_html")
+FETCH_METADATA_DB = os.path.join(DATA_DIR, "fetch_metadata.sqlite")
+
+
+def get_programme_id_from_url(url: str) -> str:
+    return os.path.basename(url)
+
 
-if not os.path.exists(PROGRAMME_HTML_DIR):
-    os.mkdir(PROGRAMME_HTML_DIR)
+def fetch_programme_page(url: str, fetch_metadata: FetchMetadataStore, run_id: int, archive: HtmlArchive, force: bool = False) -> tuple[str, bool]:
+    """Fetch one programme page, revalidating it with a conditional request if it's already archived.
+    Returns the programme id and whether a new or changed page was added to the archive."""
+    programme_id = get_programme_id_from_url(url)
 
+    # only revalidate pages that are already archived
+    if force or programme_id not in archive:
+        conditional_headers = {}
+    else:
+        conditional_headers = fetch_metadata.get_conditional_headers(url)
+
+    # an error page must not be archived in place of the programme page
+    resp = http_get(url, raise_for_status=True, headers=conditional_headers)
+    if resp.status_code == 304:
+        fetch_metadata.record_not_modified(url)
+        METRICS.increment("programme_html", "not_modified")
+        return programme_id, False
+
+    changed = fetch_metadata.record_fetch(
+        url,
+        content_hash=get_content_hash(resp.content),
+        run_id=run_id,
+        etag=resp.headers.get("ETag"),
+        last_modified=resp.headers.get("Last-Modified")
+    )
+    if (not changed and programme_id in archive) or not archive.put(programme_id, url, resp.content):
+        METRICS.increment("programme_html", "unchanged")
+        return programme_id, False
 
+    METRICS.increment("programme_html", "saved")
+    return programme_id, True
 
-def main():
+
+def main(args: argparse.Namespace):
+    import polars as pl  # <- slow to import; not needed for `--help`
+
+    start_metrics(args)
 
     ## load csv file containing all programme urls
     ## see `listings.py`
@@ -35,37 +76,50 @@ def main():
     if args.test:
         print(f"-> ---- [TEST MODE] ----")
 
-    print(f"-> Saving {len(programme_urls):,} episode webpages to '{HTML_OUTPUT_DIR}'.")
+    print(f"-> Saving {len(programme_urls):,} episode webpages to '{HTML_ARCHIVE_DIR}'.")
 
 
     if args.test:
         programme_urls = programme_urls[:5]
 
-    save_counter = 0
-    num_errors = 0
+    fetch_metadata = FetchMetadataStore(FETCH_METADATA_DB)
+    run_id = fetch_metadata.start_run()
+    fetch_metadata.close()
+    archive = HtmlArchive(HTML_ARCHIVE_DIR)
 
-    for url in programme_urls:
-        try:
-            html = get_html_from_url(url)
+    # sqlite connections can't be shared across threads, so each worker opens its own metadata store; the archive locks internally
+    worker_fetch_metadata = ThreadLocalStore(partial(FetchMetadataStore, FETCH_METADATA_DB))
 
-            # create programme filename
-            output_filepath = os.path.join(
-                PROGRAMME_HTML_DIR,
-                f"{os.path.basename(url)}.html"
-            )
-            save_html_to_file(html, filepath=output_filepath)
-            save_counter += 1
-            time.sleep(0.5)
+    def fetch_page(url: str) -> bool:
+        _, saved = fetch_programme_page(url, worker_fetch_metadata.get(), run_id, archive, force=args.force)
+        return saved
 
-        except Exception as e:
-            print(f"!! error downloading html for url '{url}'.")
-            print(e)
-            num_errors += 1
+    save_counter = 0
+    unchanged_counter = 0
+    num_errors = 0
 
-    print(f"-> Saved {save_counter:,} programme pages to file.\n-> {num_errors:,} errors.")
+    configure_session(pool_size=args.workers)
+    with WorkQueue(fetch_page, workers=args.workers, requests_per_second=args.rate_limit, rate_limit_key=get_host) as queue:
+        for result in queue.map(programme_urls):
+            if result["error"] is not None:
+                print(f"!! error downloading html for url '{result['item']}'.")
+                print(result["error"])
+                num_errors += 1
+                METRICS.increment("programme_html", "errors")
+                continue
+
+            if result["result"]:
+                save_counter += 1
+            else:
+                unchanged_counter += 1
+    archive.close()
+
+    print(f"-> [run {run_id}] Saved {save_counter:,} new or changed programme pages to the archive.\n-> {unchanged_counter:,} pages unchanged.\n-> {num_errors:,} errors.")
+    finish_metrics()
 
     return
 
 
 if __name__ == "__main__":
-    main()
+    args = parser.parse_args()
+    main(args)
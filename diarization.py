@@ -0,0 +1,235 @@
+from __future__ import annotations
+
+import os
+import heapq
+from typing import TYPE_CHECKING, Protocol, TypedDict, Iterator
+from collections import defaultdict
+from timeit import default_timer as timer
+
+from transcription import get_audio_duration
+from metrics import METRICS
+
+if TYPE_CHECKING:
+    import numpy as np
+    from audio_cache import CachedAudio
+
+## NOTE: as in `transcription.py`, numpy is only imported by the functions that handle audio samples
+
+
+## -- DIARIZATION BACKENDS ----
+## -- pyannote (and torch) are only imported inside `load`, so the batching and alignment logic runs without them installed
+
+class SpeakerTurn(TypedDict):
+    start: float
+    end: float
+    speaker: str
+
+
+class DiarizationBackend(Protocol):
+    name: str
+
+    def load(self) -> None:
+        ...
+
+    def diarize(self, audio: str | np.ndarray) -> list[SpeakerTurn]:
+        """`audio` is a filepath or 16kHz mono float32 samples."""
+        ...
+
+
+class PyannoteBackend:
+    name = "pyannote"
+    default_model = "pyannote/speaker-diarization-3.1"
+
+    def __init__(self, model: str | None = None, show_progress: bool = True):
+        self.model = model or self.default_model
+        self.show_progress = show_progress
+
+    def load(self) -> None:
+        import dotenv
+        import torch
+        from pyannote.audio import Pipeline
+
+        dotenv.load_dotenv()
+        self.pipeline = Pipeline.from_pretrained(self.model, use_auth_token=os.environ["HF_TOKEN"])
+        if torch.cuda.is_available():
+            self.pipeline = self.pipeline.to(torch.device("cuda"))
+
+    def diarize(self, audio: str | np.ndarray) -> list[SpeakerTurn]:
+        import numpy as np
+        from audio_chunking import SAMPLE_RATE
+
+        if isinstance(audio, np.ndarray):
+            import torch
+            # pyannote takes in-memory audio as a (channel, time) tensor; `from_numpy` shares the samples' memory
+            audio = {"waveform": torch.from_numpy(audio).unsqueeze(0), "sample_rate": SAMPLE_RATE}
+
+        if self.show_progress:
+            from pyannote.audio.pipelines.utils.hook import ProgressHook
+            with ProgressHook() as hook:
+                diarization = self.pipeline(audio, hook=hook)
+        else:
+            diarization = self.pipeline(audio)
+
+        return [
+            SpeakerTurn(start=segment.start, end=segment.end, speaker=speaker)
+            for segment, _, speaker in diarization.itertracks(yield_label=True)
+        ]
+
+
+class FakeDiarizationBackend:
+    """Alternates between `num_speakers` speakers every `turn_length` seconds of audio. Used for exercising the
+    batching and alignment logic on CPU without a model."""
+    name = "fake"
+
+    def __init__(self, turn_length: float = 20.0, num_speakers: int = 2):
+        self.turn_length = turn_length
+        self.num_speakers = num_speakers
+
+    def load(self) -> None:
+        pass
+
+    def diarize(self, audio: str | np.ndarray) -> list[SpeakerTurn]:
+        from audio_chunking import SAMPLE_RATE
+        duration = (get_audio_duration(audio) or 0.0) if isinstance(audio, str) else len(audio) / SAMPLE_RATE
+        turns = []
+        start = 0.0
+        while start < duration:
+            end = min(start + self.turn_length, duration)
+            turns.append(SpeakerTurn(start=start, end=end, speaker=f"SPEAKER_{len(turns) % self.num_speakers:02d}"))
+            start = end
+        return turns
+
+
+DIARIZATION_BACKENDS: dict[str, type[DiarizationBackend]] = {
+    PyannoteBackend.name: PyannoteBackend,
+    FakeDiarizationBackend.name: FakeDiarizationBackend,
+}
+
+DEFAULT_DIARIZATION_BACKEND = PyannoteBackend.name
+
+
+def get_diarization_backend(name: str = DEFAULT_DIARIZATION_BACKEND) -> DiarizationBackend:
+    if name not in DIARIZATION_BACKENDS:
+        raise ValueError(f"Unknown diarization backend '{name}'. Available backends: {list(DIARIZATION_BACKENDS)}.")
+    return DIARIZATION_BACKENDS[name]()
+
+
+## -- RTTM ----
+## -- one `SPEAKER <uri> 1 <start> <duration> <NA> <NA> <speaker> <NA> <NA>` line per turn (the format pyannote writes)
+
+def write_rttm(turns: list[SpeakerTurn], uri: str, output_filepath: str) -> None:
+    # written to a temp file and renamed, so a crash never leaves a half-written rttm behind
+    tmp_filepath = f"{output_filepath}.tmp"
+    with open(tmp_filepath, mode="w") as outfile:
+        for turn in turns:
+            outfile.write(f"SPEAKER {uri} 1 {turn['start']:.3f} {turn['end'] - turn['start']:.3f} <NA> <NA> {turn['speaker']} <NA> <NA>\n")
+    os.replace(tmp_filepath, output_filepath)
+
+
+def read_rttm(filepath: str) -> list[SpeakerTurn]:
+    turns = []
+    with open(filepath, mode="r") as infile:
+        for line in infile:
+            fields = line.split()
+            if not fields or fields[0] != "SPEAKER":
+                continue
+            start, duration = float(fields[3]), float(fields[4])
+            turns.append(SpeakerTurn(start=start, end=start + duration, speaker=fields[7]))
+    return turns
+
+
+## -- BATCH RUNNER ----
+
+class DiarizationJob(TypedDict):
+    id: str
+    filepath: str
+    cached_audio_filepath: str | None  # <- decoded samples in the audio cache (see `audio_cache.py`), if any
+
+
+def create_diarization_job(audio_file_id: str, filepath: str, cached: CachedAudio | None = None) -> DiarizationJob:
+    return DiarizationJob(id=audio_file_id, filepath=filepath, cached_audio_filepath=cached["cache_filepath"] if cached else None)
+
+
+class DiarizationResult(TypedDict):
+    id: str
+    filepath: str
+    output_filepath: str | None
+    num_turns: int
+    diarize_time: float
+    error: str | None
+
+
+def run_diarization_jobs(jobs: list[DiarizationJob], output_dir: str, backend: DiarizationBackend) -> Iterator[DiarizationResult]:
+    """Diarize `jobs` one after another with an already-loaded `backend`, writing `{id}.rttm` into `output_dir`.
+    Results are yielded as each job completes."""
+    from audio_cache import load_cached_audio
+
+    for job in jobs:
+        start_time = timer()
+        try:
+            audio = load_cached_audio(job["cached_audio_filepath"]) if job["cached_audio_filepath"] else job["filepath"]
+            turns = backend.diarize(audio)
+            output_filepath = os.path.join(output_dir, f"{job['id']}.rttm")
+            write_rttm(turns, job["id"], output_filepath)
+            error = None
+        except Exception as e:
+            turns = []
+            output_filepath = None
+            error = f"{type(e).__name__}: {e}"
+            METRICS.increment("diarization", "errors")
+
+        diarize_time = timer() - start_time
+        if error is None:
+            METRICS.observe("diarization", "diarize_time", diarize_time, id=job["id"])
+        yield DiarizationResult(
+            id=job["id"],
+            filepath=job["filepath"],
+            output_filepath=output_filepath,
+            num_turns=len(turns),
+            diarize_time=diarize_time,
+            error=error
+        )
+
+
+## -- TRANSCRIPT ALIGNMENT ----
+
+def align_speakers(segments: list[dict], turns: list[SpeakerTurn]) -> list[str | None]:
+    """Speaker for each transcript segment (`None` if no turn overlaps it): the speaker whose turns overlap the segment the most.
+
+    Segments and turns are both sorted by start and swept together; turns are kept in a min-heap on their end time while they
+    can still overlap a later segment, so each turn is pushed and popped once - O((n + m) log(n + m)) plus the overlapping pairs, rather than O(n * m)."""
+    segment_order = sorted(range(len(segments)), key=lambda idx: segments[idx]["start"])
+    turns = sorted(turns, key=lambda turn: turn["start"])
+
+    speakers: list[str | None] = [None] * len(segments)
+    active = []  # <- (end, turn index) of turns that started before the current segment ended
+    next_turn = 0
+    for idx in segment_order:
+        start, end = segments[idx]["start"], segments[idx]["end"]
+
+        while next_turn < len(turns) and turns[next_turn]["start"] < end:
+            heapq.heappush(active, (turns[next_turn]["end"], next_turn))
+            next_turn += 1
+        # segments are visited in start order, so a turn ending before this one starts can't overlap any later segment either
+        while active and active[0][0] <= start:
+            heapq.heappop(active)
+
+        overlap_by_speaker = defaultdict(float)
+        for turn_end, turn_idx in active:
+            overlap = min(end, turn_end) - max(start, turns[turn_idx]["start"])
+            if overlap > 0:
+                overlap_by_speaker[turns[turn_idx]["speaker"]] += overlap
+
+        if overlap_by_speaker:
+            # ties go to the first speaker label, so the result doesn't depend on heap order
+            speakers[idx] = min(overlap_by_speaker, key=lambda speaker: (-overlap_by_speaker[speaker], speaker))
+    return speakers
+
+
+def assign_speakers(transcribed: dict, turns: list[SpeakerTurn]) -> dict:
+    """Copy of whisper-style `transcribed` output with a `speaker` key on every segment."""
+    speakers = align_speakers(transcribed["segments"], turns)
+    return {
+        **transcribed,
+        "segments": [{**segment, "speaker": speaker} for segment, speaker in zip(transcribed["segments"], speakers)],
+    }
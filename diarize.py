@@ -1,25 +1,249 @@
-# instantiate the pipeline
 import os
-import dotenv
-from pyannote.audio import Pipeline
+import json
+import argparse
+from pathlib import Path
+from functools import partial
+from timeit import default_timer as timer
 
-from pyannote.audio.pipelines.utils.hook import ProgressHook
+from diarization import (
+    DIARIZATION_BACKENDS,
+    DEFAULT_DIARIZATION_BACKEND,
+    create_diarization_job,
+    get_diarization_backend,
+    run_diarization_jobs,
+    read_rttm,
+    assign_speakers
+)
+from transcription import write_transcription
+from job_ledger import JobStatus, open_job_ledger, select_jobs_to_run
+from metrics import add_metrics_arguments, start_metrics, finish_metrics
+from download_audio_files import PARTIAL_FILE_SUFFIX
+
+SUPPORTED_AUDIO_FORMATS = [".mp3", ".wav"]
+LEDGER_FILENAME = ".diarization_ledger.sqlite"
+
+
+parser = argparse.ArgumentParser(description="Diarize a directory of audio files to one RTTM file per episode, then label transcript segments with speakers.")
+
+parser.add_argument(
+    "--audio-dir",
+    type=Path,
+    required=True,
+    help="Input directory containing audio files."
+)
+
+parser.add_argument(
+    "-o",
+    "--outdir",
+    type=str,
+    required=False,
+    default=".",
+    help="Location to save RTTM files."
+)
+
+parser.add_argument(
+    "--backfill",
+    action="store_true",
+    required=False,
+    help="Only diarize files from the audio directory which are not already diarized in the output directory."
+)
+
+parser.add_argument(
+    "--backend",
+    type=str,
+    choices=list(DIARIZATION_BACKENDS),
+    default=DEFAULT_DIARIZATION_BACKEND,
+    help="Diarization backend. Use 'fake' for testing on CPU."
+)
+
+parser.add_argument(
+    "--retry-failed",
+    action="store_true",
+    help="With `--backfill`, also retry files whose diarization previously failed (up to `--max-attempts`)."
+)
 
-dotenv.load_dotenv()
-HF_AUTH_TOKEN = os.environ["HF_TOKEN"]
+parser.add_argument(
+    "--max-attempts",
+    type=int,
+    default=3,
+    help="Maximum number of attempts per file when using `--retry-failed`."
+)
+
+parser.add_argument(
+    "--transcripts-dir",
+    type=str,
+    default=None,
+    help="Directory of transcription json files (see `batch_transcribe.py`). When given, each diarized episode's segments are labelled with speakers."
+)
+
+parser.add_argument(
+    "--aligned-outdir",
+    type=str,
+    default=None,
+    help="Where to save speaker-labelled transcriptions. Defaults to an 'aligned' directory inside `--outdir`."
+)
+
+parser.add_argument(
+    "--audio-cache",
+    type=str,
+    default=None,
+    help="Directory of the decoded audio cache (see `audio_cache.py`). Files are decoded into it once, and read from it by every later run and stage."
+)
 
-pipeline = Pipeline.from_pretrained(
-  "pyannote/speaker-diarization-3.1",
-  use_auth_token=HF_AUTH_TOKEN
+parser.add_argument(
+    "--decode-workers",
+    type=int,
+    default=4,
+    help="Number of files decoded in parallel when filling the audio cache."
 )
 
-# run the pipeline on an audio file
-with ProgressHook() as hook:
-    diarization = pipeline(
-        "data/test_sample.wav",
-        hook=hook
+parser.add_argument(
+    "--dry-run",
+    action="store_true",
+    help="List the files a run would diarize (e.g. with `--backfill`) and the ledger status, without loading the pipeline or changing the ledger."
+)
+
+add_metrics_arguments(parser)
+
+
+def is_valid_audio_file(filename: Path | str) -> bool:
+    return os.path.splitext(os.path.basename(filename))[1] in SUPPORTED_AUDIO_FORMATS
+
+
+def list_audio_files(audio_dir: Path | str) -> list[str]:
+    """Supported audio files in `audio_dir`, skipping partial downloads and anything else."""
+    filenames = sorted(os.listdir(audio_dir))
+    audio_filenames = [file for file in filenames if is_valid_audio_file(file) and not file.endswith(PARTIAL_FILE_SUFFIX)]
+    if len(audio_filenames) < len(filenames):
+        num_partial = sum(file.endswith(PARTIAL_FILE_SUFFIX) for file in filenames)
+        print(f"!! skipping {len(filenames) - len(audio_filenames)} non-audio files in '{audio_dir}' ({num_partial} partial downloads)")
+    return [os.path.join(audio_dir, file) for file in audio_filenames]
+
+
+def get_file_id(filepath: str) -> str:
+    return os.path.splitext(os.path.basename(filepath))[0]
+
+
+def get_existing_rttm(output_dir: str, file_id: str) -> str | None:
+    output_filepath = os.path.join(output_dir, f"{file_id}.rttm")
+    return output_filepath if os.path.exists(output_filepath) else None
+
+
+def is_up_to_date(output_filepath: str, *input_filepaths: str) -> bool:
+    return os.path.exists(output_filepath) and all(os.path.getmtime(output_filepath) >= os.path.getmtime(filepath) for filepath in input_filepaths)
+
+
+def align_transcripts(rttm_filepaths: dict[str, str], transcripts_dir: str, aligned_dir: str) -> tuple[int, int]:
+    """Label the segments of every transcription that has an rttm file. Returns the number aligned and the number skipped as up to date."""
+    num_aligned = num_skipped = 0
+    for file_id, rttm_filepath in sorted(rttm_filepaths.items()):
+        transcript_filepath = os.path.join(transcripts_dir, f"{file_id}.json")
+        if not os.path.exists(transcript_filepath):
+            continue
+
+        aligned_filepath = os.path.join(aligned_dir, f"{file_id}.json")
+        if is_up_to_date(aligned_filepath, transcript_filepath, rttm_filepath):
+            num_skipped += 1
+            continue
+
+        with open(transcript_filepath, mode="r") as infile:
+            transcribed = json.load(infile)
+        write_transcription(assign_speakers(transcribed, read_rttm(rttm_filepath)), aligned_filepath)
+        num_aligned += 1
+    return num_aligned, num_skipped
+
+
+def main(args: argparse.Namespace):
+    start_metrics(args)
+
+    ## ---- PROCESS INPUTS ------
+    audio_dir = args.audio_dir
+    assert os.path.exists(audio_dir) and os.path.isdir(audio_dir), f"Invalid input for audio directory."
+
+    audio_filepaths = list_audio_files(audio_dir)
+    assert len(audio_filepaths) > 0, f"Audio directory '{audio_dir}' has no '.mp3' or '.wav' files. Must contain audio files."
+    audio_files = [(get_file_id(filepath), filepath) for filepath in audio_filepaths]
+
+    output_dir = args.outdir
+    if not os.path.exists(output_dir) and not args.dry_run:
+        os.mkdir(output_dir)
+
+    # same ledger + backfill semantics as `batch_transcribe.py`
+    ledger = open_job_ledger(
+        os.path.join(output_dir, LEDGER_FILENAME),
+        jobs=audio_files,
+        get_existing_output=partial(get_existing_rttm, output_dir),
+        dry_run=args.dry_run
+    )
+    ids_to_diarize = select_jobs_to_run(
+        ledger,
+        [file_id for file_id, _ in audio_files],
+        backfill=args.backfill,
+        retry_failed=args.retry_failed,
+        max_attempts=args.max_attempts
     )
+    audio_files = [(file_id, filepath) for file_id, filepath in audio_files if file_id in ids_to_diarize]
+
+    if args.dry_run:
+        print(f"-> [DRY RUN] Would diarize {len(audio_files):,} file(s).")
+        for _, filepath in audio_files:
+            print(f"| {filepath}")
+        print(f"-> Ledger status: {ledger.status_counts()}")
+        ledger.close()
+        return
+
+    # decode-once cache shared with `batch_transcribe.py`
+    audio_cache, cached_audio = None, {}
+    if args.audio_cache is not None:
+        from audio_cache import open_audio_cache  # <- numpy; only loaded when the cache is used
+        audio_cache, cached_audio = open_audio_cache(args.audio_cache, audio_files, workers=args.decode_workers)
+    jobs_to_run = [create_diarization_job(file_id, filepath, cached_audio.get(file_id)) for file_id, filepath in audio_files]
+
+    ## ---- BEGIN DIARIZATION ------
+    print(f"## Diarizing {len(jobs_to_run):,} Audio File(s)\n{'-' * 35}")
+    num_errors = 0
+    if jobs_to_run:
+        # the pipeline is loaded once and reused for every file
+        start_time = timer()
+        backend = get_diarization_backend(args.backend)
+        backend.load()
+        print(f"-> Loaded '{args.backend}' diarization backend in {timer() - start_time:.1f}s.")
+
+        ledger.mark_running([job["id"] for job in jobs_to_run])
+        start_time = timer()
+        for idx, result in enumerate(run_diarization_jobs(jobs_to_run, output_dir, backend)):
+            if result["error"] is not None:
+                num_errors += 1
+                ledger.mark_failed(result["id"], result["error"])
+                print(f"!! Failed to diarize '{result['filepath']}': {result['error']}")
+                continue
+
+            ledger.mark_done(result["id"], result["output_filepath"])
+            print(f"| [{idx + 1}/{len(jobs_to_run)}] {result['id']}: {result['num_turns']:,} speaker turns in {result['diarize_time']:.1f}s")
+
+        print(f"-> Diarized {len(jobs_to_run) - num_errors:,} file(s) in {timer() - start_time:.1f}s ({num_errors:,} errors).")
+
+    print(f"-> Ledger status: {ledger.status_counts()}")
+    if audio_cache is not None:
+        decode_time_saved = audio_cache.record_reads([job["id"] for job in jobs_to_run if job["cached_audio_filepath"]])
+        print(f"-> Read {len(cached_audio):,} file(s) from the audio cache, saving {decode_time_saved:.1f}s of decoding (see `audio_cache.py report` for the whole pipeline).")
+        audio_cache.close()
+
+    ## ---- ALIGN TRANSCRIPTS ------
+    if args.transcripts_dir is not None:
+        aligned_dir = args.aligned_outdir or os.path.join(output_dir, "aligned")
+        if not os.path.exists(aligned_dir):
+            os.mkdir(aligned_dir)
+
+        rttm_filepaths = {job["id"]: job["output_filepath"] for job in ledger.get_jobs(JobStatus.DONE) if job["output_filepath"]}
+        start_time = timer()
+        num_aligned, num_skipped = align_transcripts(rttm_filepaths, args.transcripts_dir, aligned_dir)
+        print(f"-> Aligned {num_aligned:,} transcription(s) with speakers in {timer() - start_time:.1f}s ({num_skipped:,} already up to date).")
+
+    ledger.close()
+    finish_metrics()
+
 
-# dump the diarization output to disk using RTTM format
-with open("data/test_sample.rttm", "w") as rttm:
-    diarization.write_rttm(rttm)
+if __name__ == "__main__":
+    args = parser.parse_args()
+    main(args)
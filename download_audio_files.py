@@ -1,19 +1,24 @@
 import os
-import time
 import argparse
 from pathlib import Path
+from functools import partial
+from timeit import default_timer as timer
 
-import requests
-import polars as pl
-from tqdm import tqdm
-
-from utils import DEFAULT_HEADERS
+from utils import http_get, configure_session, get_host, get_timestamp
+from work_queue import run_work_queue
+from metrics import METRICS, add_metrics_arguments, start_metrics, finish_metrics
+from audio_manifest import AUDIO_MANIFEST_DB, AudioFile, AudioManifest, inspect_audio_file, verify_audio_files
 
 parser = argparse.ArgumentParser()
 
 parser.add_argument("--test", action="store_true", help="Flag for testing on small number of html file.")
+parser.add_argument("--workers", type=int, default=4, help="Number of mp3 files downloaded in parallel.")
+parser.add_argument("--rate-limit", type=float, default=2.0, help="Maximum downloads started per second for each host, across all workers.")
+parser.add_argument("--verify", action="store_true", help="Re-hash every file in the audio manifest first, then re-download any that are missing, changed or truncated.")
+parser.add_argument("--verify-workers", type=int, default=None, help="Files hashed in parallel by `--verify`. Defaults to the number of CPUs.")
+add_metrics_arguments(parser)
 
-args = parser.parse_args()
+## NOTE: requests, polars and tqdm are slow to import, so they're imported by the functions that use them
 
 
 ## set data directory
@@ -21,52 +26,222 @@ DATA_DIR = "data"
 PROGRAMME_MP3_DIR = os.path.join(DATA_DIR, "audio_files")
 
 
-def download_mp3_from_url(url: str, dirpath:Path | str) -> None:
-    mp3_content = requests.get(url, headers=DEFAULT_HEADERS)
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # <- 1MB; bounds memory used per download
+MAX_DOWNLOAD_ATTEMPTS = 5
+PARTIAL_FILE_SUFFIX = ".part"
 
-    # create filename
-    filepath = os.path.join(dirpath, os.path.basename(url))
 
-    with open(filepath, mode="wb") as outfile:
-        outfile.write(mp3_content.content)
-        outfile.close()
-    return
+class IncompleteDownloadError(Exception):
+    pass
 
 
-def main():
+def _get_total_size_from_content_range(content_range: str | None) -> int | None:
+    # e.g. 'bytes 1000-4999/5000' or 'bytes */5000'
+    if content_range is None or "/" not in content_range:
+        return None
+    total = content_range.rsplit("/", 1)[1]
+    return int(total) if total.isdigit() else None
 
-    ## load parsed programme data
-    programme_data = pl.read_parquet("data/programme_data.parquet")
 
-    audio_file_urls = (
-        programme_data
-        .select(pl.col("audio_url"))
-        .to_series().to_list()
-    )
-    audio_file_urls = [audio_url for audio_url in audio_file_urls if audio_url is not None]
-    print(f"-> Downloading {len(audio_file_urls):,} mp3 files.")
+def _stream_to_partial_file(url: str, partial_filepath: str, chunk_size: int) -> int | None:
+    """Stream `url` into `partial_filepath`, resuming from any bytes already on disk. Returns the expected total size, if the server reports it."""
+    import requests
 
-    if args.test:
-        print(f"-> [TEST MODE] ----")
+    resume_from = os.path.getsize(partial_filepath) if os.path.exists(partial_filepath) else 0
+    headers = {"Range": f"bytes={resume_from}-"} if resume_from > 0 else {}
 
-    if args.test:
-        audio_file_urls = audio_file_urls[:5]
+    try:
+        # an error body must not be written into the mp3, and a 416 means the partial file is already complete
+        resp = http_get(url, raise_for_status=True, headers=headers, stream=True)
+    except requests.HTTPError as e:
+        # partial file already holds every byte; nothing left to request
+        if e.response is not None and e.response.status_code == 416:
+            return _get_total_size_from_content_range(e.response.headers.get("Content-Range"))
+        raise
+
+    with resp:
+        if resume_from > 0 and resp.status_code == 206:
+            write_mode = "ab"
+            expected_size = _get_total_size_from_content_range(resp.headers.get("Content-Range"))
+        else:
+            # server ignored the range request; start over
+            write_mode = "wb"
+            content_length = resp.headers.get("Content-Length")
+            expected_size = int(content_length) if content_length is not None else None
+
+        with open(partial_filepath, mode=write_mode) as outfile:
+            for chunk in resp.iter_content(chunk_size=chunk_size):
+                outfile.write(chunk)
+
+    return expected_size
 
-    error_counter = 0
-    for audio_url in tqdm(audio_file_urls):
+
+def download_mp3_from_url(url: str, dirpath: Path | str, chunk_size: int = DOWNLOAD_CHUNK_SIZE, max_attempts: int = MAX_DOWNLOAD_ATTEMPTS) -> str:
+    """Download mp3 to `dirpath` in chunks via a `.part` file, resuming with HTTP Range requests if the connection drops.
+    The file is only renamed into place once its size matches the size reported by the server."""
+    import requests
+
+    # create filename
+    filepath = os.path.join(dirpath, os.path.basename(url))
+    partial_filepath = filepath + PARTIAL_FILE_SUFFIX
+
+    start_time = timer()
+    last_error = None
+    for attempt in range(max_attempts):
+        if attempt > 0:
+            METRICS.increment("audio", "resumes")
         try:
-            download_mp3_from_url(audio_url, dirpath=PROGRAMME_MP3_DIR)
-            time.sleep(0.5)
+            expected_size = _stream_to_partial_file(url, partial_filepath, chunk_size)
+        except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError, requests.Timeout) as e:
+            last_error = e
+            continue
+
+        downloaded_size = os.path.getsize(partial_filepath)
+        if expected_size is None or downloaded_size == expected_size:
+            os.replace(partial_filepath, filepath)
+            METRICS.observe("audio", "download_time", timer() - start_time, url=url)
+            METRICS.observe("audio", "bytes", downloaded_size, url=url)
+            return filepath
+
+        if downloaded_size > expected_size:
+            # can't trust a file larger than the server says it is
+            os.remove(partial_filepath)
+            raise IncompleteDownloadError(f"Downloaded {downloaded_size:,} bytes for '{url}', but server reported {expected_size:,} bytes.")
+
+        last_error = IncompleteDownloadError(f"Downloaded {downloaded_size:,} of {expected_size:,} bytes for '{url}'.")
+
+    raise IncompleteDownloadError(f"Failed to download '{url}' after {max_attempts} attempts. Last error: {last_error}")
+
+
+def fetch_audio_file(url: str, dirpath: Path | str, expected_duration: float | None = None) -> AudioFile:
+    """Download `url` and check it isn't truncated, for the audio manifest. A file already on disk (e.g. downloaded
+    before the manifest existed) is kept rather than downloaded again if it passes the same check."""
+    filename = os.path.basename(url)
+    filepath = os.path.join(dirpath, filename)
+    if os.path.exists(filepath):
+        check = inspect_audio_file(filepath, expected_duration)
+        if check["problem"] is None:
+            METRICS.increment("audio", "adopted")
+        else:
+            os.remove(filepath)
+
+    if not os.path.exists(filepath):
+        download_mp3_from_url(url, dirpath)
+        check = inspect_audio_file(filepath, expected_duration)
+        if check["problem"] is not None:
+            os.remove(filepath)
+            raise IncompleteDownloadError(f"Downloaded '{url}', but the file is {check['problem']}.")
+
+    timestamp = get_timestamp()
+    return AudioFile(url=url, filename=filename, size=check["size"], sha256=check["sha256"], duration=check["duration"], downloaded_at=timestamp, verified_at=timestamp)
+
+
+def record_audio_file(manifest: AudioManifest, audio_file: AudioFile, dirpath: Path | str) -> AudioFile:
+    """Add a fetched file to the manifest. If its audio is identical to a file already stored, the new copy is deleted
+    and the url points at the existing file."""
+    duplicate = manifest.find_by_sha256(audio_file["sha256"])
+    if duplicate is not None and duplicate["filename"] != audio_file["filename"] and os.path.exists(os.path.join(dirpath, duplicate["filename"])):
+        os.remove(os.path.join(dirpath, audio_file["filename"]))
+        audio_file = AudioFile(**{**audio_file, "filename": duplicate["filename"]})
+        METRICS.increment("audio", "duplicates")
+    manifest.add(audio_file)
+    return audio_file
+
+
+def download_mp3_files(urls: list[str], dirpath: Path | str, workers: int = 4, requests_per_second: float | None = 2.0, manifest: AudioManifest | None = None, expected_durations: dict[str, float] | None = None) -> dict[str, Exception]:
+    """Download `urls` with a pool of `workers` threads, starting at most `requests_per_second` downloads per host (`None` for no limit). With
+    a `manifest`, each file is also hashed and checked in its worker, then recorded. Returns the errors encountered, keyed by url."""
+    from tqdm import tqdm
+
+    expected_durations = expected_durations or {}
+    if manifest is not None:
+        func = lambda url: fetch_audio_file(url, dirpath, expected_durations.get(url))
+    else:
+        func = partial(download_mp3_from_url, dirpath=dirpath)
+
+    errors = {}
+    results = run_work_queue(func, urls, workers=workers, requests_per_second=requests_per_second, rate_limit_key=get_host)
+    for result in tqdm(results, total=len(urls)):
+        if result["error"] is not None:
+            errors[result["item"]] = result["error"]
+            METRICS.increment("audio", "errors")
+        elif manifest is not None:
+            record_audio_file(manifest, result["result"], dirpath)
+    return errors
+
+
+def remove_unverified_audio_files(manifest: AudioManifest, problems: dict[str, str], dirpath: Path | str) -> None:
+    """Drop manifest records that failed verification, and their files once no good record uses them, so they're re-downloaded."""
+    filenames = set()
+    for url in problems:
+        audio_file = manifest.get(url)
+        if audio_file is not None:
+            filenames.add(audio_file["filename"])
+            manifest.remove(url)
+    for filename in filenames:
+        filepath = os.path.join(dirpath, filename)
+        if not manifest.is_filename_used(filename) and os.path.exists(filepath):
+            os.remove(filepath)
+
+
+def main(args: argparse.Namespace):
+    from programme_queries import get_audio_urls
+
+    start_metrics(args)
+
+    ## load parsed programme data; only the three columns needed are read
+    programme_data = get_audio_urls().collect()
+    programme_audio_urls = dict(zip(programme_data["programme_id"].to_list(), programme_data["audio_url"].to_list()))
+    expected_durations = {
+        audio_url: duration for audio_url, duration in zip(programme_data["audio_url"].to_list(), programme_data["duration_seconds"].to_list())
+        if duration is not None
+    }
+
+    # programmes can share an mp3; each url is only downloaded once
+    audio_file_urls = list(dict.fromkeys(programme_audio_urls.values()))
 
-        except Exception as e:
-            print(f"!! error downloading mp3 from url '{audio_url}'.")
-            print(e)
-            error_counter += 1
+    if args.test:
+        print(f"-> [TEST MODE] ----")
+        audio_file_urls = audio_file_urls[:5]
+
+    os.makedirs(PROGRAMME_MP3_DIR, exist_ok=True)
+    manifest = AudioManifest(AUDIO_MANIFEST_DB)
+    manifest.set_programme_urls(programme_audio_urls)
+
+    if args.verify:
+        start_time = timer()
+        problems = verify_audio_files(manifest, PROGRAMME_MP3_DIR, workers=args.verify_workers, expected_durations=expected_durations)
+        for audio_url, problem in problems.items():
+            print(f"!! {audio_url}: {problem}")
+        remove_unverified_audio_files(manifest, problems, PROGRAMME_MP3_DIR)
+        print(f"-> Verified the audio manifest in {timer() - start_time:.1f}s; {len(problems):,} files to re-download.")
+
+    pending_urls = [audio_url for audio_url in audio_file_urls if not manifest.is_stored(audio_url, PROGRAMME_MP3_DIR)]
+    # recorded files that have since gone missing or changed size are fetched again, not adopted
+    remove_unverified_audio_files(manifest, {audio_url: "changed" for audio_url in pending_urls if manifest.get(audio_url) is not None}, PROGRAMME_MP3_DIR)
+    print(f"-> Downloading {len(pending_urls):,} mp3 files ({len(audio_file_urls) - len(pending_urls):,} already downloaded).")
+
+    configure_session(pool_size=args.workers)
+    download_errors = download_mp3_files(
+        pending_urls,
+        dirpath=PROGRAMME_MP3_DIR,
+        workers=args.workers,
+        requests_per_second=args.rate_limit,
+        manifest=manifest,
+        expected_durations=expected_durations
+    )
 
-    print(f"-> {error_counter} errors.")
+    for audio_url, error in download_errors.items():
+        print(f"!! error downloading mp3 from url '{audio_url}'.")
+        print(error)
+    error_counter = len(download_errors)
 
+    summary = manifest.summary()
+    manifest.close()
+    print(f"-> {error_counter} errors. {summary['num_urls']:,} mp3 urls stored in {summary['num_files']:,} files ({summary['stored_bytes'] / 1e9:,.2f}GB).")
+    finish_metrics()
 
-    return
 
 if __name__ == "__main__":
-    main()
+    args = parser.parse_args()
+    main(args)
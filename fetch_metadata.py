@@ -0,0 +1,108 @@
+import sqlite3
+import hashlib
+from pathlib import Path
+from typing import TypedDict
+
+from utils import get_timestamp
+
+
+## -- PER-URL FETCH METADATA ----
+## -- records ETag / Last-Modified / content hash for each fetched page, so re-crawls can issue conditional requests
+
+class PageMetadata(TypedDict):
+    url: str
+    etag: str | None
+    last_modified: str | None
+    content_hash: str
+    fetched_at: str
+    changed_run_id: int
+
+
+def get_content_hash(content: str | bytes) -> str:
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+class FetchMetadataStore:
+
+    def __init__(self, filepath: Path | str):
+        self.conn = sqlite3.connect(filepath)
+        self.conn.row_factory = sqlite3.Row
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS runs (
+                    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    started_at TEXT NOT NULL
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS pages (
+                    url TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    content_hash TEXT NOT NULL,
+                    fetched_at TEXT NOT NULL,
+                    changed_run_id INTEGER NOT NULL REFERENCES runs (run_id)
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS pages_changed_run_id ON pages (changed_run_id)")
+
+    def start_run(self) -> int:
+        with self.conn:
+            cursor = self.conn.execute("INSERT INTO runs (started_at) VALUES (?)", (get_timestamp(),))
+        return cursor.lastrowid
+
+    def latest_run_id(self) -> int | None:
+        row = self.conn.execute("SELECT MAX(run_id) AS run_id FROM runs").fetchone()
+        return row["run_id"]
+
+    def get(self, url: str) -> PageMetadata | None:
+        row = self.conn.execute("SELECT * FROM pages WHERE url = ?", (url,)).fetchone()
+        return PageMetadata(**row) if row is not None else None
+
+    def get_conditional_headers(self, url: str) -> dict[str, str]:
+        metadata = self.get(url)
+        if metadata is None:
+            return {}
+
+        headers = {}
+        if metadata["etag"] is not None:
+            headers["If-None-Match"] = metadata["etag"]
+        if metadata["last_modified"] is not None:
+            headers["If-Modified-Since"] = metadata["last_modified"]
+        return headers
+
+    def record_fetch(self, url: str, content_hash: str, run_id: int, etag: str | None = None, last_modified: str | None = None) -> bool:
+        """Store metadata for a fetched page. Returns whether the content changed since it was last fetched."""
+        previous = self.get(url)
+        changed = previous is None or previous["content_hash"] != content_hash
+        changed_run_id = run_id if changed else previous["changed_run_id"]
+
+        with self.conn:
+            self.conn.execute(
+                """
+                INSERT INTO pages (url, etag, last_modified, content_hash, fetched_at, changed_run_id)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (url) DO UPDATE SET
+                    etag = excluded.etag,
+                    last_modified = excluded.last_modified,
+                    content_hash = excluded.content_hash,
+                    fetched_at = excluded.fetched_at,
+                    changed_run_id = excluded.changed_run_id
+                """,
+                (url, etag, last_modified, content_hash, get_timestamp(), changed_run_id)
+            )
+        return changed
+
+    def record_not_modified(self, url: str) -> None:
+        with self.conn:
+            self.conn.execute("UPDATE pages SET fetched_at = ? WHERE url = ?", (get_timestamp(), url))
+
+    def changed_since(self, run_id: int) -> list[str]:
+        """Urls whose content changed (or were first fetched) in any run after `run_id`."""
+        rows = self.conn.execute("SELECT url FROM pages WHERE changed_run_id > ? ORDER BY url", (run_id,)).fetchall()
+        return [row["url"] for row in rows]
+
+    def close(self) -> None:
+        self.conn.close()
@@ -0,0 +1,421 @@
+import os
+import re
+import struct
+import sqlite3
+import argparse
+import threading
+from pathlib import Path
+from typing import TypedDict, Iterator
+from datetime import datetime, timezone
+from timeit import default_timer as timer
+
+from fetch_metadata import get_content_hash
+
+
+## -- PACKED HTML ARCHIVE ----
+## -- raw programme pages stored as zstd-compressed, WARC-like records appended to size-capped shard files, instead of
+## -- one loose `.html` file per page. records are content addressed (identical bytes are stored once) and an sqlite index
+## -- maps each programme id to its latest record's shard and byte offset, for random access without scanning.
+##
+## -- each record is a zstd skippable frame holding the compressed length, followed by one zstd frame; skippable frames
+## -- are ignored by zstd itself, so `zstd -dc shard-00000.warc.zst` prints every record, and the index can be
+## -- rebuilt from the shards alone (`python html_archive.py rebuild-index`). a page whose content is already archived gets
+## -- a small WARC 'revisit' record (no payload, just the programme id, url and hash), so replaying the shards in order
+## -- recovers every programme's latest content.
+
+HTML_ARCHIVE_DIR = os.path.join("data", "programme_html_archive")
+INDEX_FILENAME = "index.sqlite"
+SHARD_TEMPLATE = "shard-{shard:05d}.warc.zst"
+MAX_SHARD_SIZE = 256 * 1024 * 1024
+COMPRESSION_LEVEL = 9  # <- pages are written once and read many times; decompression speed barely depends on level
+
+_SKIPPABLE_FRAME_MAGIC = 0x184D2A50
+_LENGTH_FRAME = struct.Struct("<IIQ")  # <- magic, payload size (8), compressed record length
+_HEADER_END = b"\r\n\r\n"
+
+
+class ArchivedPage(TypedDict):
+    programme_id: str
+    url: str
+    fetched_at: str
+    content_hash: str
+    html: str
+
+
+class ArchiveSummary(TypedDict):
+    num_pages: int
+    num_records: int
+    num_shards: int
+    compressed_bytes: int
+    uncompressed_bytes: int
+
+
+def get_utc_timestamp() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
+
+
+def _encode_record(programme_id: str, url: str, fetched_at: str, content_hash: str, content: bytes, warc_type: str = "resource") -> bytes:
+    header = (
+        "WARC/1.1\r\n"
+        f"WARC-Type: {warc_type}\r\n"
+        f"WARC-Record-ID: <urn:programme:{programme_id}>\r\n"
+        f"WARC-Target-URI: {url}\r\n"
+        f"WARC-Date: {fetched_at}\r\n"
+        f"WARC-Payload-Digest: sha256:{content_hash}\r\n"
+        + ("WARC-Profile: http://netpreserve.org/warc/1.1/revisit/identical-payload-digest\r\n" if warc_type == "revisit" else "")
+        + "Content-Type: text/html; charset=utf-8\r\n"
+        f"Content-Length: {len(content)}\r\n"
+        "\r\n"
+    )
+    return header.encode("utf-8") + content + _HEADER_END
+
+
+def _decode_record(record: bytes) -> tuple[dict[str, str], bytes]:
+    header_end = record.index(_HEADER_END)
+    headers = dict(line.split(": ", 1) for line in record[:header_end].decode("utf-8").split("\r\n")[1:])
+    content_start = header_end + len(_HEADER_END)
+    return headers, record[content_start:content_start + int(headers["Content-Length"])]
+
+
+class HtmlArchive:
+    """Safe to share between threads. One process appends at a time; any number of processes can read."""
+
+    def __init__(self, archive_dir: Path | str = HTML_ARCHIVE_DIR, readonly: bool = False, max_shard_size: int = MAX_SHARD_SIZE, compression_level: int = COMPRESSION_LEVEL):
+        self.archive_dir = str(archive_dir)
+        self.readonly = readonly
+        self.max_shard_size = max_shard_size
+        self.lock = threading.RLock()
+        self.read_fds: dict[int, int] = {}
+        import zstandard  # <- imported on first use, so scripts only reading `HTML_ARCHIVE_DIR` start quickly
+        self._zstandard = zstandard
+        self.compressor = zstandard.ZstdCompressor(level=compression_level)
+
+        if not readonly:
+            os.makedirs(self.archive_dir, exist_ok=True)
+        index_filepath = os.path.join(self.archive_dir, INDEX_FILENAME)
+        if readonly:
+            self.conn = sqlite3.connect(f"file:{index_filepath}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self.conn = sqlite3.connect(index_filepath, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")  # <- readers in other processes aren't blocked by the writer
+            with self.conn:
+                self.conn.execute("""
+                    CREATE TABLE IF NOT EXISTS records (
+                        content_hash TEXT PRIMARY KEY,
+                        shard INTEGER NOT NULL,
+                        offset INTEGER NOT NULL,
+                        length INTEGER NOT NULL,
+                        content_length INTEGER NOT NULL
+                    )
+                """)
+                self.conn.execute("""
+                    CREATE TABLE IF NOT EXISTS pages (
+                        programme_id TEXT PRIMARY KEY,
+                        url TEXT NOT NULL,
+                        content_hash TEXT NOT NULL REFERENCES records (content_hash),
+                        fetched_at TEXT NOT NULL
+                    )
+                """)
+        self.conn.row_factory = sqlite3.Row
+
+        self.shard = None
+        self.shard_file = None
+        if not readonly:
+            self._open_last_shard()
+
+    ## -- WRITING ----
+
+    def _get_shard_filepath(self, shard: int) -> str:
+        return os.path.join(self.archive_dir, SHARD_TEMPLATE.format(shard=shard))
+
+    def _open_last_shard(self) -> None:
+        shards = self.get_shards()
+        self.shard = shards[-1] if shards else 0
+        if shards:
+            # records appended after the last index commit (e.g. the process was killed) are indexed, and a torn last record is cut off
+            row = self.conn.execute("SELECT MAX(offset + length) AS end FROM records WHERE shard = ?", (self.shard,)).fetchone()
+            self._index_shard(self.shard, from_offset=row["end"] or 0)
+        self.shard_file = open(self._get_shard_filepath(self.shard), mode="ab")
+
+    def _roll_shard(self) -> None:
+        self.shard_file.close()
+        self.shard += 1
+        self.shard_file = open(self._get_shard_filepath(self.shard), mode="ab")
+
+    def _append_frame(self, frame: bytes) -> int:
+        """Append one compressed record to the current shard. Returns its offset."""
+        if self.shard_file.tell() > 0 and self.shard_file.tell() + len(frame) > self.max_shard_size:
+            self._roll_shard()
+        offset = self.shard_file.tell() + _LENGTH_FRAME.size
+        self.shard_file.write(_LENGTH_FRAME.pack(_SKIPPABLE_FRAME_MAGIC, 8, len(frame)) + frame)
+        # the record reaches the file before the index points at it
+        self.shard_file.flush()
+        return offset
+
+    def put(self, programme_id: str, url: str, content: bytes, fetched_at: str | None = None) -> bool:
+        """Point `programme_id` at `content`, appending a record (or, if identical content is already archived, a revisit
+        record referring to it). Returns whether the page is new or changed."""
+        assert not self.readonly, "Archive was opened read-only."
+        content_hash = get_content_hash(content)
+        fetched_at = fetched_at or get_utc_timestamp()
+        with self.lock:
+            if self.get_content_hash(programme_id) == content_hash:
+                return False
+
+            if self.conn.execute("SELECT 1 FROM records WHERE content_hash = ?", (content_hash,)).fetchone() is None:
+                frame = self.compressor.compress(_encode_record(programme_id, url, fetched_at, content_hash, content))
+                offset = self._append_frame(frame)
+                self.conn.execute(
+                    "INSERT INTO records (content_hash, shard, offset, length, content_length) VALUES (?, ?, ?, ?, ?)",
+                    (content_hash, self.shard, offset, len(frame), len(content))
+                )
+            else:
+                self._append_frame(self.compressor.compress(_encode_record(programme_id, url, fetched_at, content_hash, b"", warc_type="revisit")))
+
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO pages (programme_id, url, content_hash, fetched_at) VALUES (?, ?, ?, ?)",
+                    (programme_id, url, content_hash, fetched_at)
+                )
+        return True
+
+    ## -- READING ----
+
+    def __contains__(self, programme_id: str) -> bool:
+        return self.get_content_hash(programme_id) is not None
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def get_shards(self) -> list[int]:
+        pattern = re.compile(r"shard-(\d+)\.warc\.zst")
+        return sorted(int(match.group(1)) for file in os.listdir(self.archive_dir) if (match := pattern.fullmatch(file)))
+
+    def programme_ids(self) -> list[str]:
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT programme_id FROM pages ORDER BY programme_id")]
+
+    def get_content_hash(self, programme_id: str) -> str | None:
+        with self.lock:
+            row = self.conn.execute("SELECT content_hash FROM pages WHERE programme_id = ?", (programme_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def get_content_hashes(self) -> dict[str, str]:
+        with self.lock:
+            return {row[0]: row[1] for row in self.conn.execute("SELECT programme_id, content_hash FROM pages")}
+
+    def _read_frame(self, shard: int, offset: int, length: int) -> bytes:
+        with self.lock:
+            if shard not in self.read_fds:
+                self.read_fds[shard] = os.open(self._get_shard_filepath(shard), os.O_RDONLY)
+            fd = self.read_fds[shard]
+        return os.pread(fd, length, offset)
+
+    def _get_page(self, row: sqlite3.Row) -> ArchivedPage:
+        record = self._zstandard.ZstdDecompressor().decompress(self._read_frame(row["shard"], row["offset"], row["length"]))
+        _, content = _decode_record(record)
+        return ArchivedPage(programme_id=row["programme_id"], url=row["url"], fetched_at=row["fetched_at"], content_hash=row["content_hash"], html=content.decode("utf-8"))
+
+    def get(self, programme_id: str) -> ArchivedPage | None:
+        with self.lock:
+            row = self.conn.execute("""
+                SELECT pages.*, records.shard, records.offset, records.length
+                FROM pages JOIN records USING (content_hash)
+                WHERE programme_id = ?
+            """, (programme_id,)).fetchone()
+        return self._get_page(row) if row is not None else None
+
+    def iter_pages(self, programme_ids: list[str] | None = None) -> Iterator[ArchivedPage]:
+        """Every page (or just `programme_ids`), read in shard order so the shards are scanned sequentially."""
+        with self.lock:
+            rows = self.conn.execute("""
+                SELECT pages.*, records.shard, records.offset, records.length
+                FROM pages JOIN records USING (content_hash)
+                ORDER BY records.shard, records.offset
+            """).fetchall()
+        if programme_ids is not None:
+            wanted = set(programme_ids)
+            rows = [row for row in rows if row["programme_id"] in wanted]
+        for row in rows:
+            yield self._get_page(row)
+
+    def summary(self) -> ArchiveSummary:
+        with self.lock:
+            num_pages = self.conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+            num_records, uncompressed_bytes = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(content_length), 0) FROM records").fetchone()
+        shards = self.get_shards()
+        return ArchiveSummary(
+            num_pages=num_pages,
+            num_records=num_records,
+            num_shards=len(shards),
+            compressed_bytes=sum(os.path.getsize(self._get_shard_filepath(shard)) for shard in shards),
+            uncompressed_bytes=uncompressed_bytes
+        )
+
+    ## -- RECOVERY ----
+
+    def _index_shard(self, shard: int, from_offset: int = 0) -> int:
+        """Index every complete record in `shard` from `from_offset` on, truncating the shard at the first torn record.
+        Later records (including revisits) for a programme replace earlier ones. Returns the number of records found."""
+        filepath = self._get_shard_filepath(shard)
+        size = os.path.getsize(filepath)
+        num_records = 0
+        with open(filepath, mode="rb") as infile, self.conn:
+            position = from_offset
+            infile.seek(position)
+            while position < size:
+                length_frame = infile.read(_LENGTH_FRAME.size)
+                if len(length_frame) < _LENGTH_FRAME.size:
+                    break
+                magic, _, length = _LENGTH_FRAME.unpack(length_frame)
+                frame = infile.read(length)
+                if magic != _SKIPPABLE_FRAME_MAGIC or len(frame) < length:
+                    break
+                headers, content = _decode_record(self._zstandard.ZstdDecompressor().decompress(frame))
+                content_hash = headers["WARC-Payload-Digest"].removeprefix("sha256:")
+                if headers["WARC-Type"] != "revisit":
+                    self.conn.execute(
+                        "INSERT OR IGNORE INTO records (content_hash, shard, offset, length, content_length) VALUES (?, ?, ?, ?, ?)",
+                        (content_hash, shard, position + _LENGTH_FRAME.size, length, len(content))
+                    )
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO pages (programme_id, url, content_hash, fetched_at) VALUES (?, ?, ?, ?)",
+                    (headers["WARC-Record-ID"].removeprefix("<urn:programme:").removesuffix(">"), headers["WARC-Target-URI"], content_hash, headers["WARC-Date"])
+                )
+                position += _LENGTH_FRAME.size + length
+                num_records += 1
+
+        if position < size:
+            print(f"!! Truncating torn record at byte {position:,} of '{filepath}'.")
+            os.truncate(filepath, position)
+        return num_records
+
+    def rebuild_index(self) -> int:
+        """Recreate the index from the shards alone. Returns the number of records found."""
+        assert not self.readonly, "Archive was opened read-only."
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM pages")
+            self.conn.execute("DELETE FROM records")
+        with self.lock:
+            return sum(self._index_shard(shard) for shard in self.get_shards())
+
+    def close(self) -> None:
+        if self.shard_file is not None:
+            self.shard_file.close()
+            self.shard_file = None
+        for fd in self.read_fds.values():
+            os.close(fd)
+        self.read_fds = {}
+        self.conn.close()
+
+
+## -- ONE READER PER PROCESS ----
+## -- for worker processes that look pages up by programme id; a reader inherited over fork isn't reused
+
+_readers: dict[str, HtmlArchive] = {}
+_readers_pid: int | None = None
+
+
+def get_archive_reader(archive_dir: Path | str = HTML_ARCHIVE_DIR) -> HtmlArchive:
+    global _readers, _readers_pid
+    if _readers_pid != os.getpid():
+        _readers = {}
+        _readers_pid = os.getpid()
+    archive_dir = str(archive_dir)
+    if archive_dir not in _readers:
+        _readers[archive_dir] = HtmlArchive(archive_dir, readonly=True)
+    return _readers[archive_dir]
+
+
+## -- LOOSE FILES ----
+
+def get_directory_footprint(dirpath: Path | str) -> tuple[int, int, int]:
+    """(number of files, bytes of content, bytes allocated on disk) for the files in `dirpath`."""
+    num_files, num_bytes, num_allocated_bytes = 0, 0, 0
+    for entry in os.scandir(dirpath):
+        if entry.is_file():
+            stat = entry.stat()
+            num_files += 1
+            num_bytes += stat.st_size
+            num_allocated_bytes += stat.st_blocks * 512
+    return num_files, num_bytes, num_allocated_bytes
+
+
+def import_html_files(archive: HtmlArchive, html_dir: Path | str, url_template: str = "https://www.bbc.co.uk/programmes/{programme_id}") -> int:
+    """Pack a directory of loose `{programme_id}.html` files into `archive`, using each file's mtime as its fetch time."""
+    num_imported = 0
+    for file in sorted(os.listdir(html_dir)):
+        if not file.endswith(".html"):
+            continue
+        filepath = os.path.join(html_dir, file)
+        programme_id = os.path.splitext(file)[0]
+        with open(filepath, mode="rb") as infile:
+            content = infile.read()
+        fetched_at = datetime.fromtimestamp(os.path.getmtime(filepath), tz=timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
+        num_imported += archive.put(programme_id, url_template.format(programme_id=programme_id), content, fetched_at=fetched_at)
+    return num_imported
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack, inspect and repair the programme html archive.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="Pack a directory of loose .html files into the archive.")
+    import_parser.add_argument("--html-dir", type=str, default=os.path.join("data", "programme_html"))
+
+    get_parser = subparsers.add_parser("get", help="Print one archived page.")
+    get_parser.add_argument("programme_id", type=str)
+
+    stats_parser = subparsers.add_parser("stats", help="Show archive size and compression, and read time for the whole corpus.")
+    stats_parser.add_argument("--html-dir", type=str, default=None, help="Also measure a directory of loose .html files, for comparison.")
+
+    rebuild_parser = subparsers.add_parser("rebuild-index", help="Recreate the index by scanning every shard.")
+
+    for subparser in [import_parser, get_parser, stats_parser, rebuild_parser]:
+        subparser.add_argument("--archive-dir", type=str, default=HTML_ARCHIVE_DIR)
+
+    args = parser.parse_args()
+    archive = HtmlArchive(args.archive_dir, readonly=args.command in ("get", "stats"))
+
+    if args.command == "import":
+        start_time = timer()
+        num_imported = import_html_files(archive, args.html_dir)
+        print(f"-> Imported {num_imported:,} new or changed pages from '{args.html_dir}' in {timer() - start_time:.1f}s.")
+
+    elif args.command == "get":
+        page = archive.get(args.programme_id)
+        if page is None:
+            raise SystemExit(f"!! '{args.programme_id}' is not in the archive.")
+        print(page["html"])
+
+    elif args.command == "rebuild-index":
+        start_time = timer()
+        num_records = archive.rebuild_index()
+        print(f"-> Indexed {num_records:,} records in {timer() - start_time:.1f}s.")
+
+    if args.command in ("import", "stats", "rebuild-index"):
+        summary = archive.summary()
+        print(
+            f"-> Archive '{args.archive_dir}': {summary['num_pages']:,} pages, {summary['num_records']:,} distinct records in {summary['num_shards']} shard(s). "
+            f"{summary['compressed_bytes'] / 1e6:.1f} MB on disk for {summary['uncompressed_bytes'] / 1e6:.1f} MB of html "
+            f"({summary['uncompressed_bytes'] / max(1, summary['compressed_bytes']):.1f}x)."
+        )
+
+    if args.command == "stats":
+        start_time = timer()
+        num_pages = sum(1 for _ in archive.iter_pages())
+        print(f"-> Read every archived page in {timer() - start_time:.2f}s.")
+
+        if args.html_dir is not None:
+            num_files, num_bytes, num_allocated_bytes = get_directory_footprint(args.html_dir)
+            start_time = timer()
+            for file in os.listdir(args.html_dir):
+                with open(os.path.join(args.html_dir, file), mode="r") as infile:
+                    infile.read()
+            print(
+                f"-> Loose files '{args.html_dir}': {num_files:,} files, {num_bytes / 1e6:.1f} MB ({num_allocated_bytes / 1e6:.1f} MB allocated on disk). "
+                f"Read every file in {timer() - start_time:.2f}s."
+            )
+
+    archive.close()
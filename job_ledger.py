@@ -0,0 +1,165 @@
+import os
+import sqlite3
+from pathlib import Path
+from typing import TypedDict, Callable
+from enum import StrEnum
+
+from utils import get_timestamp
+
+
+## -- PERSISTENT JOB LEDGER ----
+## -- tracks every audio file through pending -> running -> done / failed, so a killed batch can be resumed
+
+class JobStatus(StrEnum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class LedgerJob(TypedDict):
+    id: str
+    filepath: str
+    status: str
+    attempts: int
+    error: str | None
+    output_filepath: str | None
+    updated_at: str
+
+
+class JobLedger:
+
+    def __init__(self, filepath: Path | str):
+        self.conn = sqlite3.connect(filepath)
+        self.conn.row_factory = sqlite3.Row
+        with self.conn:
+            # WAL keeps the ledger consistent if the process is killed mid-write
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    filepath TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    output_filepath TEXT,
+                    updated_at TEXT NOT NULL
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+
+    def is_empty(self) -> bool:
+        return self.conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] == 0
+
+    def enqueue(self, jobs: list[tuple[str, str]]) -> int:
+        """Add (id, filepath) jobs as pending. Jobs already in the ledger keep their status. Returns the number added."""
+        with self.conn:
+            cursor = self.conn.executemany(
+                "INSERT OR IGNORE INTO jobs (id, filepath, status, updated_at) VALUES (?, ?, ?, ?)",
+                [(job_id, filepath, JobStatus.PENDING, get_timestamp()) for job_id, filepath in jobs]
+            )
+        return cursor.rowcount
+
+    def import_completed(self, jobs: list[tuple[str, str, str]]) -> None:
+        """Record (id, filepath, output_filepath) jobs that were completed before the ledger existed."""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO jobs (id, filepath, status, attempts, output_filepath, updated_at) VALUES (?, ?, ?, 1, ?, ?)",
+                [(job_id, filepath, JobStatus.DONE, output_filepath, get_timestamp()) for job_id, filepath, output_filepath in jobs]
+            )
+
+    def recover_interrupted(self) -> int:
+        """Jobs left 'running' belong to a process that died; put them back in the queue."""
+        with self.conn:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ?",
+                (JobStatus.PENDING, get_timestamp(), JobStatus.RUNNING)
+            )
+        return cursor.rowcount
+
+    def retry_failed(self, max_attempts: int) -> int:
+        with self.conn:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ? AND attempts < ?",
+                (JobStatus.PENDING, get_timestamp(), JobStatus.FAILED, max_attempts)
+            )
+        return cursor.rowcount
+
+    def reset(self, job_ids: list[str]) -> None:
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?",
+                [(JobStatus.PENDING, get_timestamp(), job_id) for job_id in job_ids]
+            )
+
+    def get_jobs(self, status: JobStatus) -> list[LedgerJob]:
+        rows = self.conn.execute("SELECT * FROM jobs WHERE status = ? ORDER BY id", (status,)).fetchall()
+        return [LedgerJob(**row) for row in rows]
+
+    def mark_running(self, job_ids: list[str]) -> None:
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?",
+                [(JobStatus.RUNNING, get_timestamp(), job_id) for job_id in job_ids]
+            )
+
+    def mark_done(self, job_id: str, output_filepath: str) -> None:
+        with self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, error = NULL, output_filepath = ?, updated_at = ? WHERE id = ?",
+                (JobStatus.DONE, output_filepath, get_timestamp(), job_id)
+            )
+
+    def mark_failed(self, job_id: str, error: str) -> None:
+        with self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, error = ?, updated_at = ? WHERE id = ?",
+                (JobStatus.FAILED, error, get_timestamp(), job_id)
+            )
+
+    def status_counts(self) -> dict[str, int]:
+        rows = self.conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {status.value: 0 for status in JobStatus} | {row["status"]: row["n"] for row in rows}
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def open_job_ledger(filepath: Path | str, jobs: list[tuple[str, str]], get_existing_output: Callable[[str], str | None], dry_run: bool = False) -> JobLedger:
+    """Open a ledger and enqueue (id, filepath) `jobs`. The first time a ledger is created, jobs for which
+    `get_existing_output` returns an output filepath (i.e., completed before the ledger existed) are recorded as done.
+    With `dry_run`, an in-memory copy of the ledger is opened instead, so selecting jobs leaves the file untouched."""
+    if dry_run:
+        ledger = JobLedger(":memory:")
+        if os.path.exists(filepath):
+            source = sqlite3.connect(f"file:{filepath}?mode=ro", uri=True)
+            source.backup(ledger.conn)
+            source.close()
+    else:
+        ledger = JobLedger(filepath)
+    if ledger.is_empty():
+        already_completed = []
+        for job_id, job_filepath in jobs:
+            output_filepath = get_existing_output(job_id)
+            if output_filepath is not None:
+                already_completed.append((job_id, job_filepath, output_filepath))
+        ledger.import_completed(already_completed)
+
+    ledger.enqueue(jobs)
+    return ledger
+
+
+def select_jobs_to_run(ledger: JobLedger, job_ids: list[str], backfill: bool, retry_failed: bool = False, max_attempts: int = 3) -> set[str]:
+    """Backfill runs only what the ledger doesn't have as done (plus failed jobs under `max_attempts`, with `retry_failed`);
+    otherwise every job in `job_ids` is run again."""
+    num_interrupted = ledger.recover_interrupted()
+    if num_interrupted:
+        print(f"-> Re-queued {num_interrupted:,} job(s) left running by an interrupted run.")
+
+    if not backfill:
+        ledger.reset(job_ids)
+        return set(job_ids)
+
+    if retry_failed:
+        ledger.retry_failed(max_attempts=max_attempts)
+    return {job["id"] for job in ledger.get_jobs(JobStatus.PENDING)} & set(job_ids)
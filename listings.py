@@ -1,24 +1,36 @@
+from __future__ import annotations
+
 import os
 import time
 import random
 import argparse
 from enum import StrEnum
+from typing import TYPE_CHECKING
+from timeit import default_timer as timer
 
-import polars as pl
-from bs4 import BeautifulSoup
+from utils import get_soup_from_url, crawl_urls, configure_session
+from work_queue import RateLimiter
+from programme_url_store import ProgrammeUrlStore
+from metrics import METRICS, add_metrics_arguments, start_metrics, finish_metrics
 
-from utils import get_soup_from_url, crawl_pooler
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup
 
 parser = argparse.ArgumentParser()
 
 parser.add_argument("--test", action='store_true', help="Flag for testing of script. Will only crawl small number of listing pages.")
+parser.add_argument("--concurrency", type=int, default=8, help="Maximum number of listing pages in flight at once.")
+parser.add_argument("--rate-limit", type=float, default=2.0, help="Maximum requests per second sent to each host.")
+parser.add_argument("--incremental", action='store_true', help="Only walk the newest listing pages, stopping at the first page with a programme already in the url store. Runs a full sweep until one has finished without errors.")
+parser.add_argument("--listing-url-template", type=str, default=None, help="Listing page url with a `{page_num}` placeholder. Defaults to the BBC episode listings.")
+add_metrics_arguments(parser)
 
 
-args = parser.parse_args()
 
 # data directory
 DATA_DIR = "data"
 PROGRAMME_URLS_CSV = os.path.join(DATA_DIR, "programme_urls.csv")
+PROGRAMME_URL_STORE_DB = os.path.join(DATA_DIR, "programme_urls.sqlite")
 
 # templated path for programme episode listings
 PROGRAMME_LISTING_URL_TEMPLATE = (
@@ -54,64 +66,151 @@ def _get_max_available_page_number_from_html(soup: BeautifulSoup) -> int:
 #### -- STRIP INDIVIDUAL PROGRAMME EPISODE LINKS FROM LISTING PAGE ----
 #### -- EXAMPLE: https://www.bbc.co.uk/programmes/b006qykl/episodes/player?page=6
 
-def collect_listed_programme_urls_from_single_page(url: str) -> list[str]:
-    html_content = get_soup_from_url(url)
-    programmes_listing = html_content.find_all("div", {"class": "programme"})
+def get_listed_programme_urls_from_html(soup: BeautifulSoup) -> list[str]:
+    programmes_listing = soup.find_all("div", {"class": "programme"})
     programme_urls = [
         programme.find("h2", {"class": "programme__titles"}).find("a").get("href")
         for programme in programmes_listing
     ]
     return programme_urls
 
+def collect_listed_programme_urls_from_single_page(url: str) -> list[str]:
+    html_content = get_soup_from_url(url)
+    return get_listed_programme_urls_from_html(html_content)
+
 #### -- MAIN FUNCTIONS FOR CRAWLING ARCHIVE ----
 
-def get_max_archive_page_number() -> int:
+def get_max_archive_page_number(url_template: str = PROGRAMME_LISTING_URL_TEMPLATE) -> int:
     random_page_num = random.randint(10, 85)
-    archive_listing = format_listing_url(page_num=random_page_num)
+    archive_listing = format_listing_url(page_num=random_page_num, url_template=url_template)
     html_content = get_soup_from_url(archive_listing)
     return _get_max_available_page_number_from_html(html_content)
 
 
+#### -- INCREMENTAL CRAWL ----
+#### -- listings are newest first, so new episodes are on page 1 and the first page listing a stored programme marks
+#### -- where the previous crawl reached. the page count is read from page 1's pagination rather than a separate request
 
-def main():
-
+def crawl_new_listing_pages(store: ProgrammeUrlStore, url_template: str = PROGRAMME_LISTING_URL_TEMPLATE, requests_per_second: float = 2.0) -> tuple[list[str], int]:
+    """Walk the listing pages from page 1, adding their programme urls to `store`, until a page lists a programme the
+    store already has. Returns the newly added urls and the number of pages fetched."""
+    rate_limiter = RateLimiter(requests_per_second)
+    run_id = store.start_crawl_run("incremental")
+    new_urls = []
+    num_pages_fetched = 0
+    num_errors = 0
+    page_num, max_page = 1, 1
+    try:
+        while page_num <= max_page:
+            while (wait_time := rate_limiter.reserve()) > 0:
+                time.sleep(wait_time)
+
+            listing_url = format_listing_url(page_num, url_template)
+            try:
+                html_content = get_soup_from_url(listing_url)
+            except Exception as e:
+                print(f"!! error collecting url {listing_url}")
+                print(e)
+                METRICS.increment("listings", "errors")
+                num_errors += 1
+                break  # <- without this page there's no telling whether the later ones are new
+            num_pages_fetched += 1
+            if page_num == 1:
+                try:
+                    max_page = _get_max_available_page_number_from_html(html_content)
+                except ValueError:
+                    pass  # <- no pagination: everything is listed on page 1
+
+            programme_urls = get_listed_programme_urls_from_html(html_content)
+            page_new_urls = store.add(listing_url, programme_urls)
+            new_urls.extend(page_new_urls)
+            METRICS.observe("listings", "programmes_per_page", len(programme_urls))
+            if len(page_new_urls) < len(programme_urls) or not programme_urls:
+                break
+            page_num += 1
+    finally:
+        store.finish_crawl_run(run_id, num_pages_fetched, num_errors)
+    return new_urls, num_pages_fetched
+
+
+
+def crawl_all_listing_pages(store: ProgrammeUrlStore, url_template: str, concurrency: int, requests_per_second: float, test: bool = False) -> list[str]:
+    """Crawl every listing page, adding their programme urls to `store`. Returns the newly added urls. The run is logged
+    in `store`, and counts as a complete sweep if it wasn't a `test` run and every page was fetched."""
     # get maximum number of pages available
-    max_page = get_max_archive_page_number()
-
-    if args.test:
-        print(f"-> ---- [TEST MODE] ----")
+    max_page = get_max_archive_page_number(url_template)
     print(f"-> collecting programme urls for {max_page} available pages")
 
-
     available_page_numbers = list(range(0, (max_page + 1)))
     random.shuffle(available_page_numbers) # <- randomly shuffle order of pages
 
-    all_programme_urls = []
-
-    if args.test:
+    if test:
         available_page_numbers = available_page_numbers[:5]
-    for page_num in available_page_numbers:
-
-        listing_url = format_listing_url(page_num)
-        try:
-            programme_urls = collect_listed_programme_urls_from_single_page(listing_url)
 
-            all_programme_urls.extend([
-                {"listing_url": listing_url, "programme_url": programme_url}
-                for programme_url in programme_urls
-            ])
-        except Exception as e:
+    listing_urls = [format_listing_url(page_num, url_template) for page_num in available_page_numbers]
+    run_id = store.start_crawl_run("test" if test else "full")
+
+    start_time = timer()
+    crawl_results = crawl_urls(
+        collect_listed_programme_urls_from_single_page,
+        listing_urls,
+        max_concurrency=concurrency,
+        requests_per_second=requests_per_second
+    )
+    total_time = timer() - start_time
+
+    new_urls = []
+    num_programme_urls = 0
+    num_errors = 0
+    for listing_url, programme_urls in zip(listing_urls, crawl_results):
+        if isinstance(programme_urls, Exception):
             print(f"!! error collecting url {listing_url}")
-            print(e)
+            print(programme_urls)
+            METRICS.increment("listings", "errors")
+            num_errors += 1
+            continue
+        METRICS.observe("listings", "programmes_per_page", len(programme_urls))
+        num_programme_urls += len(programme_urls)
+        new_urls.extend(store.add(listing_url, programme_urls))
+    store.finish_crawl_run(run_id, len(listing_urls), num_errors)
+
+    print(f"-> Crawled {len(listing_urls):,} listing pages in {total_time:.1f}s ({len(listing_urls) / max(total_time, 1e-9):.2f} pages/sec).")
+    print(f"-> Collected {num_programme_urls:,} individual programme urls.")
+    return new_urls
+
+
+def main(args: argparse.Namespace):
+    start_metrics(args)
+
+    # keep one pooled connection available for every request in flight
+    configure_session(pool_size=args.concurrency)
 
-        time.sleep(0.5)
+    url_template = args.listing_url_template or PROGRAMME_LISTING_URL_TEMPLATE
+
+    if args.test:
+        print(f"-> ---- [TEST MODE] ----")
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    store = ProgrammeUrlStore(PROGRAMME_URL_STORE_DB)
+
+    if args.incremental and store.has_complete_sweep():
+        start_time = timer()
+        new_urls, num_pages_fetched = crawl_new_listing_pages(store, url_template, args.rate_limit)
+        print(f"-> Walked {num_pages_fetched:,} listing page(s) in {timer() - start_time:.1f}s.")
+    else:
+        if args.incremental:
+            print(f"-> no full crawl recorded in '{PROGRAMME_URL_STORE_DB}' has finished without errors; crawling every listing page")
+        new_urls = crawl_all_listing_pages(store, url_template, args.concurrency, args.rate_limit, test=args.test)
+    METRICS.increment("listings", "new_programmes", len(new_urls))
 
     # write all programme urls to csv file
-    all_programme_urls = pl.DataFrame(all_programme_urls, schema=["listing_url", "programme_url"])
-    all_programme_urls.write_csv(PROGRAMME_URLS_CSV)
-    print(f"-> Collected {len(all_programme_urls):,} individual programme urls. Saved to '{PROGRAMME_URLS_CSV}'.")
+    num_rows = store.export_csv(PROGRAMME_URLS_CSV)
+    store.close()
+    print(f"-> {len(new_urls):,} new programme urls ({num_rows:,} in total). Saved to '{PROGRAMME_URLS_CSV}'.")
+    finish_metrics()
     return
 
 
-if __name__ == '__main__':
-    main()
+if __name__ == "__main__":
+    args = parser.parse_args()
+    main(args)
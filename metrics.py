@@ -0,0 +1,203 @@
+import re
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from typing import TYPE_CHECKING, TypedDict
+from collections import defaultdict
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+
+## -- PIPELINE INSTRUMENTATION ----
+## -- stages record per-item observations (latency, bytes, realtime factor, ...) and counters (errors, retries, cache hits)
+## -- into one shared recorder, which streams every event to jsonl and summarises each stage with p50/p95/p99.
+## -- count, total and max are exact; quantiles come from a fixed-size uniform sample, so memory stays bounded on long runs
+
+QUANTILES = (0.5, 0.95, 0.99)
+RESERVOIR_SIZE = 10_000  # <- sampled values kept per (stage, metric)
+
+
+class ObservationSummary(TypedDict):
+    stage: str
+    metric: str
+    count: int
+    total: float
+    mean: float
+    p50: float
+    p95: float
+    p99: float
+    max: float
+
+
+def get_quantile(sorted_values: list[float], quantile: float) -> float:
+    """Nearest-rank quantile of already sorted values."""
+    rank = max(1, math.ceil(quantile * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Reservoir:
+    """Exact count, total and max of a stream of values, plus a uniform sample of at most `size` of them (algorithm R)."""
+
+    def __init__(self, size: int = RESERVOIR_SIZE, seed: int = 0):
+        self.size = size
+        self.count = 0
+        self.total = 0.0
+        self.max = -math.inf
+        self.values: list[float] = []
+        self.rng = random.Random(seed)
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        if len(self.values) < self.size:
+            self.values.append(value)
+            return
+        index = self.rng.randrange(self.count)
+        if index < self.size:
+            self.values[index] = value
+
+
+class MetricsRecorder:
+
+    def __init__(self, reservoir_size: int = RESERVOIR_SIZE):
+        self.lock = threading.Lock()
+        self.observations: dict[tuple[str, str], Reservoir] = defaultdict(lambda: Reservoir(reservoir_size))
+        self.counters: dict[tuple[str, str], float] = defaultdict(float)
+        self.jsonl_file = None
+        self.server: ThreadingHTTPServer | None = None
+
+    def open_jsonl(self, filepath: str) -> None:
+        self.jsonl_file = open(filepath, mode="a", buffering=1)  # <- line buffered; a killed run keeps its events
+
+    def _write_event(self, event: dict) -> None:
+        if self.jsonl_file is not None:
+            self.jsonl_file.write(json.dumps({"time": time.time(), **event}) + "\n")
+
+    def observe(self, stage: str, metric: str, value: float, **labels) -> None:
+        """Record one per-item measurement, e.g. `observe("parse", "parse_time", 0.004, file=...)`."""
+        with self.lock:
+            self.observations[(stage, metric)].add(value)
+            self._write_event({"type": "observation", "stage": stage, "metric": metric, "value": value, **labels})
+
+    def increment(self, stage: str, counter: str, amount: float = 1, **labels) -> None:
+        with self.lock:
+            self.counters[(stage, counter)] += amount
+            self._write_event({"type": "counter", "stage": stage, "metric": counter, "value": amount, **labels})
+
+    def summary(self) -> tuple[list[ObservationSummary], dict[tuple[str, str], float]]:
+        with self.lock:
+            observations = {key: (reservoir.count, reservoir.total, reservoir.max, sorted(reservoir.values)) for key, reservoir in self.observations.items()}
+            counters = dict(self.counters)
+
+        summaries = [
+            ObservationSummary(
+                stage=stage,
+                metric=metric,
+                count=count,
+                total=total,
+                mean=total / count,
+                p50=get_quantile(values, 0.5),
+                p95=get_quantile(values, 0.95),
+                p99=get_quantile(values, 0.99),
+                max=max_value
+            )
+            for (stage, metric), (count, total, max_value, values) in sorted(observations.items())
+        ]
+        return summaries, dict(sorted(counters.items()))
+
+    def format_summary(self) -> str:
+        summaries, counters = self.summary()
+        if not summaries and not counters:
+            return "-> No metrics recorded."
+
+        lines = [f"## Metrics\n{'-' * 35}"]
+        for summary in summaries:
+            lines.append(
+                f"| {summary['stage']:<16} {summary['metric']:<20} n={summary['count']:<7,} total={summary['total']:<10.3f} "
+                f"p50={summary['p50']:<9.4f} p95={summary['p95']:<9.4f} p99={summary['p99']:<9.4f} max={summary['max']:.4f}"
+            )
+        for (stage, counter), value in counters.items():
+            lines.append(f"| {stage:<16} {counter:<20} {value:,g}")
+        return "\n".join(lines)
+
+    def format_prometheus(self) -> str:
+        """Text exposition format: observations as summaries, counters as `_total` counters."""
+        summaries, counters = self.summary()
+        lines = []
+        for metric in sorted({summary["metric"] for summary in summaries}):
+            name = _get_prometheus_name(metric)
+            lines.append(f"# TYPE {name} summary")
+            for summary in (summary for summary in summaries if summary["metric"] == metric):
+                for quantile in QUANTILES:
+                    lines.append(f'{name}{{stage="{summary["stage"]}",quantile="{quantile}"}} {summary[f"p{round(quantile * 100)}"]}')
+                lines.append(f'{name}_sum{{stage="{summary["stage"]}"}} {summary["total"]}')
+                lines.append(f'{name}_count{{stage="{summary["stage"]}"}} {summary["count"]}')
+        for counter in sorted({counter for _, counter in counters}):
+            name = f"{_get_prometheus_name(counter)}_total"
+            lines.append(f"# TYPE {name} counter")
+            for (stage, other_counter), value in counters.items():
+                if other_counter == counter:
+                    lines.append(f'{name}{{stage="{stage}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def serve_prometheus(self, port: int, host: str = "127.0.0.1") -> None:
+        """Expose the metrics on `http://{host}:{port}/metrics` from a background thread."""
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler  # <- only with `--metrics-port`; slow to import
+        recorder = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = recorder.format_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self) -> None:
+        if self.jsonl_file is not None:
+            self.jsonl_file.close()
+            self.jsonl_file = None
+        if self.server is not None:
+            self.server.shutdown()
+            self.server = None
+
+
+def _get_prometheus_name(metric: str) -> str:
+    return "iot_" + re.sub(r"[^a-zA-Z0-9_]", "_", metric)
+
+
+# every stage records into this one recorder
+METRICS = MetricsRecorder()
+
+
+def add_metrics_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--metrics-file", type=str, default=None, help="Append every recorded metric event to this jsonl file.")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve Prometheus-style metrics on this local port while running.")
+
+
+def start_metrics(args: argparse.Namespace) -> None:
+    if args.metrics_file is not None:
+        METRICS.open_jsonl(args.metrics_file)
+    if args.metrics_port is not None:
+        METRICS.serve_prometheus(args.metrics_port)
+        print(f"-> Serving metrics on http://127.0.0.1:{args.metrics_port}/metrics")
+
+
+def finish_metrics() -> None:
+    print(METRICS.format_summary())
+    METRICS.close()
@@ -63,42 +63,48 @@ image = modal.Image.debian_slim().pip_install([
 ])
 image = image.apt_install("ffmpeg")  # for audio processing
 
-@app.function(gpu="any", image=image, timeout=10_000)
-def run_diarizer(filepath: str, hf_auth_token: str):
-    print(f"cuda available: {torch.cuda.is_available()}")
-    print(f"num devices: {torch.cuda.device_count()}")
-
-    pipeline = Pipeline.from_pretrained(
-    "pyannote/speaker-diarization-3.1",
-    use_auth_token=hf_auth_token
-    )
-    pipeline = pipeline.to(torch.device('cuda'))
-
-    print(f"| -> created diarization pipeline object")
-
-    # run the pipeline on an audio file
-    with ProgressHook() as hook:
-        diarization = pipeline(
-            filepath,
-            hook=hook
+@app.cls(gpu="any", image=image, timeout=10_000, secrets=[modal.Secret.from_dotenv()])
+class Diarizer:
+
+    @modal.enter()
+    def load_pipeline(self):
+        # runs once per container; every `run_diarizer` call on that container reuses the loaded pipeline
+        print(f"cuda available: {torch.cuda.is_available()}")
+        print(f"num devices: {torch.cuda.device_count()}")
+
+        self.pipeline = Pipeline.from_pretrained(
+            "pyannote/speaker-diarization-3.1",
+            use_auth_token=os.environ["HF_TOKEN"]
         )
-    print(f"| -> performed pipeline inference for audion file")
-    return diarization
+        self.pipeline = self.pipeline.to(torch.device('cuda'))
+        print(f"| -> created diarization pipeline object")
+
+    @modal.method()
+    def run_diarizer(self, filepath: str):
+        # run the pipeline on an audio file
+        with ProgressHook() as hook:
+            diarization = self.pipeline(
+                filepath,
+                hook=hook
+            )
+        print(f"| -> performed pipeline inference for audio file")
+        return diarization
 
 
 
 @app.local_entrypoint()
 def main():
-    HF_AUTH_TOKEN = os.environ["HF_TOKEN"]
-    filepath = "modal_test/p02q5kk7.wav"
+    filepaths = ["modal_test/p02q5kk7.wav"]
+    diarizer = Diarizer()
     start_timer = timer()
-    diarization = run_diarizer.remote(filepath, HF_AUTH_TOKEN)
+    # `map` fans the files out over containers, each loading the pipeline once
+    diarizations = list(diarizer.run_diarizer.map(filepaths))
     print(f"!! completed diarization in {(timer() - start_timer):.0f} secs")
 
-
     # dump the diarization output to disk using RTTM format
-    base_filename = os.path.basename(os.path.splitext(filepath)[0])
-    rttm_fileout = f"modal_test/{base_filename}.rttm"
-    with open(rttm_fileout, "w") as rttm:
-        diarization.write_rttm(rttm)
-    print(f"| -> saved output to rttm file")
+    for filepath, diarization in zip(filepaths, diarizations):
+        base_filename = os.path.basename(os.path.splitext(filepath)[0])
+        rttm_fileout = f"modal_test/{base_filename}.rttm"
+        with open(rttm_fileout, "w") as rttm:
+            diarization.write_rttm(rttm)
+    print(f"| -> saved output to rttm file(s)")
@@ -0,0 +1,86 @@
+import os
+import json
+import shutil
+from pathlib import Path
+
+import polars as pl
+
+from utils import get_timestamp
+
+
+## -- STREAMING PARQUET WRITER ----
+## -- batches are written to part files as they arrive, then streamed into a single parquet file on close
+
+class StreamingParquetWriter:
+
+    def __init__(self, output_filepath: Path | str, schema: pl.Schema, resume: bool = False):
+        self.output_filepath = str(output_filepath)
+        self.schema = schema
+        self.parts_dir = f"{os.path.splitext(self.output_filepath)[0]}_parts"
+        self.parts_manifest_filepath = os.path.join(self.parts_dir, "_manifest.json")
+        self.manifest_filepath = f"{os.path.splitext(self.output_filepath)[0]}.manifest.json"
+
+        if resume and os.path.exists(self.parts_manifest_filepath):
+            with open(self.parts_manifest_filepath, mode="r") as infile:
+                self.parts = json.load(infile)["parts"]
+        else:
+            # parts left behind by an interrupted run are discarded
+            shutil.rmtree(self.parts_dir, ignore_errors=True)
+            self.parts = []
+        os.makedirs(self.parts_dir, exist_ok=True)
+
+    @property
+    def num_rows(self) -> int:
+        return sum(part["rows"] for part in self.parts)
+
+    def _part_filepaths(self) -> list[str]:
+        return [os.path.join(self.parts_dir, part["file"]) for part in self.parts]
+
+    def get_written_values(self, column: str) -> set:
+        """Values of `column` already written to parts; used to skip completed work when resuming."""
+        if not self.parts:
+            return set()
+        return set(pl.scan_parquet(self._part_filepaths()).select(column).collect().to_series().to_list())
+
+    def _write_json(self, data: dict, filepath: str) -> None:
+        tmp_filepath = f"{filepath}.tmp"
+        with open(tmp_filepath, mode="w") as outfile:
+            json.dump(data, outfile, indent=2)
+        os.replace(tmp_filepath, filepath)
+
+    def write_part(self, frame: pl.DataFrame) -> None:
+        if frame.schema != self.schema:
+            raise ValueError(f"Batch schema does not match writer schema.\nExpected: {self.schema}\nGot: {frame.schema}")
+
+        part_filename = f"part-{len(self.parts):05d}.parquet"
+        part_filepath = os.path.join(self.parts_dir, part_filename)
+        frame.write_parquet(f"{part_filepath}.tmp")
+        os.replace(f"{part_filepath}.tmp", part_filepath)
+
+        self.parts.append({"file": part_filename, "rows": len(frame), "written_at": get_timestamp()})
+        self._write_json({"parts": self.parts}, self.parts_manifest_filepath)
+
+    def close(self, row_group_size: int | None = None, metadata: dict | None = None, sort_by: str | None = None) -> dict:
+        """Stream all parts into `output_filepath`, write the final manifest and remove the parts. Returns the manifest.
+        `sort_by` orders the output by a column, for writers whose parts arrive in no particular order."""
+        tmp_filepath = f"{self.output_filepath}.tmp"
+        if self.parts:
+            parts = pl.scan_parquet(self._part_filepaths())
+            if sort_by is not None:
+                parts = parts.sort(sort_by)
+            parts.sink_parquet(tmp_filepath, row_group_size=row_group_size)
+        else:
+            self.schema.to_frame().write_parquet(tmp_filepath)
+        os.replace(tmp_filepath, self.output_filepath)
+
+        manifest = {
+            "output": self.output_filepath,
+            "num_rows": self.num_rows,
+            "num_parts": len(self.parts),
+            "schema": {column: str(dtype) for column, dtype in self.schema.items()},
+            "completed_at": get_timestamp(),
+            **(metadata or {})
+        }
+        self._write_json(manifest, self.manifest_filepath)
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
+        return manifest
@@ -0,0 +1,81 @@
+import json
+import sqlite3
+import hashlib
+from pathlib import Path
+
+from utils import get_timestamp
+
+
+## -- PERSISTENT PARSE CACHE ----
+## -- parsed programme records keyed by (html content hash, parser backend, parser version, parser source hash)
+
+_MAX_QUERY_PARAMS = 500  # <- hashes per `IN (...)` query; stays under sqlite's bound-parameter limit
+
+def get_file_hash(filepath: Path | str) -> str:
+    with open(filepath, mode="rb") as infile:
+        return hashlib.file_digest(infile, "sha256").hexdigest()
+
+
+class ParseCache:
+
+    def __init__(self, filepath: Path | str, parser_name: str, parser_version: int, parser_source_hash: str = ""):
+        self.parser_name = parser_name
+        self.parser_version = parser_version
+        self.parser_source_hash = parser_source_hash
+        self.conn = sqlite3.connect(filepath)
+        with self.conn:
+            # caches written before the source hash was part of the key are dropped; they're rebuilt on the next parse
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(parsed_records)")]
+            if columns and "parser_source_hash" not in columns:
+                self.conn.execute("DROP TABLE parsed_records")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS parsed_records (
+                    content_hash TEXT NOT NULL,
+                    parser_name TEXT NOT NULL,
+                    parser_version INTEGER NOT NULL,
+                    parser_source_hash TEXT NOT NULL,
+                    record TEXT NOT NULL,
+                    parsed_at TEXT NOT NULL,
+                    PRIMARY KEY (content_hash, parser_name, parser_version, parser_source_hash)
+                )
+            """)
+            # records from older parser versions or sources can never be hit again
+            self.conn.execute(
+                "DELETE FROM parsed_records WHERE parser_name = ? AND (parser_version != ? OR parser_source_hash != ?)",
+                (parser_name, parser_version, parser_source_hash)
+            )
+
+    def get(self, content_hash: str) -> dict | None:
+        return self.get_many([content_hash]).get(content_hash)
+
+    def _select_many(self, column: str, content_hashes: list[str]) -> list[tuple]:
+        rows = []
+        for start in range(0, len(content_hashes), _MAX_QUERY_PARAMS):
+            batch = content_hashes[start:start + _MAX_QUERY_PARAMS]
+            rows.extend(self.conn.execute(
+                f"SELECT content_hash, {column} FROM parsed_records "
+                f"WHERE parser_name = ? AND parser_version = ? AND parser_source_hash = ? AND content_hash IN ({', '.join('?' * len(batch))})",
+                (self.parser_name, self.parser_version, self.parser_source_hash, *batch)
+            ))
+        return rows
+
+    def get_many(self, content_hashes: list[str]) -> dict[str, dict]:
+        """Cached records for whichever of `content_hashes` are in the cache, keyed by content hash."""
+        return {content_hash: json.loads(record) for content_hash, record in self._select_many("record", content_hashes)}
+
+    def get_cached_hashes(self, content_hashes: list[str]) -> set[str]:
+        return {content_hash for content_hash, _ in self._select_many("1", content_hashes)}
+
+    def put_many(self, records: dict[str, dict]) -> None:
+        parsed_at = get_timestamp()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO parsed_records VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (content_hash, self.parser_name, self.parser_version, self.parser_source_hash, json.dumps(record), parsed_at)
+                    for content_hash, record in records.items()
+                ]
+            )
+
+    def close(self) -> None:
+        self.conn.close()
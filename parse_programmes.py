@@ -1,54 +1,214 @@
 import os
 import argparse
-
-import polars as pl
-
-from utils import get_html_from_url, get_soup_from_file
-from programme import parse_programme_html_soup
+from pathlib import Path
+from typing import TypedDict, Iterator
+from functools import partial
+from timeit import default_timer as timer
+
+from work_queue import run_work_queue
+from html_archive import HTML_ARCHIVE_DIR, HtmlArchive, get_archive_reader
+from programme import ProgrammeRecord, PARSER_VERSION
+from programme_parsers import PARSER_BACKENDS, DEFAULT_PARSER_BACKEND, get_parser_backend, get_parser_source_hash
+from parse_cache import ParseCache
+from metrics import METRICS, add_metrics_arguments, start_metrics, finish_metrics
 
 parser = argparse.ArgumentParser()
 
 parser.add_argument("--test", action="store_true", help="Flag for testing on small number of html file.")
+parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of parsing processes. Use 1 to parse serially.")
+parser.add_argument("--chunksize", type=int, default=16, help="Number of pages handed to a worker process at a time.")
+parser.add_argument("--parser", type=str, choices=list(PARSER_BACKENDS), default=DEFAULT_PARSER_BACKEND, help="Html parsing backend.")
+parser.add_argument("--no-cache", action="store_true", help="Re-parse every page, ignoring (and not updating) the parse cache.")
+parser.add_argument("--batch-size", type=int, default=1_000, help="Number of parsed records written to disk at a time (also the output row group size).")
+parser.add_argument("--resume", action="store_true", help="Resume an interrupted run, skipping programmes already written to disk.")
+add_metrics_arguments(parser)
 
-args = parser.parse_args()
 
 ## set data directory
 DATA_DIR = "data"
-PROGRAMME_HTML_DIR = os.path.join(DATA_DIR, "programme_html")
-
-def main():
+PARSE_ERRORS_CSV = os.path.join(DATA_DIR, "parse_errors.csv")
+PARSE_CACHE_DB = os.path.join(DATA_DIR, "parse_cache.sqlite")
+PROGRAMME_DATA_PARQUET = os.path.join(DATA_DIR, "programme_data.parquet")
+
+
+class ParseResult(TypedDict):
+    programme_id: str
+    data: ProgrammeRecord | None
+    error: str | None
+    parse_time: float | None  # <- measured in the worker process; `None` for parse cache hits
+
+
+def parse_archived_programme(programme_id: str, archive_dir: str = HTML_ARCHIVE_DIR, parser_name: str = DEFAULT_PARSER_BACKEND) -> ParseResult:
+    """Reads the page through this process's own archive reader, so worker processes fetch pages themselves instead of
+    having them pickled across."""
+    start_time = timer()
+    try:
+        page = get_archive_reader(archive_dir).get(programme_id)
+        if page is None:
+            raise KeyError(f"'{programme_id}' is not in the html archive.")
+        data = get_parser_backend(parser_name).parse(page["html"])
+        return ParseResult(programme_id=programme_id, data=data, error=None, parse_time=timer() - start_time)
+    except Exception as e:
+        return ParseResult(programme_id=programme_id, data=None, error=f"{type(e).__name__}: {e}", parse_time=timer() - start_time)
+
+
+def record_parse_metrics(result: ParseResult) -> None:
+    # worker processes don't share the recorder, so results are recorded where they're collected
+    if result["error"] is not None:
+        METRICS.increment("parse", "errors")
+    if result["parse_time"] is None:
+        METRICS.increment("parse", "cache_hits")
+    else:
+        METRICS.observe("parse", "parse_time", result["parse_time"], programme_id=result["programme_id"])
+
+
+def iter_parse_programmes(programme_ids: list[str], archive_dir: str = HTML_ARCHIVE_DIR, workers: int = 1, chunksize: int = 16, parser_name: str = DEFAULT_PARSER_BACKEND) -> Iterator[ParseResult]:
+    """Parse archived pages across `workers` processes. Results are yielded as they complete, in the same order as `programme_ids`."""
+    assert isinstance(workers, int) and workers > 0, f"Input '{workers}' for argument `workers` must be a positive int."
+    parse_func = partial(parse_archived_programme, archive_dir=archive_dir, parser_name=parser_name)
+    if workers == 1:
+        yield from map(parse_func, programme_ids)
+        return
+
+    results = run_work_queue(parse_func, programme_ids, backend="process", workers=workers, chunksize=chunksize, ordered=True)
+    for result in results:
+        if result["error"] is not None:
+            # parse errors are caught in `parse_archived_programme`; this is the worker itself failing (e.g. the process died)
+            yield ParseResult(programme_id=result["item"], data=None, error=f"{type(result['error']).__name__}: {result['error']}", parse_time=result["duration"])
+            continue
+        yield result["result"]
+
+
+def iter_parse_programmes_with_cache(programme_ids: list[str], archive: HtmlArchive, cache: ParseCache, workers: int = 1, chunksize: int = 16, cache_batch_size: int = 500) -> Iterator[ParseResult]:
+    """Only parses pages whose content isn't already in `cache`; cached and freshly parsed records are merged back into `programme_ids` order.
+    Content hashes come from the archive index, so cache hits never touch the page itself."""
+    archived_hashes = archive.get_content_hashes()
+    content_hashes = [archived_hashes[programme_id] for programme_id in programme_ids]
+    cached_hashes = cache.get_cached_hashes(content_hashes)
+
+    uncached_programme_ids = [programme_id for programme_id, content_hash in zip(programme_ids, content_hashes) if content_hash not in cached_hashes]
+    print(f"-> {len(programme_ids) - len(uncached_programme_ids):,} pages found in parse cache; parsing {len(uncached_programme_ids):,} new or changed pages.")
+
+    # fresh results arrive in `uncached_programme_ids` order, so they can be interleaved with cache hits as they stream in
+    fresh_results = iter_parse_programmes(uncached_programme_ids, archive_dir=archive.archive_dir, workers=workers, chunksize=chunksize, parser_name=cache.parser_name)
+
+    new_records = {}
+    for start in range(0, len(programme_ids), cache_batch_size):
+        batch = list(zip(programme_ids[start:start + cache_batch_size], content_hashes[start:start + cache_batch_size]))
+        # one query for the cache hits of each batch, rather than one per page
+        cached_records = cache.get_many([content_hash for _, content_hash in batch if content_hash in cached_hashes])
+        for programme_id, content_hash in batch:
+            if content_hash in cached_hashes:
+                yield ParseResult(programme_id=programme_id, data=cached_records[content_hash], error=None, parse_time=None)
+                continue
+
+            result = next(fresh_results)
+            if result["error"] is None:
+                new_records[content_hash] = result["data"]
+                if len(new_records) >= cache_batch_size:
+                    cache.put_many(new_records)
+                    new_records = {}
+            yield result
+
+    cache.put_many(new_records)
+
+
+def save_parse_errors(parse_errors: list[dict], filepath: Path | str) -> bool:
+    """Write this run's errors to `filepath`, or remove the file left by an earlier run if there were none, so it
+    never reports errors that have since been fixed. Returns whether a file was written."""
+    import polars as pl
+    if not parse_errors:
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        return False
+    pl.DataFrame(parse_errors, schema=["programme_id", "error"]).write_csv(filepath)
+    return True
+
+
+def main(args: argparse.Namespace):
+    import polars as pl
+    from programme_queries import write_exploded_tables
+    from programme_schema import ProgrammeFrameBuilder, PROGRAMME_SCHEMA, BroadcastDateError
+    from parquet_writer import StreamingParquetWriter
+
+    start_metrics(args)
 
     if args.test:
         print(f"-> [TEST MODE] ----")
 
-    # get downloaded html files
-    programme_html_files = os.listdir(PROGRAMME_HTML_DIR)
-    print(f"-> Parsing {len(programme_html_files):,} programme html files.")
+    # archived pages; sorted so output row order is deterministic
+    archive = HtmlArchive(HTML_ARCHIVE_DIR, readonly=True)
+    programme_ids = archive.programme_ids()
+    print(f"-> Parsing {len(programme_ids):,} archived programme pages.")
 
     if args.test:
-        programme_html_files = programme_html_files[:5]
+        programme_ids = programme_ids[:5]
+
+    # parsed batches are written out as they fill, so an interrupted run keeps its progress
+    writer = StreamingParquetWriter(PROGRAMME_DATA_PARQUET, schema=PROGRAMME_SCHEMA, resume=args.resume)
+    if args.resume:
+        written_programme_ids = writer.get_written_values("programme_id")
+        programme_ids = [programme_id for programme_id in programme_ids if programme_id not in written_programme_ids]
+        print(f"-> Resuming; {len(written_programme_ids):,} programmes already written, {len(programme_ids):,} pages remaining.")
+
+    parse_cache = None
+    start_time = timer()
+    if args.no_cache:
+        parse_results = iter_parse_programmes(
+            programme_ids,
+            workers=args.workers,
+            chunksize=args.chunksize,
+            parser_name=args.parser
+        )
+    else:
+        parser_backend = get_parser_backend(args.parser)
+        parse_cache = ParseCache(PARSE_CACHE_DB, parser_name=parser_backend.name, parser_version=parser_backend.version, parser_source_hash=get_parser_source_hash())
+        parse_results = iter_parse_programmes_with_cache(
+            programme_ids,
+            archive=archive,
+            cache=parse_cache,
+            workers=args.workers,
+            chunksize=args.chunksize
+        )
+
+    # records are moved into columnar buffers as they stream in, and each full batch is written to disk
+    programme_frame_builder = ProgrammeFrameBuilder(batch_size=args.batch_size, on_batch=writer.write_part)
+    parse_errors = []
+    for result in parse_results:
+        record_parse_metrics(result)
+        if result["error"] is not None:
+            parse_errors.append({"programme_id": result["programme_id"], "error": result["error"]})
+            continue
+        try:
+            programme_frame_builder.append(result["programme_id"], result["data"])
+        except BroadcastDateError as e:
+            METRICS.increment("parse", "errors")
+            parse_errors.append({"programme_id": result["programme_id"], "error": f"{type(e).__name__}: {e}"})
 
-    error_counter = 0
-    all_parsed_programme_data = []
-    for file in programme_html_files:
-        soup = get_soup_from_file(os.path.join(PROGRAMME_HTML_DIR, file))
+    programme_frame_builder.flush()
+    total_time = timer() - start_time
+    if parse_cache is not None:
+        parse_cache.close()
+    archive.close()
 
-        try:
-            programme_data = parse_programme_html_soup(soup)
-            all_parsed_programme_data.append(programme_data)
-        except Exception as e:
-            print(f"!! error occurred when parsing file '{file}'.")
-            print(e)
-            error_counter += 1
+    manifest = writer.close(
+        row_group_size=args.batch_size,
+        metadata={"parser": args.parser, "parser_version": PARSER_VERSION, "parser_source_hash": get_parser_source_hash(), "num_errors": len(parse_errors)}
+    )
+
+    print(f"-> Parsed data for {manifest['num_rows']:,} programme episodes in {total_time:.1f}s ({len(programme_ids) / max(total_time, 1e-9):.1f} pages/sec, {args.workers} workers).")
+    print(f"-> {len(parse_errors)} errors.")
 
-    # convert parsed data to dataframe; save as parquet
-    programme_df = pl.DataFrame(all_parsed_programme_data)
-    print(f"-> Parsed data for {len(programme_df):,} programme episodes.")
-    print(f"-> {error_counter} errors.")
+    if save_parse_errors(parse_errors, PARSE_ERRORS_CSV):
+        print(f"-> Saved parse errors to '{PARSE_ERRORS_CSV}'.")
+    print(f"-> Saved programme data to '{PROGRAMME_DATA_PARQUET}'.")
 
-    programme_df.write_parquet(os.path.join(DATA_DIR, "programme_data.parquet"))
+    # flat credits / broadcasts tables for `programme_queries.py`
+    write_exploded_tables(PROGRAMME_DATA_PARQUET)
+    finish_metrics()
 
     return
 
 if __name__ == "__main__":
-    main()
+    args = parser.parse_args()
+    main(args)
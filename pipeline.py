@@ -0,0 +1,530 @@
+import os
+import random
+import argparse
+import threading
+from typing import Any, Callable, Literal, TypedDict
+from functools import partial
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from timeit import default_timer as timer
+
+from utils import configure_session, get_host
+from metrics import METRICS, add_metrics_arguments, start_metrics, finish_metrics
+from work_queue import RateLimiter, ThreadLocalStore
+from listings import PROGRAMME_URLS_CSV, PROGRAMME_URL_STORE_DB, PROGRAMME_LISTING_URL_TEMPLATE, format_listing_url, get_max_archive_page_number, collect_listed_programme_urls_from_single_page
+from collect_programme_html import FETCH_METADATA_DB, fetch_programme_page
+from html_archive import HTML_ARCHIVE_DIR, HtmlArchive, get_archive_reader
+from fetch_metadata import FetchMetadataStore
+from programme_url_store import ProgrammeUrlStore
+from parse_programmes import PARSE_CACHE_DB, PARSE_ERRORS_CSV, PROGRAMME_DATA_PARQUET, parse_archived_programme, save_parse_errors
+from parse_cache import ParseCache
+from programme import PARSER_VERSION
+from programme_parsers import PARSER_BACKENDS, DEFAULT_PARSER_BACKEND, get_parser_backend, get_parser_source_hash
+from download_audio_files import PROGRAMME_MP3_DIR, fetch_audio_file, record_audio_file
+from audio_manifest import AUDIO_MANIFEST_DB, AudioManifest
+from transcription import (
+    TRANSCRIPTION_BACKENDS,
+    DEFAULT_TRANSCRIPTION_BACKEND,
+    create_transcription_job,
+    is_complete_transcription,
+    init_worker,
+    run_transcription_job,
+    record_transcription_metrics
+)
+
+## NOTE: asyncio, the process pool and polars are slow to import, so they're imported where the pipeline runs and writes its
+## outputs; `--help` stays fast, and so does starting the spawned worker processes, which import this module.
+
+
+## -- PIPELINE RUNNER ----
+## -- stages are nodes of a DAG connected by bounded queues; every item a stage emits is handed to its downstream
+## -- stages straight away, so all stages run at once instead of each waiting on the previous stage's full output
+
+_STAGE_DONE = object()
+
+
+@dataclass
+class Stage:
+    name: str
+    func: Callable[[Any], list]                      # <- item -> items handed to every downstream stage; errors drop the item
+    inputs: list[str] = field(default_factory=list)  # <- upstream stage names; a stage without inputs is fed `seed` items
+    output: str | None = None                        # <- where the stage writes its results, for the run plan
+    workers: int = 1
+    executor: Literal["thread", "process"] = "thread"
+    initializer: Callable | None = None              # <- once per worker process, for `executor="process"`
+    initargs: tuple = ()
+    is_up_to_date: Callable[[Any], list | None] | None = None
+    """Cheap check run before `func`. Returns the item's downstream items if its output is already current (`func` is skipped), else `None`."""
+    rate_limit_url: Callable[[Any], str] | None = None
+    """Url an item is fetched from; requests are rate limited per host, across every stage."""
+    on_finish: Callable[[], None] | None = None      # <- called once the stage has processed its last item
+    on_output: Callable[[Any], None] | None = None   # <- called for every emitted item, in the main process (e.g. to record metrics)
+
+
+class StageReport(TypedDict):
+    name: str
+    num_items: int
+    num_processed: int
+    num_skipped: int
+    num_errors: int
+    num_emitted: int
+    busy_time: float       # <- summed over workers
+    first_item_at: float | None
+    finished_at: float | None
+    errors: list[tuple[str, str]]
+
+
+def _sort_stages(stages: list[Stage]) -> list[Stage]:
+    """Topological order; raises if a stage reads from an unknown stage or the stages form a cycle."""
+    stages_by_name = {stage.name: stage for stage in stages}
+    assert len(stages_by_name) == len(stages), "Stage names must be unique."
+    for stage in stages:
+        for input_name in stage.inputs:
+            if input_name not in stages_by_name:
+                raise ValueError(f"Stage '{stage.name}' reads from unknown stage '{input_name}'.")
+
+    ordered = []
+    visiting, visited = set(), set()
+
+    def visit(stage: Stage) -> None:
+        if stage.name in visited:
+            return
+        if stage.name in visiting:
+            raise ValueError(f"Stages form a cycle through '{stage.name}'.")
+        visiting.add(stage.name)
+        for input_name in stage.inputs:
+            visit(stages_by_name[input_name])
+        visiting.remove(stage.name)
+        visited.add(stage.name)
+        ordered.append(stage)
+
+    for stage in stages:
+        visit(stage)
+    return ordered
+
+
+class Pipeline:
+
+    def __init__(self, stages: list[Stage], requests_per_second: float = 2.0, queue_size: int = 1_000):
+        self.stages = _sort_stages(stages)
+        self.requests_per_second = requests_per_second
+        self.queue_size = queue_size  # <- bounds memory; a slow stage applies backpressure to the ones feeding it
+
+    def describe(self) -> str:
+        return "\n".join(
+            f"| {stage.name}: {' + '.join(stage.inputs) or 'seed'} -> {stage.output or '-'} ({stage.workers} {stage.executor} workers)"
+            for stage in self.stages
+        )
+
+    def run(self, seed: dict[str, list]) -> dict[str, StageReport]:
+        import asyncio
+        return asyncio.run(self._run(seed))
+
+    async def _run(self, seed: dict[str, list]) -> dict[str, StageReport]:
+        import asyncio
+        from concurrent.futures import ProcessPoolExecutor
+        from multiprocessing import get_context
+
+        loop = asyncio.get_running_loop()
+        start_time = timer()
+        # shared by every stage, so pages and mp3s from one host count against the same budget
+        rate_limiter = RateLimiter(self.requests_per_second)
+        queues = {stage.name: asyncio.Queue(maxsize=self.queue_size) for stage in self.stages}
+        downstream = {stage.name: [other.name for other in self.stages if stage.name in other.inputs] for stage in self.stages}
+        reports = {
+            stage.name: StageReport(name=stage.name, num_items=0, num_processed=0, num_skipped=0, num_errors=0, num_emitted=0, busy_time=0.0, first_item_at=None, finished_at=None, errors=[])
+            for stage in self.stages
+        }
+
+        # each stage gets its own threads, so thread-bound resources (e.g. sqlite connections) stay with one stage
+        thread_pools = {stage.name: ThreadPoolExecutor(max_workers=stage.workers, thread_name_prefix=stage.name) for stage in self.stages}
+        process_pools = {
+            stage.name: ProcessPoolExecutor(max_workers=stage.workers, mp_context=get_context("spawn"), initializer=stage.initializer, initargs=stage.initargs)
+            for stage in self.stages
+            if stage.executor == "process"
+        }
+
+        async def run_worker(stage: Stage) -> None:
+            report = reports[stage.name]
+            while True:
+                item = await queues[stage.name].get()
+                if item is _STAGE_DONE:
+                    return
+                report["num_items"] += 1
+                if report["first_item_at"] is None:
+                    report["first_item_at"] = timer() - start_time
+
+                try:
+                    item_start = timer()
+                    outputs = None
+                    if stage.is_up_to_date is not None:
+                        outputs = await loop.run_in_executor(thread_pools[stage.name], stage.is_up_to_date, item)
+
+                    if outputs is not None:
+                        report["num_skipped"] += 1
+                        METRICS.increment(stage.name, "up_to_date")
+                    else:
+                        if stage.rate_limit_url is not None:
+                            host = get_host(stage.rate_limit_url(item))
+                            while (wait_time := rate_limiter.reserve(host)) > 0:
+                                await asyncio.sleep(wait_time)
+                            item_start = timer()  # <- time spent waiting on the rate limit isn't work
+                        pool = process_pools.get(stage.name) or thread_pools[stage.name]
+                        outputs = await loop.run_in_executor(pool, stage.func, item)
+                        report["num_processed"] += 1
+                        METRICS.observe(stage.name, "item_time", timer() - item_start)
+                    report["busy_time"] += timer() - item_start
+                except Exception as e:
+                    report["num_errors"] += 1
+                    report["errors"].append((str(item), f"{type(e).__name__}: {e}"))
+                    METRICS.increment(stage.name, "errors")
+                    continue
+
+                if stage.on_output is not None:
+                    for output in outputs:
+                        stage.on_output(output)
+
+                for output in outputs:
+                    for name in downstream[stage.name]:
+                        await queues[name].put(output)
+                report["num_emitted"] += len(outputs)
+
+        async def run_stage(stage: Stage, upstream: list[asyncio.Task]) -> None:
+            workers = [asyncio.create_task(run_worker(stage)) for _ in range(stage.workers)]
+            if stage.inputs:
+                await asyncio.gather(*upstream)
+            else:
+                for item in seed.get(stage.name, []):
+                    await queues[stage.name].put(item)
+
+            # every upstream item is queued ahead of these, so workers only stop once the queue is drained
+            for _ in workers:
+                await queues[stage.name].put(_STAGE_DONE)
+            await asyncio.gather(*workers)
+
+            if stage.on_finish is not None:
+                await loop.run_in_executor(thread_pools[stage.name], stage.on_finish)
+            reports[stage.name]["finished_at"] = timer() - start_time
+
+        try:
+            tasks = {}
+            for stage in self.stages:  # <- topological order, so upstream tasks always exist
+                tasks[stage.name] = asyncio.create_task(run_stage(stage, [tasks[name] for name in stage.inputs]))
+            await asyncio.gather(*tasks.values())
+        finally:
+            for pool in [*thread_pools.values(), *process_pools.values()]:
+                pool.shutdown(wait=True, cancel_futures=True)
+        return reports
+
+
+def print_pipeline_report(reports: dict[str, StageReport], total_time: float) -> None:
+    print(f"## Pipeline finished in {total_time:.1f}s\n{'-' * 35}")
+    for report in reports.values():
+        active = f"{report['first_item_at']:.1f}s-{report['finished_at']:.1f}s" if report["first_item_at"] is not None else "no items"
+        print(
+            f"| {report['name']:<16} {report['num_items']:>6,} items | {report['num_processed']:>6,} processed | {report['num_skipped']:>6,} up to date "
+            f"| {report['num_errors']:>4,} errors | busy {report['busy_time']:.1f}s | active {active}"
+        )
+        for item, error in report["errors"][:5]:
+            print(f"!! {report['name']} | '{item}': {error}")
+
+
+## -- IN OUR TIME REFRESH ----
+## -- listings -> programme html -> parse -> programme data (parquet) + mp3 download -> transcription
+
+class _ProgrammeUrlCollector:
+    """Listings stage; drops programmes already seen on another listing page, then adds every url to the url store and
+    exports it to csv at the end."""
+
+    def __init__(self, output_filepath: str, store_filepath: str):
+        self.output_filepath = output_filepath
+        self.store_filepath = store_filepath
+        self.rows = []
+        self.seen = set()
+        self.lock = threading.Lock()
+
+    def collect(self, listing_url: str) -> list[dict]:
+        programme_urls = collect_listed_programme_urls_from_single_page(listing_url)
+        with self.lock:
+            new_rows = [{"listing_url": listing_url, "programme_url": url} for url in programme_urls if url not in self.seen]
+            self.seen.update(url for url in programme_urls)
+            self.rows.extend(new_rows)
+        return new_rows
+
+    def finish(self) -> None:
+        programme_urls_by_listing = {}
+        for row in self.rows:
+            programme_urls_by_listing.setdefault(row["listing_url"], []).append(row["programme_url"])
+
+        store = ProgrammeUrlStore(self.store_filepath)
+        for listing_url, programme_urls in programme_urls_by_listing.items():
+            store.add(listing_url, programme_urls)
+        store.export_csv(self.output_filepath)
+        store.close()
+
+
+class _ProgrammeDataSink:
+    """Single-worker stage that streams parsed records into the programme parquet file, filling the parse cache as it goes."""
+
+    def __init__(self, output_filepath: str, parse_cache: ThreadLocalStore | None, parser_name: str, batch_size: int = 1_000, cache_batch_size: int = 500):
+        from programme_schema import ProgrammeFrameBuilder, PROGRAMME_SCHEMA
+        from parquet_writer import StreamingParquetWriter
+
+        self.writer = StreamingParquetWriter(output_filepath, schema=PROGRAMME_SCHEMA)
+        self.builder = ProgrammeFrameBuilder(batch_size=batch_size, on_batch=self.writer.write_part)
+        self.parse_cache = parse_cache
+        self.parser_name = parser_name
+        self.batch_size = batch_size
+        self.cache_batch_size = cache_batch_size
+        self.new_records = {}
+
+    def write(self, parsed: dict) -> list:
+        self.builder.append(parsed["programme_id"], parsed["record"])
+        if self.parse_cache is not None and not parsed["cached"]:
+            self.new_records[parsed["content_hash"]] = parsed["record"]
+            if len(self.new_records) >= self.cache_batch_size:
+                self.parse_cache.get().put_many(self.new_records)
+                self.new_records = {}
+        return []
+
+    def finish(self) -> None:
+        self.builder.flush()
+        if self.parse_cache is not None:
+            self.parse_cache.get().put_many(self.new_records)
+        # records arrive in completion order; sorting keeps the output identical to `parse_programmes.py`
+        self.writer.close(row_group_size=self.batch_size, metadata={"parser": self.parser_name, "parser_version": PARSER_VERSION, "parser_source_hash": get_parser_source_hash()}, sort_by="programme_id")
+        from programme_queries import write_exploded_tables
+        write_exploded_tables(self.writer.output_filepath)
+
+
+def _parse_programme(programme_id: str, archive_dir: str, parser_name: str) -> list[dict]:
+    result = parse_archived_programme(programme_id, archive_dir=archive_dir, parser_name=parser_name)
+    if result["error"] is not None:
+        raise ValueError(result["error"])
+    content_hash = get_archive_reader(archive_dir).get_content_hash(programme_id)
+    return [{"programme_id": programme_id, "content_hash": content_hash, "record": result["data"], "cached": False, "parse_time": result["parse_time"]}]
+
+
+def _record_parsed_programme(parsed: dict) -> None:
+    if not parsed["cached"]:
+        METRICS.observe("parse", "parse_time", parsed["parse_time"], programme_id=parsed["programme_id"])
+
+
+def _get_cached_programme(programme_id: str, archive: HtmlArchive, parse_cache: ThreadLocalStore) -> list[dict] | None:
+    content_hash = archive.get_content_hash(programme_id)
+    record = parse_cache.get().get(content_hash)
+    if record is None:
+        return None
+    return [{"programme_id": programme_id, "content_hash": content_hash, "record": record, "cached": True}]
+
+
+class _AudioDownloader:
+    """Download stage; several programmes can share one mp3, which is only fetched once. Files go through the audio
+    manifest like `download_audio_files.py`: each is checked and hashed, and identical audio under a new url is stored once."""
+
+    def __init__(self, output_dir: str, manifest_filepath: str):
+        self.output_dir = output_dir
+        self.manifest = ThreadLocalStore(partial(AudioManifest, manifest_filepath))
+        self.claimed = set()
+        self.lock = threading.Lock()
+
+    def get_audio_url(self, parsed: dict) -> str:
+        return parsed["record"]["audio_url"]
+
+    def is_up_to_date(self, parsed: dict) -> list | None:
+        audio_url = parsed["record"]["audio_url"]
+        if audio_url is None:
+            return []
+        self.manifest.get().set_programme_urls({parsed["programme_id"]: audio_url})
+        with self.lock:
+            if audio_url in self.claimed:
+                return []
+            self.claimed.add(audio_url)
+        if self.manifest.get().is_stored(audio_url, self.output_dir):
+            return [os.path.join(self.output_dir, self.manifest.get().get(audio_url)["filename"])]
+        return None
+
+    def download(self, parsed: dict) -> list[str]:
+        from programme_schema import parse_duration_seconds
+        audio_file = fetch_audio_file(parsed["record"]["audio_url"], self.output_dir, parse_duration_seconds(parsed["record"]["duration"]))
+        # one download at a time looks for a duplicate and records the file, so two copies of the same audio can't both be kept
+        with self.lock:
+            audio_file = record_audio_file(self.manifest.get(), audio_file, self.output_dir)
+        return [os.path.join(self.output_dir, audio_file["filename"])]
+
+
+def _transcribe_audio_file(filepath: str, output_dir: str) -> list[dict]:
+    job = create_transcription_job(os.path.splitext(os.path.basename(filepath))[0], filepath)
+    result = run_transcription_job(job, output_dir)
+    if result["error"] is not None:
+        raise RuntimeError(result["error"])
+    return [result]
+
+
+def _get_existing_transcription(filepath: str, output_dir: str) -> list[str] | None:
+    output_filepath = os.path.join(output_dir, f"{os.path.splitext(os.path.basename(filepath))[0]}.json")
+    return [output_filepath] if is_complete_transcription(output_filepath) else None
+
+
+def build_refresh_pipeline(
+    data_dir: str = "data",
+    concurrency: int = 8,
+    requests_per_second: float = 2.0,
+    parse_workers: int = os.cpu_count(),
+    parser_name: str = DEFAULT_PARSER_BACKEND,
+    use_parse_cache: bool = True,
+    download_workers: int = 4,
+    force: bool = False,
+    transcription_backend: str | None = None,
+    transcription_model: str | None = None,
+    transcription_workers: int = 1,
+    transcription_dir: str | None = None
+) -> Pipeline:
+    """Every stage of the manual scripts as one streaming pipeline. Output locations match the scripts, relative to `data_dir`.
+    Transcription is only included with a `transcription_backend`."""
+    archive_dir = os.path.join(data_dir, os.path.relpath(HTML_ARCHIVE_DIR, "data"))
+    audio_dir = os.path.join(data_dir, os.path.relpath(PROGRAMME_MP3_DIR, "data"))
+    os.makedirs(audio_dir, exist_ok=True)
+    # one writer shared by the fetch threads; parse workers open their own readers
+    archive = HtmlArchive(archive_dir)
+
+    fetch_metadata = FetchMetadataStore(os.path.join(data_dir, os.path.basename(FETCH_METADATA_DB)))
+    run_id = fetch_metadata.start_run()
+    fetch_metadata.close()
+    fetch_metadata = ThreadLocalStore(partial(FetchMetadataStore, os.path.join(data_dir, os.path.basename(FETCH_METADATA_DB))))
+
+    parse_cache = None
+    if use_parse_cache:
+        parser_backend = get_parser_backend(parser_name)
+        parse_cache = ThreadLocalStore(partial(ParseCache, os.path.join(data_dir, os.path.basename(PARSE_CACHE_DB)), parser_backend.name, parser_backend.version, get_parser_source_hash()))
+
+    url_collector = _ProgrammeUrlCollector(
+        os.path.join(data_dir, os.path.basename(PROGRAMME_URLS_CSV)),
+        os.path.join(data_dir, os.path.basename(PROGRAMME_URL_STORE_DB))
+    )
+    programme_data = _ProgrammeDataSink(os.path.join(data_dir, os.path.basename(PROGRAMME_DATA_PARQUET)), parse_cache, parser_name)
+    audio_downloader = _AudioDownloader(audio_dir, os.path.join(data_dir, os.path.basename(AUDIO_MANIFEST_DB)))
+
+    stages = [
+        Stage(
+            name="listings",
+            func=url_collector.collect,
+            output=url_collector.output_filepath,
+            workers=concurrency,
+            rate_limit_url=lambda listing_url: listing_url,
+            on_finish=url_collector.finish
+        ),
+        Stage(
+            name="programme_html",
+            func=lambda row: [fetch_programme_page(row["programme_url"], fetch_metadata.get(), run_id, archive, force=force)[0]],
+            inputs=["listings"],
+            output=archive_dir,
+            workers=concurrency,
+            rate_limit_url=lambda row: row["programme_url"]
+        ),
+        Stage(
+            name="parse",
+            func=partial(_parse_programme, archive_dir=archive_dir, parser_name=parser_name),
+            inputs=["programme_html"],
+            workers=parse_workers,
+            executor="process",
+            is_up_to_date=partial(_get_cached_programme, archive=archive, parse_cache=parse_cache) if parse_cache is not None else None,
+            on_finish=archive.close,
+            on_output=_record_parsed_programme
+        ),
+        Stage(
+            name="programme_data",
+            func=programme_data.write,
+            inputs=["parse"],
+            output=programme_data.writer.output_filepath,
+            on_finish=programme_data.finish
+        ),
+        Stage(
+            name="audio",
+            func=audio_downloader.download,
+            inputs=["parse"],
+            output=audio_dir,
+            workers=download_workers,
+            is_up_to_date=audio_downloader.is_up_to_date,
+            rate_limit_url=audio_downloader.get_audio_url
+        ),
+    ]
+
+    if transcription_backend is not None:
+        transcription_dir = transcription_dir or os.path.join(data_dir, "transcriptions")
+        os.makedirs(transcription_dir, exist_ok=True)
+        stages.append(Stage(
+            name="transcription",
+            func=partial(_transcribe_audio_file, output_dir=transcription_dir),
+            inputs=["audio"],
+            output=transcription_dir,
+            workers=transcription_workers,
+            executor="process",
+            initializer=init_worker,
+            initargs=(transcription_backend, transcription_model),
+            is_up_to_date=partial(_get_existing_transcription, output_dir=transcription_dir),
+            on_output=record_transcription_metrics
+        ))
+
+    # one pooled connection for every request that can be in flight
+    configure_session(pool_size=2 * concurrency + download_workers)
+    return Pipeline(stages, requests_per_second=requests_per_second)
+
+
+parser = argparse.ArgumentParser(description="Refresh the whole dataset in one streaming run: listings, programme pages, programme data, mp3s and (optionally) transcriptions.")
+parser.add_argument("--data-dir", type=str, default="data")
+parser.add_argument("--test", action="store_true", help="Only crawl a small number of listing pages.")
+parser.add_argument("--listing-url-template", type=str, default=PROGRAMME_LISTING_URL_TEMPLATE, help="Listing page url with a `{page_num}` placeholder.")
+parser.add_argument("--concurrency", type=int, default=8, help="Listing and programme pages in flight at once.")
+parser.add_argument("--rate-limit", type=float, default=2.0, help="Maximum requests per second sent to each host, across all stages.")
+parser.add_argument("--parse-workers", type=int, default=os.cpu_count())
+parser.add_argument("--parser", type=str, choices=list(PARSER_BACKENDS), default=DEFAULT_PARSER_BACKEND)
+parser.add_argument("--no-cache", action="store_true", help="Re-parse every page, ignoring the parse cache.")
+parser.add_argument("--download-workers", type=int, default=4)
+parser.add_argument("--force", action="store_true", help="Re-download every programme page, ignoring stored ETag/Last-Modified metadata.")
+parser.add_argument("--transcribe", action="store_true", help="Also transcribe each mp3 as it is downloaded.")
+parser.add_argument("--transcription-backend", type=str, choices=list(TRANSCRIPTION_BACKENDS), default=DEFAULT_TRANSCRIPTION_BACKEND)
+parser.add_argument("--transcription-model", type=str, default=None)
+parser.add_argument("--transcription-workers", type=int, default=1)
+add_metrics_arguments(parser)
+
+
+def main(args: argparse.Namespace):
+    start_metrics(args)
+
+    pipeline = build_refresh_pipeline(
+        data_dir=args.data_dir,
+        concurrency=args.concurrency,
+        requests_per_second=args.rate_limit,
+        parse_workers=args.parse_workers,
+        parser_name=args.parser,
+        use_parse_cache=not args.no_cache,
+        download_workers=args.download_workers,
+        force=args.force,
+        transcription_backend=args.transcription_backend if args.transcribe else None,
+        transcription_model=args.transcription_model,
+        transcription_workers=args.transcription_workers
+    )
+    print(pipeline.describe())
+
+    start_time = timer()
+    max_page = get_max_archive_page_number(args.listing_url_template)
+    page_numbers = list(range(0, max_page + 1))
+    random.shuffle(page_numbers)
+    if args.test:
+        print(f"-> ---- [TEST MODE] ----")
+        page_numbers = page_numbers[:5]
+
+    reports = pipeline.run({"listings": [format_listing_url(page_num, args.listing_url_template) for page_num in page_numbers]})
+    print_pipeline_report(reports, timer() - start_time)
+
+    parse_errors_csv = os.path.join(args.data_dir, os.path.basename(PARSE_ERRORS_CSV))
+    parse_errors = [{"programme_id": programme_id, "error": error} for programme_id, error in reports["parse"]["errors"]]
+    if save_parse_errors(parse_errors, parse_errors_csv):
+        print(f"-> Saved parse errors to '{parse_errors_csv}'.")
+    finish_metrics()
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    main(args)
@@ -1,8 +1,14 @@
+from __future__ import annotations
+
 import re
-from typing import TypedDict
+from typing import TYPE_CHECKING, TypedDict
 
-from bs4 import BeautifulSoup
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup  # <- only for annotations; callers build the soup
 
+# NOTE: edits to this file, `programme_parsers.py` or `programme_lxml.py` invalidate the parse cache by themselves (see
+# `programme_parsers.get_parser_source_hash`); bump this when output changes because of code anywhere else
+PARSER_VERSION = 1
 
 ## -- PROGRAMME PAGE PARSING ----
 
@@ -14,7 +20,7 @@ def get_title(programme_html: BeautifulSoup) -> str:
         .get_text(strip=True)
     )
 
-def get_duration(programme_html: BeautifulSoup) -> int:
+def get_duration(programme_html: BeautifulSoup) -> str:
     """Show duration. Can be desribed in minutes (e.g., '43 minutes') or in hours (e.g., '1 hour')."""
     duration = (
         programme_html
@@ -51,7 +57,7 @@ class BroadcastTime(TypedDict):
     date: str
     time: str
 
-def get_previous_broadcasts(programme_html: BeautifulSoup) -> list[dict]:
+def get_previous_broadcasts(programme_html: BeautifulSoup) -> list[BroadcastTime] | None:
     prev_broadcast_tags = (
         programme_html
         .find("div", {"id": "broadcasts"})
@@ -72,17 +78,23 @@ def get_previous_broadcasts(programme_html: BeautifulSoup) -> list[dict]:
 
 
 
-def get_credits(programme_html: BeautifulSoup) -> list[dict] | None:
+class Credit(TypedDict):
+    role: str
+    name: str
+
+def get_credits(programme_html: BeautifulSoup) -> list[Credit] | None:
     credits_tag = programme_html.find("div", {"id": "credits"})
     if credits_tag:
         extracted_credits = []
         credits_table_rows = credits_tag.find("table").find("tbody").find_all("tr")
         for table_row in credits_table_rows:
             row_data = table_row.find_all("td")
-            extracted_credits.append({
-                "role": row_data[0].get_text(strip=True),
-                "name": row_data[1].get_text(strip=True)
-            })
+            extracted_credits.append(
+                Credit(
+                    role=row_data[0].get_text(strip=True),
+                    name=row_data[1].get_text(strip=True)
+                )
+            )
         return extracted_credits
     return
 
@@ -105,34 +117,51 @@ def get_featured_collections(programme_html: BeautifulSoup) -> list[FeaturedColl
         return feature_collections
     return None
 
-def get_related_links(programme_html: BeautifulSoup) -> list[dict] | None:
+class RelatedLink(TypedDict):
+    title: str
+    url: str
+
+def get_related_links(programme_html: BeautifulSoup) -> list[RelatedLink] | None:
     related_links_section = programme_html.find("div", {"id": "related_links"})
     if related_links_section:
         links_list = related_links_section.find("ul").find_all("li")
         related_links = []
         for list_item in links_list:
-            related_links.append({
-                "title": list_item.find("a").get_text(strip=True),
-                "url": list_item.find("a").get("href")
-            })
+            related_links.append(
+                RelatedLink(
+                    title=list_item.find("a").get_text(strip=True),
+                    url=list_item.find("a").get("href")
+                )
+            )
         return related_links
     return
 
 
-def parse_programme_html_soup(programme_html: BeautifulSoup) -> dict:
-    # FIXME: create typed dictionary over std dict
-    return {
-        "title": get_title(programme_html),
-        "duration": get_duration(programme_html),
-        "short_description": get_short_description(programme_html),
-        "long_description": get_long_description(programme_html),
-        "audio_url": get_download_url(programme_html),
-        "photo_url": get_cover_photo_url(programme_html),
-        "previous_broadcasts": get_previous_broadcasts(programme_html),
-        "credits": get_credits(programme_html), # <- older episodes do not have this section
-        "featured_collections": get_featured_collections(programme_html),
-        "related_links": get_related_links(programme_html)
-    }
+class ProgrammeRecord(TypedDict):
+    title: str
+    duration: str
+    short_description: str
+    long_description: str
+    audio_url: str | None
+    photo_url: str
+    previous_broadcasts: list[BroadcastTime] | None
+    credits: list[Credit] | None
+    featured_collections: list[FeaturedCollection] | None
+    related_links: list[RelatedLink] | None
+
+def parse_programme_html_soup(programme_html: BeautifulSoup) -> ProgrammeRecord:
+    return ProgrammeRecord(
+        title=get_title(programme_html),
+        duration=get_duration(programme_html),
+        short_description=get_short_description(programme_html),
+        long_description=get_long_description(programme_html),
+        audio_url=get_download_url(programme_html),
+        photo_url=get_cover_photo_url(programme_html),
+        previous_broadcasts=get_previous_broadcasts(programme_html),
+        credits=get_credits(programme_html), # <- older episodes do not have this section
+        featured_collections=get_featured_collections(programme_html),
+        related_links=get_related_links(programme_html)
+    )
 
 '''
 def get_programme_data_from_url(url: str) -> dict:
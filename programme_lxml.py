@@ -0,0 +1,139 @@
+from lxml import etree, html as lxml_html
+
+from programme import ProgrammeRecord, BroadcastTime, Credit, FeaturedCollection, RelatedLink
+
+
+## -- LXML PROGRAMME PAGE PARSING ----
+## -- parses the page once into an lxml tree and extracts every field with pre-compiled xpath expressions;
+## -- output matches the bs4 getters in `programme.py`
+
+def _has_class(class_name: str) -> str:
+    # equivalent of bs4's `{"class": class_name}` match against a multi-valued class attribute
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')"
+
+_TEXT_NODES = etree.XPath("descendant::text()[not(parent::script or parent::style or parent::template)]")
+
+_TITLE_CONTAINER = etree.XPath(f"(//div[{_has_class('island')}])[1]")
+_TITLE = etree.XPath(f"(descendant::h1[{_has_class('no-margin')}])[1]")
+_DURATION_CONTAINER = etree.XPath(f"(//div[{_has_class('map__intro')}])[1]")
+_SHORT_DESCRIPTION_CONTAINER = etree.XPath(f"(//div[{_has_class('synopsis-toggle__short')}])[1]")
+_LONG_DESCRIPTION = etree.XPath(f"(//div[{_has_class('synopsis-toggle__long')}])[1]")
+_DOWNLOAD_BUTTON = etree.XPath(f"(//div[{_has_class('buttons__download')}])[1]")
+_COVER_PHOTO = etree.XPath(f"(//img[{_has_class('image')}])[1]")
+_BROADCASTS_SECTION = etree.XPath("(//div[@id='broadcasts'])[1]")
+_BROADCAST_TIMES = etree.XPath(f"descendant::div[{_has_class('broadcast-event__time')}]")
+_CREDITS_SECTION = etree.XPath("(//div[@id='credits'])[1]")
+_COLLECTIONS_SECTION = etree.XPath("(//div[@id='collections'])[1]")
+_COLLECTION_TITLE = etree.XPath(f"(descendant::span[{_has_class('programme__title')}])[1]")
+_COLLECTION_DESCRIPTION = etree.XPath(f"(descendant::p[{_has_class('programme__synopsis')}])[1]")
+_RELATED_LINKS_SECTION = etree.XPath("(//div[@id='related_links'])[1]")
+
+_FIRST_P = etree.XPath("(descendant::p)[1]")
+_FIRST_A = etree.XPath("(descendant::a)[1]")
+_FIRST_UL = etree.XPath("(descendant::ul)[1]")
+_FIRST_TABLE_BODY_ROWS = etree.XPath("(descendant::table)[1]/descendant::tbody[1]/descendant::tr")
+_ALL_P = etree.XPath("descendant::p")
+_ALL_LI = etree.XPath("descendant::li")
+_ALL_TD = etree.XPath("descendant::td")
+_ALL_SPAN = etree.XPath("descendant::span")
+
+
+def _get_text(element, separator: str = "") -> str:
+    # matches bs4's `get_text(strip=True, separator=...)`
+    stripped_strings = [text.strip() for text in _TEXT_NODES(element)]
+    return separator.join(text for text in stripped_strings if text)
+
+
+def _find(xpath: etree.XPath, element, description: str):
+    matches = xpath(element)
+    if not matches:
+        raise ValueError(f"Unable to find {description}.")
+    return matches[0]
+
+
+def get_previous_broadcasts(tree) -> list[BroadcastTime] | None:
+    broadcasts_section = _find(_BROADCASTS_SECTION, tree, "broadcasts section")
+    prev_broadcast_tags = _BROADCAST_TIMES(broadcasts_section)
+    if not prev_broadcast_tags:
+        return None
+
+    extracted_prev_broadcast_data = []
+    for tag in prev_broadcast_tags:
+        text_spans = _ALL_SPAN(tag)
+        extracted_prev_broadcast_data.append(
+            BroadcastTime(date=_get_text(text_spans[0]), time=_get_text(text_spans[1]))
+        )
+    return extracted_prev_broadcast_data
+
+
+def get_credits(tree) -> list[Credit] | None:
+    credits_section = _CREDITS_SECTION(tree)
+    if not credits_section:
+        return None
+
+    extracted_credits = []
+    for table_row in _FIRST_TABLE_BODY_ROWS(credits_section[0]):
+        row_data = _ALL_TD(table_row)
+        extracted_credits.append(
+            Credit(role=_get_text(row_data[0]), name=_get_text(row_data[1]))
+        )
+    return extracted_credits
+
+
+def get_featured_collections(tree) -> list[FeaturedCollection] | None:
+    collections_section = _COLLECTIONS_SECTION(tree)
+    if not collections_section:
+        return None
+
+    collections_list = _ALL_LI(_find(_FIRST_UL, collections_section[0], "collections list"))
+    return [
+        FeaturedCollection(
+            title=_get_text(_find(_COLLECTION_TITLE, collection, "collection title")),
+            description=_get_text(_find(_COLLECTION_DESCRIPTION, collection, "collection description"))
+        )
+        for collection in collections_list
+    ]
+
+
+def get_related_links(tree) -> list[RelatedLink] | None:
+    related_links_section = _RELATED_LINKS_SECTION(tree)
+    if not related_links_section:
+        return None
+
+    related_links = []
+    for list_item in _ALL_LI(_find(_FIRST_UL, related_links_section[0], "related links list")):
+        link = _find(_FIRST_A, list_item, "related link")
+        related_links.append(
+            RelatedLink(title=_get_text(link), url=link.get("href"))
+        )
+    return related_links
+
+
+def parse_programme_html_lxml(html: str) -> ProgrammeRecord:
+    try:
+        tree = lxml_html.document_fromstring(html)
+    except ValueError:
+        # lxml refuses str input that carries an xml encoding declaration
+        tree = lxml_html.document_fromstring(html.encode("utf-8"))
+
+    title_container = _find(_TITLE_CONTAINER, tree, "title container")
+
+    duration_container = _DURATION_CONTAINER(tree)
+    if not duration_container:
+        raise ValueError(f"Unable to extract duration...")
+
+    short_description_container = _find(_SHORT_DESCRIPTION_CONTAINER, tree, "short description")
+    download_button = _DOWNLOAD_BUTTON(tree)
+
+    return ProgrammeRecord(
+        title=_get_text(_find(_TITLE, title_container, "title")),
+        duration=_get_text(_ALL_P(duration_container[0])[1]),
+        short_description=_get_text(_find(_FIRST_P, short_description_container, "short description text")),
+        long_description=_get_text(_find(_LONG_DESCRIPTION, tree, "long description"), separator="\n"),
+        audio_url=f"https:{_find(_FIRST_A, download_button[0], 'download link').get('href')}" if download_button else None,
+        photo_url=_find(_COVER_PHOTO, tree, "cover photo").get("src"),
+        previous_broadcasts=get_previous_broadcasts(tree),
+        credits=get_credits(tree),
+        featured_collections=get_featured_collections(tree),
+        related_links=get_related_links(tree)
+    )
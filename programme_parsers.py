@@ -0,0 +1,120 @@
+import sys
+import hashlib
+import importlib.util
+from typing import Protocol
+from functools import cache
+from timeit import default_timer as timer
+
+from html_archive import HtmlArchive
+from programme import ProgrammeRecord, PARSER_VERSION
+
+
+## -- PARSER BACKEND INTERFACE ----
+## -- bs4 and lxml are only imported when a backend is created, so the registry can be read (e.g. to build a CLI) without them
+
+class ProgrammeParser(Protocol):
+    name: str
+    version: int
+
+    def parse(self, html: str) -> ProgrammeRecord:
+        ...
+
+
+class BeautifulSoupProgrammeParser:
+    """Reference backend; wraps the getters in `programme.py`."""
+    name = "bs4"
+    version = PARSER_VERSION
+
+    def __init__(self):
+        from bs4 import BeautifulSoup
+        from programme import parse_programme_html_soup
+        self._BeautifulSoup = BeautifulSoup
+        self._parse_soup = parse_programme_html_soup
+
+    def parse(self, html: str) -> ProgrammeRecord:
+        return self._parse_soup(self._BeautifulSoup(html, features="lxml"))
+
+
+class LxmlProgrammeParser:
+    """Parses the page once into an lxml tree and extracts every field with pre-compiled xpath expressions (see `programme_lxml.py`)."""
+    name = "lxml"
+    version = PARSER_VERSION
+
+    def __init__(self):
+        from programme_lxml import parse_programme_html_lxml
+        self._parse_lxml = parse_programme_html_lxml
+
+    def parse(self, html: str) -> ProgrammeRecord:
+        return self._parse_lxml(html)
+
+
+## -- BACKEND REGISTRY ----
+
+PARSER_BACKENDS: dict[str, type[ProgrammeParser]] = {
+    BeautifulSoupProgrammeParser.name: BeautifulSoupProgrammeParser,
+    LxmlProgrammeParser.name: LxmlProgrammeParser,
+}
+
+DEFAULT_PARSER_BACKEND = BeautifulSoupProgrammeParser.name
+
+
+def get_parser_backend(name: str = DEFAULT_PARSER_BACKEND) -> ProgrammeParser:
+    if name not in PARSER_BACKENDS:
+        raise ValueError(f"Unknown parser backend '{name}'. Available backends: {list(PARSER_BACKENDS)}.")
+    return PARSER_BACKENDS[name]()
+
+
+## -- PARSER SOURCE HASH ----
+## -- part of the parse cache key, so editing the extraction code invalidates cached records without a manual
+## -- `PARSER_VERSION` bump. the files are read rather than imported, so computing it doesn't pull in bs4 or lxml
+
+PARSER_SOURCE_MODULES = ["programme", "programme_parsers", "programme_lxml"]
+
+
+@cache
+def get_parser_source_hash() -> str:
+    source_hash = hashlib.sha256()
+    for module_name in PARSER_SOURCE_MODULES:
+        with open(importlib.util.find_spec(module_name).origin, mode="rb") as infile:
+            source_hash.update(infile.read())
+    return source_hash.hexdigest()[:16]
+
+
+## -- PARITY CHECK + TIMING ACROSS BACKENDS ----
+## -- usage: python programme_parsers.py data/programme_html_archive
+## -- (tests/test_programme_parsers.py runs the same parity check over the saved pages in tests/fixtures/)
+
+def compare_backends(archive_dir: str) -> None:
+    archive = HtmlArchive(archive_dir, readonly=True)
+    pages = list(archive.iter_pages())
+    archive.close()
+    programme_ids = [page["programme_id"] for page in pages]
+    html_pages = [page["html"] for page in pages]
+
+    backends = [backend() for backend in PARSER_BACKENDS.values()]
+    reference = backends[0]
+
+    outputs = {}
+    for backend in backends:
+        start_time = timer()
+        backend_outputs = []
+        for html in html_pages:
+            try:
+                backend_outputs.append(backend.parse(html))
+            except Exception:
+                backend_outputs.append(None)  # <- both backends should fail on the same pages
+        total_time = timer() - start_time
+        outputs[backend.name] = backend_outputs
+        print(f"-> {backend.name}: {1000 * total_time / max(1, len(html_pages)):.2f}ms per page ({len(html_pages):,} pages)")
+
+    num_mismatches = 0
+    for backend in backends[1:]:
+        for programme_id, expected, actual in zip(programme_ids, outputs[reference.name], outputs[backend.name]):
+            if expected != actual:
+                num_mismatches += 1
+                print(f"!! '{backend.name}' output differs from '{reference.name}' for programme '{programme_id}'.")
+    print(f"-> {num_mismatches} mismatches.")
+
+
+if __name__ == "__main__":
+    compare_backends(sys.argv[1])
@@ -0,0 +1,213 @@
+import os
+import argparse
+from pathlib import Path
+from timeit import default_timer as timer
+
+import polars as pl
+
+
+## -- PROGRAMME DATA QUERIES ----
+## -- lazy queries over `programme_data.parquet`: each one is built on `pl.scan_parquet`, so filters and column selections
+## -- are pushed down into the parquet reader and only the row groups and columns a query needs are read. credits and
+## -- broadcasts are also written out pre-exploded (one row per credit / broadcast), so contributor and year queries
+## -- filter a flat table instead of exploding the nested lists of every programme each time
+
+DATA_DIR = "data"
+PROGRAMME_DATA_PARQUET = os.path.join(DATA_DIR, "programme_data.parquet")
+PROGRAMME_CREDITS_PARQUET = os.path.join(DATA_DIR, "programme_credits.parquet")
+PROGRAMME_BROADCASTS_PARQUET = os.path.join(DATA_DIR, "programme_broadcasts.parquet")
+
+DEFAULT_COLUMNS = ["programme_id", "title", "duration_seconds"]
+
+
+def scan_programmes(programme_data_path: Path | str = PROGRAMME_DATA_PARQUET) -> pl.LazyFrame:
+    return pl.scan_parquet(programme_data_path)
+
+
+#### -- EXPLODED TABLES ----
+
+def explode_credits(programmes: pl.LazyFrame) -> pl.LazyFrame:
+    """One row per credit: programme_id, role, name."""
+    return (
+        programmes
+        .select("programme_id", "credits")
+        .explode("credits")
+        .drop_nulls("credits")
+        .unnest("credits")
+    )
+
+
+def explode_broadcasts(programmes: pl.LazyFrame) -> pl.LazyFrame:
+    """One row per broadcast: programme_id, date, time, year, plus whether it was the programme's first broadcast."""
+    return (
+        programmes
+        .select("programme_id", "previous_broadcasts")
+        .explode("previous_broadcasts")
+        .drop_nulls("previous_broadcasts")
+        .unnest("previous_broadcasts")
+        .with_columns(year=pl.col("date").dt.year())
+        .with_columns(is_first=(pl.col("date") == pl.col("date").min().over("programme_id")).fill_null(False))
+    )
+
+
+EXPLODED_TABLES = {
+    PROGRAMME_CREDITS_PARQUET: explode_credits,
+    PROGRAMME_BROADCASTS_PARQUET: explode_broadcasts,
+}
+
+
+def get_table_path(table_path: Path | str, programme_data_path: Path | str) -> str:
+    # exploded tables live next to whichever programme data file they were built from
+    return os.path.join(os.path.dirname(programme_data_path), os.path.basename(table_path))
+
+
+def _is_up_to_date(table_path: str, programme_data_path: Path | str) -> bool:
+    return os.path.exists(table_path) and os.path.getmtime(table_path) >= os.path.getmtime(programme_data_path)
+
+
+def write_exploded_tables(programme_data_path: Path | str = PROGRAMME_DATA_PARQUET) -> dict[str, int]:
+    """(Re)write the credits and broadcasts tables from the programme data. Returns the number of rows in each."""
+    num_rows = {}
+    for table_path, explode in EXPLODED_TABLES.items():
+        table_path = get_table_path(table_path, programme_data_path)
+        tmp_filepath = f"{table_path}.tmp"
+        explode(scan_programmes(programme_data_path)).sink_parquet(tmp_filepath)
+        os.replace(tmp_filepath, table_path)
+        num_rows[table_path] = pl.scan_parquet(table_path).select(pl.len()).collect().item()
+    return num_rows
+
+
+def _scan_exploded(table_path: Path | str, programme_data_path: Path | str) -> pl.LazyFrame:
+    # falls back to exploding on the fly if the table is missing or older than the programme data
+    explode = EXPLODED_TABLES[table_path]
+    table_path = get_table_path(table_path, programme_data_path)
+    if _is_up_to_date(table_path, programme_data_path):
+        return pl.scan_parquet(table_path)
+    return explode(scan_programmes(programme_data_path))
+
+
+def scan_credits(programme_data_path: Path | str = PROGRAMME_DATA_PARQUET) -> pl.LazyFrame:
+    return _scan_exploded(PROGRAMME_CREDITS_PARQUET, programme_data_path)
+
+
+def scan_broadcasts(programme_data_path: Path | str = PROGRAMME_DATA_PARQUET) -> pl.LazyFrame:
+    return _scan_exploded(PROGRAMME_BROADCASTS_PARQUET, programme_data_path)
+
+
+#### -- QUERIES ----
+#### -- each returns a LazyFrame; nothing is read until it's collected
+
+def get_audio_urls(programme_data_path: Path | str = PROGRAMME_DATA_PARQUET) -> pl.LazyFrame:
+    return (
+        scan_programmes(programme_data_path)
+        .select("programme_id", "audio_url", "duration_seconds")
+        .drop_nulls("audio_url")
+    )
+
+
+def episodes_by_contributor(name: str, role: str | None = None, columns: list[str] = DEFAULT_COLUMNS, programme_data_path: Path | str = PROGRAMME_DATA_PARQUET) -> pl.LazyFrame:
+    """Programmes crediting a contributor whose name contains `name` (case-insensitive), optionally only in `role`."""
+    credits = scan_credits(programme_data_path).filter(pl.col("name").str.to_lowercase().str.contains(name.lower(), literal=True))
+    if role is not None:
+        credits = credits.filter(pl.col("role") == role)
+    return (
+        scan_programmes(programme_data_path)
+        .select(columns)
+        .join(credits.select("programme_id", "role", "name"), on="programme_id", how="inner")
+        .sort("programme_id")
+    )
+
+
+def episodes_by_year(year: int, first_broadcast: bool = True, columns: list[str] = DEFAULT_COLUMNS, programme_data_path: Path | str = PROGRAMME_DATA_PARQUET) -> pl.LazyFrame:
+    """Programmes first broadcast in `year`, or with any broadcast (including repeats) in it if not `first_broadcast`."""
+    broadcasts = scan_broadcasts(programme_data_path).filter(pl.col("year") == year)
+    if first_broadcast:
+        broadcasts = broadcasts.filter(pl.col("is_first"))
+    return (
+        scan_programmes(programme_data_path)
+        .select(columns)
+        .join(broadcasts.select("programme_id").unique(), on="programme_id", how="semi")
+        .sort("programme_id")
+    )
+
+
+def episodes_in_collection(title: str, columns: list[str] = DEFAULT_COLUMNS, programme_data_path: Path | str = PROGRAMME_DATA_PARQUET) -> pl.LazyFrame:
+    """Programmes featured in a collection whose title contains `title` (case-insensitive)."""
+    in_collection = (
+        pl.col("featured_collections")
+        .list.eval(pl.element().struct.field("title").str.to_lowercase().str.contains(title.lower(), literal=True))
+        .list.any()
+    )
+    return (
+        scan_programmes(programme_data_path)
+        .filter(in_collection.fill_null(False))
+        .select(columns)
+    )
+
+
+def duration_stats(by_year: bool = False, programme_data_path: Path | str = PROGRAMME_DATA_PARQUET) -> pl.LazyFrame:
+    """Count, mean, median, p95, min and max duration (seconds) of all programmes, or per year of first broadcast."""
+    duration = pl.col("duration_seconds")
+    stats = [
+        pl.len().alias("num_programmes"),
+        duration.mean().alias("mean"),
+        duration.median().alias("median"),
+        duration.quantile(0.95).alias("p95"),
+        duration.min().alias("min"),
+        duration.max().alias("max"),
+    ]
+    programmes = scan_programmes(programme_data_path).select("programme_id", "duration_seconds")
+    if not by_year:
+        return programmes.select(stats)
+
+    first_broadcasts = scan_broadcasts(programme_data_path).filter(pl.col("is_first")).select("programme_id", "year").unique("programme_id")
+    return (
+        programmes
+        .join(first_broadcasts, on="programme_id", how="inner")
+        .group_by("year")
+        .agg(stats)
+        .sort("year")
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the parsed programme data.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    tables_parser = subparsers.add_parser("build-tables", help="Write the exploded credits and broadcasts tables.")
+
+    contributor_parser = subparsers.add_parser("contributor", help="Programmes crediting a contributor.")
+    contributor_parser.add_argument("name", type=str)
+    contributor_parser.add_argument("--role", type=str, default=None, help="e.g. 'Presenter', 'Interviewed Guest'.")
+
+    year_parser = subparsers.add_parser("year", help="Programmes first broadcast in a year.")
+    year_parser.add_argument("year", type=int)
+    year_parser.add_argument("--any-broadcast", action="store_true", help="Include programmes repeated in that year.")
+
+    collection_parser = subparsers.add_parser("collection", help="Programmes featured in a collection.")
+    collection_parser.add_argument("title", type=str)
+
+    durations_parser = subparsers.add_parser("durations", help="Programme duration statistics.")
+    durations_parser.add_argument("--by-year", action="store_true", help="Group by year of first broadcast.")
+
+    for subparser in [tables_parser, contributor_parser, year_parser, collection_parser, durations_parser]:
+        subparser.add_argument("--programme-data", type=str, default=PROGRAMME_DATA_PARQUET)
+
+    args = parser.parse_args()
+
+    start_time = timer()
+    if args.command == "build-tables":
+        for table_path, num_rows in write_exploded_tables(args.programme_data).items():
+            print(f"-> Wrote {num_rows:,} rows to '{table_path}'.")
+    else:
+        if args.command == "contributor":
+            query = episodes_by_contributor(args.name, role=args.role, programme_data_path=args.programme_data)
+        elif args.command == "year":
+            query = episodes_by_year(args.year, first_broadcast=not args.any_broadcast, programme_data_path=args.programme_data)
+        elif args.command == "collection":
+            query = episodes_in_collection(args.title, programme_data_path=args.programme_data)
+        elif args.command == "durations":
+            query = duration_stats(by_year=args.by_year, programme_data_path=args.programme_data)
+        with pl.Config(tbl_rows=50):
+            print(query.collect())
+    print(f"-> {1000 * (timer() - start_time):.1f}ms")
@@ -0,0 +1,141 @@
+import re
+from typing import Callable
+from datetime import date, datetime
+
+import polars as pl
+
+from programme import ProgrammeRecord, BroadcastTime
+
+
+## -- DECLARED SCHEMA FOR `programme_data.parquet` ----
+
+PROGRAMME_SCHEMA = pl.Schema({
+    "programme_id": pl.String,
+    "title": pl.String,
+    "duration": pl.String,                      # <- as displayed, e.g. '43 minutes'
+    "duration_seconds": pl.Int32,
+    "short_description": pl.String,
+    "long_description": pl.String,
+    "audio_url": pl.String,
+    "photo_url": pl.String,
+    "previous_broadcasts": pl.List(pl.Struct({"date": pl.Date, "time": pl.String})),
+    "credits": pl.List(pl.Struct({"role": pl.String, "name": pl.String})),
+    "featured_collections": pl.List(pl.Struct({"title": pl.String, "description": pl.String})),
+    "related_links": pl.List(pl.Struct({"title": pl.String, "url": pl.String})),
+})
+
+# fields every parser backend is expected to return
+PROGRAMME_RECORD_FIELDS = frozenset(ProgrammeRecord.__annotations__)
+
+
+## -- FIELD CONVERSIONS ----
+
+DURATION_UNIT_SECONDS = {"hour": 3600, "minute": 60, "second": 1}
+
+def parse_duration_seconds(duration: str | None) -> int | None:
+    """Convert a displayed duration (e.g., '43 minutes', '1 hour', '1 hour, 5 minutes') to seconds."""
+    if duration is None:
+        return None
+    matches = re.findall(r"(\d+)\s*(hour|minute|second)s?", duration.lower())
+    if not matches:
+        return None
+    return sum(int(amount) * DURATION_UNIT_SECONDS[unit] for amount, unit in matches)
+
+
+BROADCAST_DATE_FORMATS = ["%a %d %b %Y", "%d %b %Y", "%a %d %B %Y", "%d %B %Y"]
+
+
+class BroadcastDateError(ValueError):
+    pass
+
+
+def parse_broadcast_date(broadcast_date: str | None) -> date | None:
+    """Broadcast dates are displayed like 'Thu 5 Dec 2019'. Returns `None` for a missing date and raises
+    `BroadcastDateError` for one in an unknown format, rather than silently dropping it."""
+    if broadcast_date is None or not broadcast_date.strip():
+        return None
+    for date_format in BROADCAST_DATE_FORMATS:
+        try:
+            return datetime.strptime(broadcast_date.strip(), date_format).date()
+        except ValueError:
+            continue
+    raise BroadcastDateError(f"Broadcast date '{broadcast_date}' does not match any of {BROADCAST_DATE_FORMATS}.")
+
+
+def _convert_previous_broadcasts(previous_broadcasts: list[BroadcastTime] | None) -> list[dict] | None:
+    if previous_broadcasts is None:
+        return None
+    return [
+        {"date": parse_broadcast_date(broadcast["date"]), "time": broadcast["time"]}
+        for broadcast in previous_broadcasts
+    ]
+
+
+def to_programme_row(programme_id: str, record: ProgrammeRecord) -> dict:
+    """Convert a parsed record into a row matching `PROGRAMME_SCHEMA`. Raises if the record's fields have drifted from the schema,
+    or `BroadcastDateError` if one of its broadcast dates can't be read."""
+    record_fields = set(record)
+    if record_fields != PROGRAMME_RECORD_FIELDS:
+        raise ValueError(
+            f"Parsed record for programme '{programme_id}' does not match the declared schema. "
+            f"Missing fields: {sorted(PROGRAMME_RECORD_FIELDS - record_fields)}. Unexpected fields: {sorted(record_fields - PROGRAMME_RECORD_FIELDS)}."
+        )
+
+    return {
+        **record,
+        "programme_id": programme_id,
+        "duration_seconds": parse_duration_seconds(record["duration"]),
+        "previous_broadcasts": _convert_previous_broadcasts(record["previous_broadcasts"]),
+    }
+
+
+## -- COLUMNAR RECORD BUILDER ----
+
+class ProgrammeFrameBuilder:
+    """Appends parsed records into per-column buffers, converting each full batch to an arrow-backed dataframe
+    so the python objects for at most `batch_size` records are alive at once.
+    If `on_batch` is provided, each batch is handed to it (e.g., to write to disk) instead of being kept in memory."""
+
+    def __init__(self, batch_size: int = 1_000, on_batch: Callable[[pl.DataFrame], None] | None = None):
+        assert isinstance(batch_size, int) and batch_size > 0, f"Input '{batch_size}' for argument `batch_size` must be a positive int."
+        self.batch_size = batch_size
+        self.on_batch = on_batch
+        self.frames: list[pl.DataFrame] = []
+        self.num_flushed_rows = 0
+        self._reset_buffers()
+
+    def _reset_buffers(self) -> None:
+        self.buffers: dict[str, list] = {column: [] for column in PROGRAMME_SCHEMA}
+        self.buffered_rows = 0
+
+    def __len__(self) -> int:
+        return self.num_flushed_rows + self.buffered_rows
+
+    def append(self, programme_id: str, record: ProgrammeRecord) -> None:
+        row = to_programme_row(programme_id, record)
+        for column, values in self.buffers.items():
+            values.append(row[column])
+        self.buffered_rows += 1
+
+        if self.buffered_rows >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> pl.DataFrame | None:
+        if self.buffered_rows == 0:
+            return None
+        # strict construction surfaces any value that doesn't fit its declared type
+        frame = pl.DataFrame(self.buffers, schema=PROGRAMME_SCHEMA, strict=True)
+        self.num_flushed_rows += len(frame)
+        self._reset_buffers()
+
+        if self.on_batch is not None:
+            self.on_batch(frame)
+        else:
+            self.frames.append(frame)
+        return frame
+
+    def build(self) -> pl.DataFrame:
+        self.flush()
+        if not self.frames:
+            return PROGRAMME_SCHEMA.to_frame()
+        return pl.concat(self.frames, rechunk=True)
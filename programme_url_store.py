@@ -0,0 +1,101 @@
+import os
+import csv
+import sqlite3
+from pathlib import Path
+from typing import TypedDict
+
+from utils import get_timestamp
+
+
+## -- PROGRAMME URL STORE ----
+## -- every programme url ever listed, stored once, with the listing page and time it was first seen. lets the listings
+## -- crawl stop as soon as it reaches episodes it already knows, instead of re-crawling the whole archive. that's only
+## -- safe once a full sweep has stored every episode, so each crawl is also logged in `crawl_runs`
+
+class ListedProgramme(TypedDict):
+    listing_url: str
+    programme_url: str
+    first_seen_at: str
+
+
+class ProgrammeUrlStore:
+
+    def __init__(self, filepath: Path | str):
+        self.conn = sqlite3.connect(filepath)
+        self.conn.row_factory = sqlite3.Row
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS programme_urls (
+                    programme_url TEXT PRIMARY KEY,
+                    listing_url TEXT NOT NULL,
+                    first_seen_at TEXT NOT NULL
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS programme_urls_first_seen_at ON programme_urls (first_seen_at)")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS crawl_runs (
+                    run_id INTEGER PRIMARY KEY,
+                    mode TEXT NOT NULL,
+                    started_at TEXT NOT NULL,
+                    finished_at TEXT,
+                    num_pages INTEGER,
+                    num_errors INTEGER
+                )
+            """)
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM programme_urls").fetchone()[0]
+
+    def __contains__(self, programme_url: str) -> bool:
+        return self.conn.execute("SELECT 1 FROM programme_urls WHERE programme_url = ?", (programme_url,)).fetchone() is not None
+
+    def add(self, listing_url: str, programme_urls: list[str]) -> list[str]:
+        """Store the programme urls found on a listing page, ignoring any already stored. Returns the newly added urls."""
+        first_seen_at = get_timestamp()
+        new_urls = []
+        with self.conn:
+            for programme_url in programme_urls:
+                cursor = self.conn.execute(
+                    "INSERT OR IGNORE INTO programme_urls (programme_url, listing_url, first_seen_at) VALUES (?, ?, ?)",
+                    (programme_url, listing_url, first_seen_at)
+                )
+                if cursor.rowcount > 0:
+                    new_urls.append(programme_url)
+        return new_urls
+
+    def start_crawl_run(self, mode: str) -> int:
+        """Log the start of a crawl ('full', 'incremental' or 'test'). Returns its run id, for `finish_crawl_run`."""
+        with self.conn:
+            cursor = self.conn.execute("INSERT INTO crawl_runs (mode, started_at) VALUES (?, ?)", (mode, get_timestamp()))
+        return cursor.lastrowid
+
+    def finish_crawl_run(self, run_id: int, num_pages: int, num_errors: int) -> None:
+        with self.conn:
+            self.conn.execute(
+                "UPDATE crawl_runs SET finished_at = ?, num_pages = ?, num_errors = ? WHERE run_id = ?",
+                (get_timestamp(), num_pages, num_errors, run_id)
+            )
+
+    def has_complete_sweep(self) -> bool:
+        """Whether a full crawl of every listing page has finished without errors; until one has, the store may be
+        missing older episodes that an incremental crawl would never reach."""
+        row = self.conn.execute("SELECT 1 FROM crawl_runs WHERE mode = 'full' AND finished_at IS NOT NULL AND num_errors = 0 LIMIT 1").fetchone()
+        return row is not None
+
+    def get_all(self) -> list[ListedProgramme]:
+        rows = self.conn.execute("SELECT listing_url, programme_url, first_seen_at FROM programme_urls ORDER BY rowid").fetchall()
+        return [ListedProgramme(**row) for row in rows]
+
+    def export_csv(self, filepath: Path | str) -> int:
+        """Write every stored url to `filepath` (oldest first), replacing it atomically. Returns the number of rows written."""
+        rows = self.get_all()
+        tmp_filepath = f"{filepath}.tmp"
+        with open(tmp_filepath, mode="w", newline="") as outfile:
+            writer = csv.DictWriter(outfile, fieldnames=list(ListedProgramme.__annotations__))
+            writer.writeheader()
+            writer.writerows(rows)
+        os.replace(tmp_filepath, filepath)
+        return len(rows)
+
+    def close(self) -> None:
+        self.conn.close()
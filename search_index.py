@@ -0,0 +1,228 @@
+import os
+import re
+import sqlite3
+import hashlib
+import argparse
+from pathlib import Path
+from typing import TypedDict
+from timeit import default_timer as timer
+
+import polars as pl
+
+from transcript_store import TranscriptStore
+
+
+## -- FULL-TEXT SEARCH INDEX ----
+## -- sqlite fts5 inverted index over programme descriptions and transcript segments, ranked with bm25
+
+DATA_DIR = "data"
+SEARCH_INDEX_DB = os.path.join(DATA_DIR, "search_index.sqlite")
+PROGRAMME_DATA_PARQUET = os.path.join(DATA_DIR, "programme_data.parquet")
+TRANSCRIPT_STORE = os.path.join(DATA_DIR, "transcripts.arrow")
+
+PROGRAMME_TEXT_FIELDS = ["title", "short_description", "long_description"]
+TRANSCRIPT_FIELD = "transcript"
+
+
+class SearchHit(TypedDict):
+    episode_id: str
+    field: str
+    start: float | None  # <- segment timestamps; `None` for programme description fields
+    end: float | None
+    snippet: str
+    score: float
+
+
+def _get_hash(*values: str | None) -> str:
+    return hashlib.sha256("\x1f".join(value or "" for value in values).encode("utf-8")).hexdigest()
+
+
+def _to_match_expression(query: str, phrase: bool) -> str:
+    # quote every term so user input can't be read as fts5 query syntax
+    terms = re.findall(r"\w+", query)
+    if not terms:
+        raise ValueError(f"Query '{query}' contains no searchable terms.")
+    if phrase:
+        return '"' + " ".join(terms) + '"'
+    return " ".join(f'"{term}"' for term in terms)
+
+
+class SearchIndex:
+
+    def __init__(self, filepath: Path | str = SEARCH_INDEX_DB):
+        self.conn = sqlite3.connect(filepath)
+        self.conn.row_factory = sqlite3.Row
+        with self.conn:
+            self.conn.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS documents USING fts5(
+                    text,
+                    source UNINDEXED,
+                    episode_id UNINDEXED,
+                    field UNINDEXED,
+                    start UNINDEXED,
+                    end UNINDEXED,
+                    tokenize = 'porter unicode61'
+                )
+            """)
+            # content hash per indexed source, so unchanged episodes are skipped on rebuild
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS indexed_sources (
+                    source TEXT PRIMARY KEY,
+                    content_hash TEXT NOT NULL
+                )
+            """)
+            # fts5 can't index `source`, so filtering on it scans every document; this maps each source to its
+            # documents' rowids, so replacing or removing a source deletes by rowid instead
+            has_document_rowids = self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'document_rowids'").fetchone() is not None
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS document_rowids (
+                    document_rowid INTEGER PRIMARY KEY,
+                    source TEXT NOT NULL
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS document_rowids_source ON document_rowids (source)")
+            if not has_document_rowids:
+                # index built before the table existed: one full scan to fill it
+                self.conn.execute("INSERT INTO document_rowids (document_rowid, source) SELECT rowid, source FROM documents")
+
+    def _needs_indexing(self, source: str, content_hash: str) -> bool:
+        row = self.conn.execute("SELECT content_hash FROM indexed_sources WHERE source = ?", (source,)).fetchone()
+        return row is None or row["content_hash"] != content_hash
+
+    def _delete_source(self, source: str) -> None:
+        rowids = [row[0] for row in self.conn.execute("SELECT document_rowid FROM document_rowids WHERE source = ?", (source,))]
+        self.conn.executemany("DELETE FROM documents WHERE rowid = ?", [(rowid,) for rowid in rowids])
+        self.conn.execute("DELETE FROM document_rowids WHERE source = ?", (source,))
+
+    def _replace_source(self, source: str, content_hash: str, documents: list[tuple]) -> None:
+        """`documents` are (text, episode_id, field, start, end) tuples."""
+        self._delete_source(source)
+        for text, episode_id, field, start, end in documents:
+            cursor = self.conn.execute(
+                "INSERT INTO documents (text, source, episode_id, field, start, end) VALUES (?, ?, ?, ?, ?, ?)",
+                (text, source, episode_id, field, start, end)
+            )
+            self.conn.execute("INSERT INTO document_rowids (document_rowid, source) VALUES (?, ?)", (cursor.lastrowid, source))
+        self.conn.execute("INSERT OR REPLACE INTO indexed_sources VALUES (?, ?)", (source, content_hash))
+
+    def _remove_missing_sources(self, prefix: str, sources: set[str]) -> int:
+        """Remove indexed sources starting with `prefix` (e.g. deleted episodes) that aren't in `sources`. Returns how many."""
+        indexed = [row[0] for row in self.conn.execute("SELECT source FROM indexed_sources WHERE source LIKE ? || '%'", (prefix,))]
+        missing = [source for source in indexed if source not in sources]
+        with self.conn:
+            for source in missing:
+                self._delete_source(source)
+                self.conn.execute("DELETE FROM indexed_sources WHERE source = ?", (source,))
+        return len(missing)
+
+    def index_programmes(self, programme_data_path: Path | str = PROGRAMME_DATA_PARQUET) -> int:
+        """Index programme description fields, dropping programmes no longer in the data. Returns the number of new or changed programmes indexed."""
+        programmes = pl.scan_parquet(programme_data_path).select("programme_id", *PROGRAMME_TEXT_FIELDS).collect()
+
+        num_indexed = 0
+        with self.conn:
+            for programme in programmes.iter_rows(named=True):
+                source = f"programme:{programme['programme_id']}"
+                content_hash = _get_hash(*[programme[field] for field in PROGRAMME_TEXT_FIELDS])
+                if not self._needs_indexing(source, content_hash):
+                    continue
+
+                self._replace_source(source, content_hash, [
+                    (programme[field], programme["programme_id"], field, None, None)
+                    for field in PROGRAMME_TEXT_FIELDS
+                    if programme[field]
+                ])
+                num_indexed += 1
+        self._remove_missing_sources("programme:", {f"programme:{programme_id}" for programme_id in programmes["programme_id"].to_list()})
+        return num_indexed
+
+    def index_transcripts(self, store: TranscriptStore, audio_to_programme_id: dict[str, str] | None = None) -> int:
+        """Index each transcript segment as its own document, dropping transcripts no longer in `store`. Transcripts are keyed by audio file id;
+        `audio_to_programme_id` maps them onto programme ids so both kinds of hit share an episode id."""
+        audio_to_programme_id = audio_to_programme_id or {}
+
+        num_indexed = 0
+        for audio_id in store.episode_ids():
+            segments = store.get_segments(audio_id)
+            source = f"transcript:{audio_id}"
+            content_hash = _get_hash(*segments["text"].to_list())
+            if not self._needs_indexing(source, content_hash):
+                continue
+
+            episode_id = audio_to_programme_id.get(audio_id, audio_id)
+            with self.conn:
+                self._replace_source(source, content_hash, [
+                    (text, episode_id, TRANSCRIPT_FIELD, start, end)
+                    for text, start, end in segments.select("text", "start", "end").iter_rows()
+                ])
+            num_indexed += 1
+        self._remove_missing_sources("transcript:", {f"transcript:{audio_id}" for audio_id in store.episode_ids()})
+        return num_indexed
+
+    def search(self, query: str, limit: int = 10, phrase: bool = False, fields: list[str] | None = None) -> list[SearchHit]:
+        """Ranked bm25 search. With `phrase`, only documents containing the terms consecutively, in order, match."""
+        sql = """
+            SELECT episode_id, field, start, end, snippet(documents, 0, '[', ']', '...', 12) AS snippet, bm25(documents) AS score
+            FROM documents
+            WHERE documents MATCH ?
+        """
+        params = [_to_match_expression(query, phrase)]
+        if fields:
+            sql += f" AND field IN ({', '.join('?' for _ in fields)})"
+            params.extend(fields)
+        sql += " ORDER BY score LIMIT ?"  # <- fts5 bm25 scores are negative; lower is a better match
+        params.append(limit)
+
+        return [SearchHit(**row) for row in self.conn.execute(sql, params).fetchall()]
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def get_audio_to_programme_id(programme_data_path: Path | str = PROGRAMME_DATA_PARQUET) -> dict[str, str]:
+    """Transcripts are named after the mp3 file; map those ids back to the programme they came from."""
+    audio_ids = (
+        pl.scan_parquet(programme_data_path)
+        .select("programme_id", "audio_url")
+        .drop_nulls("audio_url")
+        .with_columns(
+            audio_id=pl.col("audio_url").str.split("/").list.last().str.replace(r"\.[^.]+$", "")
+        )
+        .collect()
+    )
+    return dict(zip(audio_ids["audio_id"].to_list(), audio_ids["programme_id"].to_list()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or query the full-text search index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Index new or changed programmes and transcripts.")
+    build_parser.add_argument("--transcripts", type=str, default=TRANSCRIPT_STORE, help="Transcript store to index (see `transcript_store.py`).")
+
+    query_parser = subparsers.add_parser("query", help="Search the index.")
+    query_parser.add_argument("query", type=str)
+    query_parser.add_argument("--phrase", action="store_true", help="Match the query as an exact phrase.")
+    query_parser.add_argument("--limit", type=int, default=10)
+
+    args = parser.parse_args()
+    search_index = SearchIndex()
+
+    if args.command == "build":
+        start_time = timer()
+        num_programmes = search_index.index_programmes()
+        num_transcripts = 0
+        if os.path.exists(args.transcripts):
+            num_transcripts = search_index.index_transcripts(TranscriptStore(args.transcripts), get_audio_to_programme_id())
+        print(f"-> Indexed {num_programmes:,} new or changed programmes and {num_transcripts:,} transcripts in {timer() - start_time:.1f}s.")
+
+    elif args.command == "query":
+        start_time = timer()
+        hits = search_index.search(args.query, limit=args.limit, phrase=args.phrase)
+        print(f"-> {len(hits)} hits in {1000 * (timer() - start_time):.1f}ms")
+        for hit in hits:
+            timestamp = f" @ {hit['start']:.1f}-{hit['end']:.1f}s" if hit["start"] is not None else ""
+            snippet = " ".join(hit["snippet"].split())
+            print(f"| {hit['episode_id']} [{hit['field']}{timestamp}] {snippet}")
+
+    search_index.close()
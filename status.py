@@ -0,0 +1,100 @@
+import os
+import json
+import argparse
+
+import batch_transcribe
+import diarize
+from listings import PROGRAMME_URLS_CSV
+from html_archive import HTML_ARCHIVE_DIR, INDEX_FILENAME, HtmlArchive
+from parse_programmes import PARSE_ERRORS_CSV, PROGRAMME_DATA_PARQUET
+from download_audio_files import PROGRAMME_MP3_DIR, PARTIAL_FILE_SUFFIX
+from audio_manifest import AUDIO_MANIFEST_DB, AudioManifest
+from job_ledger import JobLedger
+
+parser = argparse.ArgumentParser(description="Summarise how far each stage of the dataset has got, from the files and indexes it has written.")
+
+parser.add_argument("--data-dir", type=str, default="data")
+parser.add_argument("--transcripts-dir", type=str, default=None, help="Output directory of `batch_transcribe.py`. Defaults to the pipeline's 'transcriptions' directory inside `--data-dir`.")
+parser.add_argument("--diarization-dir", type=str, default=None, help="Output directory of `diarize.py`, if it has been run.")
+
+
+## -- DATASET STATUS ----
+## -- only reads indexes, manifests and directory listings (never the pages, parquet or audio themselves), so it returns
+## -- in tens of milliseconds however large the dataset is
+
+def count_csv_rows(filepath: str) -> int | None:
+    if not os.path.exists(filepath):
+        return None
+    with open(filepath, mode="rb") as infile:
+        return max(0, sum(1 for _ in infile) - 1)  # <- minus the header
+
+
+def get_ledger_status(ledger_filepath: str) -> dict[str, int] | None:
+    if not os.path.exists(ledger_filepath):
+        return None
+    ledger = JobLedger(ledger_filepath)
+    status_counts = ledger.status_counts()
+    ledger.close()
+    return status_counts
+
+
+def main(args: argparse.Namespace):
+    data_dir = args.data_dir
+    print(f"## Dataset Status ('{data_dir}')\n{'-' * 35}")
+
+    programme_urls_csv = os.path.join(data_dir, os.path.basename(PROGRAMME_URLS_CSV))
+    num_programme_urls = count_csv_rows(programme_urls_csv)
+    print(f"| programme urls:    {num_programme_urls:,}" if num_programme_urls is not None else "| programme urls:    - (run `listings`)")
+
+    archive_dir = os.path.join(data_dir, os.path.basename(HTML_ARCHIVE_DIR))
+    if os.path.exists(os.path.join(archive_dir, INDEX_FILENAME)):
+        archive = HtmlArchive(archive_dir, readonly=True)
+        archive_summary = archive.summary()
+        archive.close()
+        print(f"| archived pages:    {archive_summary['num_pages']:,} ({archive_summary['compressed_bytes'] / 1e6:,.1f}MB in {archive_summary['num_shards']:,} shard(s))")
+    else:
+        print("| archived pages:    - (run `collect`)")
+
+    programme_data_parquet = os.path.join(data_dir, os.path.basename(PROGRAMME_DATA_PARQUET))
+    manifest_filepath = f"{os.path.splitext(programme_data_parquet)[0]}.manifest.json"
+    if os.path.exists(manifest_filepath):
+        with open(manifest_filepath, mode="r") as infile:
+            manifest = json.load(infile)
+        num_parse_errors = count_csv_rows(os.path.join(data_dir, os.path.basename(PARSE_ERRORS_CSV)))
+        print(f"| parsed programmes: {manifest['num_rows']:,} ({manifest.get('parser', '?')} parser v{manifest.get('parser_version', '?')}, {num_parse_errors or 0:,} errors, completed {manifest['completed_at']})")
+    else:
+        print("| parsed programmes: - (run `parse`)")
+
+    audio_dir = os.path.join(data_dir, os.path.basename(PROGRAMME_MP3_DIR))
+    if os.path.isdir(audio_dir):
+        audio_files = os.listdir(audio_dir)
+        num_partial = sum(1 for file in audio_files if file.endswith(PARTIAL_FILE_SUFFIX))
+        print(f"| mp3 files:         {len(audio_files) - num_partial:,} ({num_partial:,} partial downloads)")
+    else:
+        print("| mp3 files:         - (run `download`)")
+
+    audio_manifest_db = os.path.join(data_dir, os.path.basename(AUDIO_MANIFEST_DB))
+    if os.path.exists(audio_manifest_db):
+        manifest = AudioManifest(audio_manifest_db)
+        audio_summary = manifest.summary()
+        manifest.close()
+        print(f"| audio manifest:    {audio_summary['num_urls']:,} urls in {audio_summary['num_files']:,} files ({audio_summary['stored_bytes'] / 1e9:,.2f}GB, {(audio_summary['total_bytes'] - audio_summary['stored_bytes']) / 1e9:,.2f}GB saved by deduplication)")
+
+    transcripts_dir = args.transcripts_dir or os.path.join(data_dir, "transcriptions")
+    transcription_status = get_ledger_status(os.path.join(transcripts_dir, batch_transcribe.LEDGER_FILENAME))
+    if transcription_status is not None:
+        print(f"| transcriptions:    {transcription_status}")
+    elif os.path.isdir(transcripts_dir):
+        # the pipeline's transcription stage checks for outputs directly instead of keeping a ledger
+        print(f"| transcriptions:    {sum(1 for file in os.listdir(transcripts_dir) if file.endswith('.json')):,}")
+    else:
+        print(f"| transcriptions:    - (nothing in '{transcripts_dir}')")
+
+    if args.diarization_dir is not None:
+        diarization_status = get_ledger_status(os.path.join(args.diarization_dir, diarize.LEDGER_FILENAME))
+        print(f"| diarization:       {diarization_status}" if diarization_status is not None else f"| diarization:       - (no ledger in '{args.diarization_dir}')")
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    main(args)
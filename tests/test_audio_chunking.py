@@ -0,0 +1,85 @@
+import numpy as np
+
+from audio_chunking import SAMPLE_RATE, plan_chunks, split_audio, stitch_transcriptions, find_silences
+
+UTTERANCE_S = 4.0
+PAUSE_S = 1.0
+NUM_UTTERANCES = 20
+
+
+def make_audio() -> tuple[np.ndarray, list[tuple[float, float]]]:
+    """Tones ('utterances') separated by near-silent pauses. Returns the audio and each utterance's (start, end) seconds."""
+    rng = np.random.default_rng(0)
+    parts, utterances = [], []
+    position = PAUSE_S
+    parts.append(0.001 * rng.standard_normal(int(PAUSE_S * SAMPLE_RATE)))
+    for index in range(NUM_UTTERANCES):
+        t = np.arange(int(UTTERANCE_S * SAMPLE_RATE)) / SAMPLE_RATE
+        parts.append(0.5 * np.sin(2 * np.pi * (200 + 20 * index) * t))
+        parts.append(0.001 * rng.standard_normal(int(PAUSE_S * SAMPLE_RATE)))
+        utterances.append((position, position + UTTERANCE_S))
+        position += UTTERANCE_S + PAUSE_S
+    return np.concatenate(parts).astype(np.float32), utterances
+
+
+def fake_transcribe(audio: np.ndarray) -> dict:
+    """One segment (with one word) per loud stretch of the chunk, in chunk-relative seconds, like whisper output."""
+    duration = len(audio) / SAMPLE_RATE
+    boundaries = [0.0] + [point for silence in find_silences(audio, min_silence_s=0.2) for point in silence] + [duration]
+    segments = []
+    for start, end in zip(boundaries[0::2], boundaries[1::2]):
+        if end - start < 0.1:
+            continue
+        segments.append({
+            "id": len(segments),
+            "seek": 0,
+            "start": start,
+            "end": end,
+            "text": f" utterance {len(segments)}",
+            "words": [{"word": " utterance", "start": start, "end": end}],
+        })
+    return {"text": "".join(segment["text"] for segment in segments), "segments": segments, "language": "en"}
+
+
+def test_plan_chunks_cuts_in_silences_and_covers_episode():
+    audio, utterances = make_audio()
+    duration = len(audio) / SAMPLE_RATE
+    chunks = plan_chunks(duration, find_silences(audio), max_chunk_s=22.0, overlap_s=1.0)
+
+    assert chunks[0]["start"] == 0.0 and chunks[-1]["end"] == duration
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk["start"] == previous["end"]
+        # every cut is in a pause, not inside an utterance
+        assert not any(start < chunk["start"] < end for start, end in utterances)
+    for chunk in chunks:
+        assert chunk["end"] - chunk["start"] <= 22.0
+        assert chunk["audio_start"] == max(0.0, chunk["start"] - 1.0)
+        assert chunk["audio_end"] == min(duration, chunk["end"] + 1.0)
+
+
+def test_stitched_timestamps_match_episode():
+    audio, utterances = make_audio()
+    chunks, chunk_audio = split_audio(audio, max_chunk_s=22.0, overlap_s=1.0)
+    assert len(chunks) > 3
+
+    transcriptions = [fake_transcribe(audio_chunk) for audio_chunk in chunk_audio]
+    stitched = stitch_transcriptions(chunks, transcriptions)
+    segments = stitched["segments"]
+
+    # segments cut off at a chunk's padded edge fall in the neighbour's region and are dropped, so each utterance appears once
+    assert len(segments) == len(utterances)
+    for segment, (start, end) in zip(segments, utterances):
+        assert abs(segment["start"] - start) < 0.05 and abs(segment["end"] - end) < 0.05
+        assert segment["words"][0]["start"] == segment["start"] and segment["words"][0]["end"] == segment["end"]
+
+    # offsets: every segment is shifted by its chunk's audio_start, and seek by the same amount in 10ms frames
+    for chunk, transcribed in zip(chunks, transcriptions):
+        kept = [segment for segment in segments if chunk["start"] <= (segment["start"] + segment["end"]) / 2 < chunk["end"]]
+        for segment in kept:
+            assert segment["seek"] == round(chunk["audio_start"] * 100)
+
+    assert [segment["id"] for segment in segments] == list(range(len(segments)))
+    starts = [segment["start"] for segment in segments]
+    assert starts == sorted(starts)
+    assert all(previous["end"] <= segment["start"] for previous, segment in zip(segments, segments[1:]))
+    assert stitched["text"] == "".join(segment["text"] for segment in segments)
@@ -0,0 +1,19 @@
+import os
+
+import batch_transcribe
+import diarize
+from download_audio_files import PARTIAL_FILE_SUFFIX
+
+
+def test_dry_run_skips_partial_downloads_in_audio_dir(tmp_path, capsys):
+    audio_dir = tmp_path / "audio_files"
+    audio_dir.mkdir()
+    (audio_dir / "p0000001.mp3").write_bytes(b"complete")
+    (audio_dir / f"p0000002.mp3{PARTIAL_FILE_SUFFIX}").write_bytes(b"interrupted")
+
+    for script, outdir in [(batch_transcribe, "transcripts"), (diarize, "rttm")]:
+        assert script.list_audio_files(audio_dir) == [os.path.join(audio_dir, "p0000001.mp3")]
+
+        args = script.parser.parse_args(["--audio-dir", str(audio_dir), "--outdir", str(tmp_path / outdir), "--dry-run"])
+        script.main(args)
+        assert "p0000002" not in capsys.readouterr().out
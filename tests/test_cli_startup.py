@@ -0,0 +1,42 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+from benchmarks.fixtures import write_audio_files
+from cli import COMMANDS
+
+CLI_PY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cli.py")
+
+# slow to import; commands that don't need them (e.g. `--help`) shouldn't pay for them
+HEAVY_MODULES = {"polars", "numpy", "bs4", "lxml", "requests", "tqdm", "zstandard", "asyncio"}
+
+
+def get_imported_modules(importtime_output: str) -> set[str]:
+    # `-X importtime` writes an `import time: <self us> | <cumulative us> | <module>` line per module to stderr
+    return {
+        line.rsplit("|", 1)[1].strip()
+        for line in importtime_output.splitlines()
+        if line.startswith("import time:") and line.split("|", 1)[0].split(":", 1)[1].strip().isdigit()
+    }
+
+
+@pytest.fixture(scope="module")
+def work_dir(tmp_path_factory):
+    work_dir = tmp_path_factory.mktemp("cli_startup")
+    write_audio_files(os.path.join(work_dir, "audio"), num_files=2, duration_s=5.0)
+    return work_dir
+
+
+@pytest.mark.parametrize("argv", [
+    ["--help"],
+    *([name, "--help"] for name in COMMANDS),
+    ["status", "--data-dir", "."],
+    ["transcribe", "--audio-dir", "audio", "-o", ".", "--backfill", "--dry-run"],
+], ids=" ".join)
+def test_cli_does_not_import_heavy_modules(work_dir, argv):
+    process = subprocess.run([sys.executable, "-X", "importtime", CLI_PY, *argv], cwd=work_dir, capture_output=True, text=True)
+    assert process.returncode == 0, f"`cli.py {' '.join(argv)}` failed:\n{process.stderr}"
+    heavy_modules = {module.split(".")[0] for module in get_imported_modules(process.stderr)} & HEAVY_MODULES
+    assert not heavy_modules, f"`cli.py {' '.join(argv)}` imported {sorted(heavy_modules)}; import them where they're used instead."
@@ -0,0 +1,30 @@
+import os
+
+from benchmarks.fixtures import FakeBBCServer
+from download_audio_files import PARTIAL_FILE_SUFFIX, download_mp3_from_url, download_mp3_files
+
+
+def test_download_resumes_with_range_request_after_connection_drops(tmp_path):
+    with FakeBBCServer(num_pages=1, programmes_per_page=1, latency=0.0, mp3_size=500_000, drop_audio_after=200_000) as server:
+        url = server.audio_urls[0]
+        filepath = download_mp3_from_url(url, tmp_path, chunk_size=16 * 1024)
+
+        assert server.num_range_requests == 1
+        with open(filepath, mode="rb") as infile:
+            assert infile.read() == server.mp3
+        assert not os.path.exists(filepath + PARTIAL_FILE_SUFFIX)
+
+
+def test_download_resumes_from_existing_partial_file(tmp_path):
+    with FakeBBCServer(num_pages=1, programmes_per_page=2, latency=0.0, mp3_size=100_000) as server:
+        url = server.audio_urls[0]
+        with open(os.path.join(tmp_path, os.path.basename(url)) + PARTIAL_FILE_SUFFIX, mode="wb") as outfile:
+            outfile.write(server.mp3[:40_000])
+
+        errors = download_mp3_files(server.audio_urls, tmp_path, workers=2, requests_per_second=None)
+
+        assert errors == {}
+        assert server.num_range_requests == 1
+        for url in server.audio_urls:
+            with open(os.path.join(tmp_path, os.path.basename(url)), mode="rb") as infile:
+                assert infile.read() == server.mp3
@@ -0,0 +1,46 @@
+import os
+
+from html_archive import HtmlArchive
+
+
+def test_rebuild_index_restores_deduplicated_and_reverted_pages(tmp_path):
+    archive = HtmlArchive(tmp_path)
+    archive.put("a", "https://example.org/a", b"<html>x</html>")
+    archive.put("b", "https://example.org/b", b"<html>x</html>")  # <- same content as 'a'
+    archive.put("c", "https://example.org/c", b"<html>v1</html>")
+    archive.put("c", "https://example.org/c", b"<html>v2</html>")
+    archive.put("c", "https://example.org/c", b"<html>v1</html>")  # <- back to content already stored
+
+    before = {programme_id: archive.get(programme_id) for programme_id in ("a", "b", "c")}
+    assert archive.rebuild_index() == 5  # <- 3 records with content, 2 revisits
+    after = {programme_id: archive.get(programme_id) for programme_id in ("a", "b", "c")}
+
+    assert after == before
+    assert after["b"]["html"] == "<html>x</html>"
+    assert after["b"]["url"] == "https://example.org/b"
+    assert after["c"]["html"] == "<html>v1</html>"
+    assert archive.summary()["num_records"] == 3
+    archive.close()
+
+
+def test_reopen_indexes_records_appended_after_last_commit(tmp_path):
+    archive = HtmlArchive(tmp_path)
+    archive.put("a", "https://example.org/a", b"<html>x</html>")
+    archive.put("b", "https://example.org/b", b"<html>x</html>")
+    archive.close()
+
+    # index lost (e.g. deleted), shards intact
+    os.remove(tmp_path / "index.sqlite")
+    archive = HtmlArchive(tmp_path)
+    assert archive.get("b")["html"] == "<html>x</html>"
+    assert archive.programme_ids() == ["a", "b"]
+    archive.close()
+
+
+def test_unchanged_put_appends_nothing(tmp_path):
+    archive = HtmlArchive(tmp_path)
+    assert archive.put("a", "https://example.org/a", b"<html>x</html>")
+    size = archive.summary()["compressed_bytes"]
+    assert not archive.put("a", "https://example.org/a", b"<html>x</html>")
+    assert archive.summary()["compressed_bytes"] == size
+    archive.close()
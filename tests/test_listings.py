@@ -0,0 +1,70 @@
+import requests
+from timeit import default_timer as timer
+
+from benchmarks.fixtures import FakeBBCServer
+from listings import collect_listed_programme_urls_from_single_page, crawl_all_listing_pages, crawl_new_listing_pages
+from programme_url_store import ProgrammeUrlStore
+from utils import SessionConfig, crawl_urls, configure_session
+
+
+def test_crawl_urls_stays_within_global_rate_limit_and_captures_errors():
+    requests_per_second = 5.0
+    with FakeBBCServer(num_pages=10, programmes_per_page=2, latency=0.0) as server:
+        listing_urls = server.get_listing_urls()
+        missing_url = f"{server.base_url}/missing"
+        target_urls = listing_urls[:5] + [missing_url] + listing_urls[5:]
+
+        start_time = timer()
+        results = crawl_urls(collect_listed_programme_urls_from_single_page, target_urls, max_concurrency=8, requests_per_second=requests_per_second)
+        total_time = timer() - start_time
+
+    # the first `requests_per_second` requests are a burst; the rest are spaced out across all 8 threads
+    assert total_time >= 0.9 * (len(target_urls) - requests_per_second) / requests_per_second
+    assert server.num_requests == len(target_urls)
+
+    assert isinstance(results[5], requests.HTTPError)
+    assert results[5].response.status_code == 404
+    expected_urls = [server.programme_urls[i:i + 2] for i in range(0, 20, 2)]
+    assert results[:5] + results[6:] == expected_urls
+
+
+def test_crawl_all_listing_pages_adds_every_programme(tmp_path):
+    store = ProgrammeUrlStore(tmp_path / "programme_urls.sqlite")
+    with FakeBBCServer(num_pages=3, programmes_per_page=4, latency=0.0) as server:
+        new_urls = crawl_all_listing_pages(store, server.listing_url_template, concurrency=4, requests_per_second=100.0)
+    assert sorted(new_urls) == sorted(server.programme_urls)
+    assert len(store) == 12
+    store.close()
+
+
+def test_only_a_full_crawl_without_errors_counts_as_complete(tmp_path):
+    store = ProgrammeUrlStore(tmp_path / "programme_urls.sqlite")
+    with FakeBBCServer(num_pages=3, programmes_per_page=4, latency=0.0) as server:
+        crawl_all_listing_pages(store, server.listing_url_template, concurrency=4, requests_per_second=100.0, test=True)
+        assert len(store) > 0
+        assert not store.has_complete_sweep()
+
+        store.start_crawl_run("full")  # <- interrupted before it finished
+        store.finish_crawl_run(store.start_crawl_run("full"), num_pages=4, num_errors=1)
+        assert not store.has_complete_sweep()
+
+        crawl_all_listing_pages(store, server.listing_url_template, concurrency=4, requests_per_second=100.0)
+        assert store.has_complete_sweep()
+    store.close()
+
+
+def test_incremental_crawl_logs_a_failed_page_and_finishes_the_run(tmp_path):
+    store = ProgrammeUrlStore(tmp_path / "programme_urls.sqlite")
+    configure_session(max_retries=0)  # <- fail on the first 500 rather than backing off
+    try:
+        with FakeBBCServer(num_pages=3, programmes_per_page=4, latency=0.0, failing_listing_pages=(2,)) as server:
+            new_urls, num_pages_fetched = crawl_new_listing_pages(store, server.listing_url_template, requests_per_second=100.0)
+    finally:
+        configure_session(max_retries=SessionConfig.max_retries)
+
+    assert new_urls == server.programme_urls[:4]
+    assert num_pages_fetched == 1
+    finished_at, num_pages, num_errors = store.conn.execute("SELECT finished_at, num_pages, num_errors FROM crawl_runs").fetchone()
+    assert finished_at is not None
+    assert (num_pages, num_errors) == (1, 1)
+    store.close()
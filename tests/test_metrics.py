@@ -0,0 +1,29 @@
+import pytest
+
+from metrics import MetricsRecorder
+
+
+def test_observations_are_bounded_with_exact_totals():
+    recorder = MetricsRecorder(reservoir_size=1_000)
+    for value in range(100_000):
+        recorder.observe("parse", "parse_time", value / 100_000)
+
+    assert len(recorder.observations[("parse", "parse_time")].values) == 1_000
+    [summary], _ = recorder.summary()
+    assert summary["count"] == 100_000
+    assert summary["total"] == pytest.approx(sum(range(100_000)) / 100_000)
+    assert summary["max"] == 0.99999
+    # quantiles from a uniform sample of a uniform stream
+    assert summary["p50"] == pytest.approx(0.5, abs=0.05)
+    assert summary["p95"] == pytest.approx(0.95, abs=0.03)
+
+
+def test_small_streams_are_summarised_exactly():
+    recorder = MetricsRecorder()
+    for value in [3.0, 1.0, 2.0]:
+        recorder.observe("audio", "bytes", value)
+    recorder.increment("audio", "errors")
+
+    [summary], counters = recorder.summary()
+    assert (summary["count"], summary["total"], summary["p50"], summary["max"]) == (3, 6.0, 2.0, 3.0)
+    assert counters == {("audio", "errors"): 1}
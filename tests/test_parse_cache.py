@@ -0,0 +1,44 @@
+import sqlite3
+
+from parse_cache import ParseCache
+from programme_parsers import get_parser_source_hash
+
+
+def test_get_many_returns_only_cached_records(tmp_path):
+    cache = ParseCache(tmp_path / "parse_cache.sqlite", parser_name="bs4", parser_version=1, parser_source_hash="a")
+    records = {f"hash{i}": {"title": f"Episode {i}"} for i in range(1_200)}  # <- more than one `IN (...)` batch
+    cache.put_many(records)
+
+    content_hashes = list(records) + ["missing"]
+    assert cache.get_many(content_hashes) == records
+    assert cache.get_cached_hashes(content_hashes) == set(records)
+    assert cache.get("hash7") == {"title": "Episode 7"}
+    assert cache.get("missing") is None
+    cache.close()
+
+
+def test_changed_parser_source_invalidates_cache(tmp_path):
+    filepath = tmp_path / "parse_cache.sqlite"
+    cache = ParseCache(filepath, parser_name="bs4", parser_version=1, parser_source_hash="a")
+    cache.put_many({"hash": {"title": "Episode"}})
+    cache.close()
+
+    cache = ParseCache(filepath, parser_name="bs4", parser_version=1, parser_source_hash="b")
+    assert cache.get("hash") is None
+    assert cache.conn.execute("SELECT COUNT(*) FROM parsed_records").fetchone()[0] == 0
+    cache.close()
+
+
+def test_cache_from_before_source_hash_is_dropped(tmp_path):
+    filepath = tmp_path / "parse_cache.sqlite"
+    conn = sqlite3.connect(filepath)
+    conn.execute("CREATE TABLE parsed_records (content_hash TEXT NOT NULL, parser_name TEXT NOT NULL, parser_version INTEGER NOT NULL, record TEXT NOT NULL, parsed_at TEXT NOT NULL, PRIMARY KEY (content_hash, parser_name, parser_version))")
+    conn.execute("INSERT INTO parsed_records VALUES ('hash', 'bs4', 1, '{}', '')")
+    conn.commit()
+    conn.close()
+
+    cache = ParseCache(filepath, parser_name="bs4", parser_version=1, parser_source_hash=get_parser_source_hash())
+    assert cache.get("hash") is None
+    cache.put_many({"hash": {"title": "Episode"}})
+    assert cache.get("hash") == {"title": "Episode"}
+    cache.close()
@@ -0,0 +1,13 @@
+import os
+
+from parse_programmes import save_parse_errors
+
+
+def test_run_without_errors_removes_stale_errors_csv(tmp_path):
+    filepath = tmp_path / "parse_errors.csv"
+    assert save_parse_errors([{"programme_id": "p001", "error": "ValueError: bad page"}], filepath)
+    assert filepath.read_text().splitlines() == ["programme_id,error", "p001,ValueError: bad page"]
+
+    assert not save_parse_errors([], filepath)
+    assert not os.path.exists(filepath)
+    assert not save_parse_errors([], filepath)  # <- nothing to remove
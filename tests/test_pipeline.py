@@ -0,0 +1,40 @@
+import os
+
+from audio_manifest import AudioManifest
+from benchmarks.fixtures import FakeBBCServer
+from pipeline import _AudioDownloader
+
+
+def _parsed(programme_id: str, audio_url: str) -> dict:
+    return {"programme_id": programme_id, "record": {"audio_url": audio_url, "duration": "45 minutes"}}
+
+
+def test_audio_stage_records_downloads_in_manifest(tmp_path):
+    audio_dir = tmp_path / "audio_files"
+    os.makedirs(audio_dir)
+    manifest_filepath = str(tmp_path / "audio_manifest.sqlite")
+
+    with FakeBBCServer(num_pages=1, programmes_per_page=3, latency=0.0, mp3_size=50_000) as server:
+        first_url, second_url, _ = server.audio_urls  # <- the fake site serves the same mp3 bytes for every url
+        downloader = _AudioDownloader(str(audio_dir), manifest_filepath)
+
+        outputs = []
+        for programme_id, audio_url in [("p001", first_url), ("p002", second_url), ("p003", first_url)]:
+            parsed = _parsed(programme_id, audio_url)
+            up_to_date = downloader.is_up_to_date(parsed)
+            outputs.append(up_to_date if up_to_date is not None else downloader.download(parsed))
+
+        # a later run finds both urls already stored
+        rerun = _AudioDownloader(str(audio_dir), manifest_filepath)
+        assert rerun.is_up_to_date(_parsed("p002", second_url)) == outputs[0]
+
+    first_filepath = os.path.join(audio_dir, os.path.basename(first_url))
+    assert outputs == [[first_filepath], [first_filepath], []]  # <- identical audio stored once; p003 shares p001's url
+    assert os.listdir(audio_dir) == [os.path.basename(first_url)]
+
+    manifest = AudioManifest(manifest_filepath)
+    assert {audio_file["url"]: audio_file["filename"] for audio_file in manifest.get_all()} == {url: os.path.basename(first_url) for url in (first_url, second_url)}
+    assert manifest.summary()["num_files"] == 1
+    programme_urls = dict(manifest.conn.execute("SELECT programme_id, url FROM programme_audio").fetchall())
+    assert programme_urls == {"p001": first_url, "p002": second_url, "p003": first_url}
+    manifest.close()
@@ -0,0 +1,46 @@
+import os
+import glob
+
+import pytest
+
+from programme_parsers import PARSER_BACKENDS, get_parser_backend
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "programme_html")
+FIXTURE_PAGES = sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.html")))
+UNAVAILABLE_PAGE = os.path.join(FIXTURES_DIR, "p00xyz99.html")  # <- 'no longer available' page; every backend should fail on it
+
+
+def _read(filepath: str) -> str:
+    with open(filepath) as infile:
+        return infile.read()
+
+
+@pytest.mark.parametrize("filepath", [filepath for filepath in FIXTURE_PAGES if filepath != UNAVAILABLE_PAGE], ids=os.path.basename)
+def test_backends_produce_identical_records(filepath):
+    html = _read(filepath)
+    records = {name: get_parser_backend(name).parse(html) for name in PARSER_BACKENDS}
+    reference = records.pop("bs4")
+    for name, record in records.items():
+        assert record == reference, f"'{name}' output differs from 'bs4'"
+
+
+def test_backends_fail_on_the_same_pages():
+    html = _read(UNAVAILABLE_PAGE)
+    for name in PARSER_BACKENDS:
+        with pytest.raises(Exception):
+            get_parser_backend(name).parse(html)
+
+
+def test_reference_record():
+    record = get_parser_backend("lxml").parse(_read(os.path.join(FIXTURES_DIR, "b006qykl.html")))
+    assert record["title"] == "Sample Guest"
+    assert record["duration"] == "45 minutes"
+    assert record["long_description"].splitlines() == [
+        "The presenter’s castaway this week is Sample Guest.",
+        "Born in Leeds & raised in Cardiff, they spent forty years building bridges.",
+        "Producer: Sample Producer",
+    ]
+    assert record["audio_url"].startswith("https://open.live.bbc.co.uk/")
+    assert record["previous_broadcasts"] == [{"date": "Sun 14 Mar 2021", "time": "11:15"}, {"date": "Fri 19 Mar 2021", "time": "09:00"}]
+    assert [credit["name"] for credit in record["credits"]] == ["Sample Presenter", "Sample Guest", "Sample Producer"]
+    assert record["featured_collections"] == [{"title": "Castaways: Engineers", "description": "Builders, designers & makers."}]
@@ -0,0 +1,30 @@
+from datetime import date
+
+import pytest
+
+from programme_schema import BroadcastDateError, ProgrammeFrameBuilder, parse_broadcast_date
+
+
+def _record(broadcast_date: str) -> dict:
+    return {
+        "title": "Sample", "duration": "45 minutes", "short_description": "", "long_description": "", "audio_url": None, "photo_url": None,
+        "previous_broadcasts": [{"date": broadcast_date, "time": "09:00"}], "credits": None, "featured_collections": None, "related_links": None,
+    }
+
+
+def test_parse_broadcast_date():
+    assert parse_broadcast_date("Thu 5 Dec 2019") == date(2019, 12, 5)
+    assert parse_broadcast_date("5 December 2019") == date(2019, 12, 5)
+    assert parse_broadcast_date(None) is None
+    assert parse_broadcast_date("  ") is None
+    with pytest.raises(BroadcastDateError):
+        parse_broadcast_date("Thursday 05/12/2019")
+
+
+def test_unparseable_broadcast_date_is_not_written():
+    builder = ProgrammeFrameBuilder()
+    builder.append("p001", _record("Thu 5 Dec 2019"))
+    with pytest.raises(BroadcastDateError):
+        builder.append("p002", _record("Today"))
+    frame = builder.build()
+    assert frame["programme_id"].to_list() == ["p001"]
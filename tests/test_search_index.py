@@ -0,0 +1,52 @@
+import json
+
+from search_index import SearchIndex
+from transcript_store import TranscriptStore, convert_transcription_dir
+
+
+def write_transcription(dirpath, episode_id: str, texts: list[str]) -> None:
+    segments = [{"id": index, "start": 5.0 * index, "end": 5.0 * (index + 1), "text": text} for index, text in enumerate(texts)]
+    with open(dirpath / f"{episode_id}.json", mode="w") as outfile:
+        json.dump({"text": "".join(texts), "segments": segments, "language": "en"}, outfile)
+
+
+def build_store(tmp_path, transcriptions: dict[str, list[str]]) -> TranscriptStore:
+    json_dir = tmp_path / "json"
+    json_dir.mkdir(exist_ok=True)
+    for file in json_dir.iterdir():
+        file.unlink()
+    for episode_id, texts in transcriptions.items():
+        write_transcription(json_dir, episode_id, texts)
+    convert_transcription_dir(json_dir, tmp_path / "transcripts.arrow")
+    return TranscriptStore(tmp_path / "transcripts.arrow")
+
+
+def count_documents(search_index: SearchIndex) -> tuple[int, int]:
+    return (
+        search_index.conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0],
+        search_index.conn.execute("SELECT COUNT(*) FROM document_rowids").fetchone()[0],
+    )
+
+
+def test_reindexing_replaces_changed_and_removes_missing_transcripts(tmp_path):
+    search_index = SearchIndex(tmp_path / "search_index.sqlite")
+    store = build_store(tmp_path, {"a": [" the nile delta", " pharaohs"], "b": [" black holes"], "c": [" the enlightenment"]})
+    assert search_index.index_transcripts(store) == 3
+    assert count_documents(search_index) == (4, 4)
+
+    store = build_store(tmp_path, {"a": [" the nile delta", " pharaohs"], "b": [" neutron stars", " pulsars"]})
+    assert search_index.index_transcripts(store) == 1  # <- only 'b' changed; 'c' was removed
+
+    assert [hit["episode_id"] for hit in search_index.search("nile")] == ["a"]
+    assert [hit["episode_id"] for hit in search_index.search("pulsars")] == ["b"]
+    assert search_index.search("black holes") == []
+    assert search_index.search("enlightenment") == []
+    assert count_documents(search_index) == (4, 4)
+    search_index.close()
+
+
+def test_deletes_by_rowid_instead_of_scanning(tmp_path):
+    search_index = SearchIndex(tmp_path / "search_index.sqlite")
+    plan = search_index.conn.execute("EXPLAIN QUERY PLAN SELECT document_rowid FROM document_rowids WHERE source = ?", ("transcript:a",)).fetchall()
+    assert "USING COVERING INDEX" in plan[0]["detail"] or "USING INDEX" in plan[0]["detail"]
+    search_index.close()
@@ -0,0 +1,17 @@
+from benchmarks.fixtures import generate_speech_like_audio, write_wav_file
+from transcription import get_audio_duration
+
+
+def test_get_audio_duration_reads_wav_header(tmp_path):
+    filepath = write_wav_file(str(tmp_path / "episode.wav"), generate_speech_like_audio(3.0))
+    assert get_audio_duration(filepath) == 3.0
+
+
+def test_get_audio_duration_of_unreadable_wav_is_unknown(tmp_path):
+    empty_filepath = tmp_path / "empty.wav"
+    empty_filepath.write_bytes(b"")
+    garbage_filepath = tmp_path / "garbage.wav"
+    garbage_filepath.write_bytes(b"not a wav file" * 100)
+
+    assert get_audio_duration(str(empty_filepath)) is None
+    assert get_audio_duration(str(garbage_filepath)) is None
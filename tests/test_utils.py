@@ -0,0 +1,16 @@
+import pytest
+import requests
+
+from benchmarks.fixtures import FakeBBCServer
+from utils import get_html_from_url, http_get
+
+
+def test_http_get_only_raises_for_error_status_when_asked():
+    with FakeBBCServer(num_pages=1, programmes_per_page=1, latency=0.0) as server:
+        missing_url = f"{server.base_url}/missing"
+        assert http_get(missing_url).status_code == 404
+        with pytest.raises(requests.HTTPError):
+            http_get(missing_url, raise_for_status=True)
+        with pytest.raises(requests.HTTPError):
+            get_html_from_url(missing_url)
+        assert http_get(server.programme_urls[0], raise_for_status=True).status_code == 200
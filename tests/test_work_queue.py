@@ -0,0 +1,80 @@
+import time
+import threading
+from timeit import default_timer as timer
+
+import pytest
+
+from work_queue import RateLimiter, WorkQueue, run_work_queue
+
+
+def _square(x: int) -> int:
+    time.sleep(0.001 * (x % 5))  # <- items finish out of order
+    return x * x
+
+
+def _fail_on_multiples_of_seven(x: int) -> int:
+    if x % 7 == 0:
+        raise ValueError(f"bad item {x}")
+    return x
+
+
+@pytest.mark.parametrize("backend", ["thread", "process"])
+def test_ordered_results_follow_input_order(backend):
+    results = list(run_work_queue(_square, range(50), backend=backend, workers=4, ordered=True))
+    assert [result["index"] for result in results] == list(range(50))
+    assert [result["result"] for result in results] == [x * x for x in range(50)]
+
+
+def test_unordered_results_cover_every_item():
+    results = list(run_work_queue(_square, range(50), workers=4))
+    assert sorted(result["index"] for result in results) == list(range(50))
+    assert all(result["result"] == result["item"] ** 2 for result in results)
+
+
+def test_errors_are_reported_per_item():
+    results = list(run_work_queue(_fail_on_multiples_of_seven, range(30), workers=4, ordered=True))
+    failed = [result["item"] for result in results if result["error"] is not None]
+    assert failed == [0, 7, 14, 21, 28]
+    assert all(isinstance(results[x]["error"], ValueError) for x in failed)
+    assert [result["result"] for result in results if result["error"] is None] == [x for x in range(30) if x % 7]
+
+
+def test_cancel_drops_items_not_yet_started():
+    started = []
+    lock = threading.Lock()
+
+    def work(x: int) -> int:
+        with lock:
+            started.append(x)
+        time.sleep(0.01)
+        return x
+
+    num_yielded = 0
+    with WorkQueue(work, workers=2, max_in_flight=2) as queue:
+        for result in queue.map(range(1_000)):
+            num_yielded += 1
+            if num_yielded == 5:
+                queue.cancel()
+    assert num_yielded < 10
+    assert len(started) == num_yielded  # <- every item that started is still handed back
+
+
+def test_rate_limit_is_shared_across_workers_and_kept_per_key():
+    requests_per_second = 20.0
+    items = [f"host{i % 2}/{i}" for i in range(60)]  # <- two keys, 30 items each
+
+    start_time = timer()
+    results = list(run_work_queue(lambda item: item, items, workers=8, requests_per_second=requests_per_second, rate_limit_key=lambda item: item.split("/")[0]))
+    total_time = timer() - start_time
+
+    assert len(results) == 60
+    # each key starts with a burst of `requests_per_second` tokens, then 10 more items at 20/s; 8 workers don't multiply the rate
+    assert 0.9 * 10 / requests_per_second <= total_time < 2 * 10 / requests_per_second + 0.5
+
+
+def test_rate_limiter_reserve():
+    rate_limiter = RateLimiter(requests_per_second=10.0, burst=2)
+    assert rate_limiter.reserve("a") == 0.0
+    assert rate_limiter.reserve("a") == 0.0
+    assert 0.05 < rate_limiter.reserve("a") <= 0.1
+    assert rate_limiter.reserve("b") == 0.0  # <- separate bucket per key
@@ -0,0 +1,126 @@
+import os
+import json
+import argparse
+from pathlib import Path
+
+import polars as pl
+
+
+## -- CONSOLIDATED TRANSCRIPT STORE ----
+## -- every segment of every episode in one uncompressed arrow ipc file (memory-mappable), sorted by episode,
+## -- plus a small index of each episode's row offset so one episode can be sliced out without reading the rest
+
+SEGMENT_SCHEMA = pl.Schema({
+    "episode_id": pl.String,
+    "segment_id": pl.Int32,
+    "start": pl.Float64,
+    "end": pl.Float64,
+    "text": pl.String,
+    "avg_logprob": pl.Float64,
+})
+
+INDEX_SCHEMA = pl.Schema({
+    "episode_id": pl.String,
+    "offset": pl.Int64,
+    "num_segments": pl.Int64,
+    "duration": pl.Float64,
+    "language": pl.String,
+})
+
+
+def get_index_filepath(store_filepath: Path | str) -> str:
+    return f"{os.path.splitext(str(store_filepath))[0]}_index.parquet"
+
+
+def read_transcription_segments(episode_id: str, filepath: Path | str) -> tuple[pl.DataFrame, str | None]:
+    with open(filepath, mode="r") as infile:
+        transcribed = json.load(infile)
+
+    segments = pl.DataFrame(
+        {
+            "episode_id": [episode_id] * len(transcribed["segments"]),
+            "segment_id": [segment["id"] for segment in transcribed["segments"]],
+            "start": [segment["start"] for segment in transcribed["segments"]],
+            "end": [segment["end"] for segment in transcribed["segments"]],
+            "text": [segment["text"] for segment in transcribed["segments"]],
+            "avg_logprob": [segment.get("avg_logprob") for segment in transcribed["segments"]],
+        },
+        schema=SEGMENT_SCHEMA
+    )
+    return segments, transcribed.get("language")
+
+
+def convert_transcription_dir(json_dir: Path | str, store_filepath: Path | str) -> pl.DataFrame:
+    """Convert a directory of per-episode whisper json files (see `batch_transcribe.py`) into a transcript store. Returns the episode index."""
+    json_files = sorted(file for file in os.listdir(json_dir) if file.endswith(".json"))
+
+    episode_segments = []
+    index_rows = []
+    offset = 0
+    for file in json_files:
+        episode_id = os.path.splitext(file)[0]
+        segments, language = read_transcription_segments(episode_id, os.path.join(json_dir, file))
+        episode_segments.append(segments)
+        index_rows.append({
+            "episode_id": episode_id,
+            "offset": offset,
+            "num_segments": len(segments),
+            "duration": segments["end"].max() if len(segments) > 0 else 0.0,
+            "language": language,
+        })
+        offset += len(segments)
+
+    all_segments = pl.concat(episode_segments, rechunk=True) if episode_segments else SEGMENT_SCHEMA.to_frame()
+    index = pl.DataFrame(index_rows, schema=INDEX_SCHEMA)
+
+    # uncompressed so readers can memory map the file instead of decoding it
+    tmp_filepath = f"{store_filepath}.tmp"
+    all_segments.write_ipc(tmp_filepath, compression="uncompressed")
+    os.replace(tmp_filepath, store_filepath)
+    index.write_parquet(get_index_filepath(store_filepath))
+    return index
+
+
+class TranscriptStore:
+
+    def __init__(self, store_filepath: Path | str):
+        self.store_filepath = str(store_filepath)
+        self.index = pl.read_parquet(get_index_filepath(store_filepath))
+        self._offsets = {
+            row["episode_id"]: (row["offset"], row["num_segments"])
+            for row in self.index.select("episode_id", "offset", "num_segments").iter_rows(named=True)
+        }
+        self._segments: pl.DataFrame | None = None
+
+    def __contains__(self, episode_id: str) -> bool:
+        return episode_id in self._offsets
+
+    def episode_ids(self) -> list[str]:
+        return list(self._offsets)
+
+    def scan(self) -> pl.LazyFrame:
+        # polars memory maps local ipc files, so slicing only touches the pages holding the requested rows
+        return pl.scan_ipc(self.store_filepath)
+
+    def get_segments(self, episode_id: str) -> pl.DataFrame:
+        if episode_id not in self._offsets:
+            raise KeyError(f"Episode '{episode_id}' not found in transcript store '{self.store_filepath}'.")
+        # the file is read once and each episode sliced out of it; a fresh `scan().slice()` per episode re-reads the ipc footer every time
+        if self._segments is None:
+            self._segments = pl.read_ipc(self.store_filepath)
+        offset, num_segments = self._offsets[episode_id]
+        return self._segments.slice(offset, num_segments)
+
+    def get_segments_in_range(self, episode_id: str, start: float, end: float) -> pl.DataFrame:
+        """Segments of `episode_id` overlapping the time range [start, end) in seconds."""
+        return self.get_segments(episode_id).filter((pl.col("end") > start) & (pl.col("start") < end))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert per-episode transcription json files into a consolidated transcript store.")
+    parser.add_argument("json_dir", type=str, help="Directory of transcription json files written by `batch_transcribe.py`.")
+    parser.add_argument("-o", "--output", type=str, default=os.path.join("data", "transcripts.arrow"), help="Path of the transcript store to write.")
+    args = parser.parse_args()
+
+    index = convert_transcription_dir(args.json_dir, args.output)
+    print(f"-> Converted {len(index):,} transcriptions ({index['num_segments'].sum():,} segments) to '{args.output}'.")
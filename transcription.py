@@ -0,0 +1,372 @@
+from __future__ import annotations
+
+import os
+import json
+import time
+import wave
+import subprocess
+from typing import TYPE_CHECKING, Protocol, TypedDict, Iterator
+from concurrent.futures import as_completed, wait, FIRST_COMPLETED
+from timeit import default_timer as timer
+
+from metrics import METRICS
+
+if TYPE_CHECKING:
+    import numpy as np
+    from audio_chunking import AudioChunk
+    from audio_cache import CachedAudio
+
+## NOTE: numpy (through `audio_chunking` and `audio_cache`) and the process pool are imported by the functions that
+## decode audio or start workers, so the backend registry can be read, e.g. to build a CLI, without loading them.
+
+
+## -- TRANSCRIPTION BACKENDS ----
+## -- heavy model libraries are only imported inside `load`, so each backend is usable without the others installed
+
+class TranscriptionBackend(Protocol):
+    name: str
+    default_model: str
+
+    def load(self, model: str) -> None:
+        ...
+
+    def transcribe(self, audio: str | np.ndarray) -> dict:
+        """`audio` is a filepath or 16kHz mono float32 samples. Returns whisper-style output: {"text": ..., "segments": [...], "language": ...}"""
+        ...
+
+
+class MlxWhisperBackend:
+    name = "mlx_whisper"
+    default_model = "mlx-community/distil-whisper-large-v3"
+
+    def load(self, model: str) -> None:
+        import mlx_whisper
+        self._mlx_whisper = mlx_whisper
+        self.model = model
+        # NOTE: mlx_whisper keeps the most recently loaded model in memory, keyed by path,
+        # so a long-lived worker only pays the load cost on its first file.
+
+    def transcribe(self, audio: str | np.ndarray) -> dict:
+        return self._mlx_whisper.transcribe(audio, path_or_hf_repo=self.model)
+
+
+class FasterWhisperBackend:
+    """CPU backend via CTranslate2; for running on Linux boxes without Apple silicon."""
+    name = "faster_whisper"
+    default_model = "distil-large-v3"
+
+    def __init__(self, device: str = "cpu", compute_type: str = "int8"):
+        self.device = device
+        self.compute_type = compute_type
+
+    def load(self, model: str) -> None:
+        from faster_whisper import WhisperModel
+        self.model = WhisperModel(model, device=self.device, compute_type=self.compute_type)
+
+    def transcribe(self, audio: str | np.ndarray) -> dict:
+        segments, info = self.model.transcribe(audio)
+        segments = [
+            {
+                "id": segment.id,
+                "seek": segment.seek,
+                "start": segment.start,
+                "end": segment.end,
+                "text": segment.text,
+                "tokens": segment.tokens,
+                "temperature": segment.temperature,
+                "avg_logprob": segment.avg_logprob,
+                "compression_ratio": segment.compression_ratio,
+                "no_speech_prob": segment.no_speech_prob,
+            }
+            for segment in segments  # <- generator; transcription happens while iterating
+        ]
+        return {
+            "text": "".join(segment["text"] for segment in segments),
+            "segments": segments,
+            "language": info.language,
+        }
+
+
+class FakeTranscriptionBackend:
+    """Produces a fixed-length segment every `segment_length` seconds of audio, optionally sleeping to simulate a model
+    running at `realtime_factor`. Used for exercising the scheduling logic without a model."""
+    name = "fake"
+    default_model = "fake"
+
+    def __init__(self, segment_length: float = 5.0, realtime_factor: float = 0.0):
+        self.segment_length = segment_length
+        self.realtime_factor = realtime_factor
+
+    def load(self, model: str) -> None:
+        self.model = model
+
+    def transcribe(self, audio: str | np.ndarray) -> dict:
+        from audio_chunking import SAMPLE_RATE
+        duration = (get_audio_duration(audio) or 0.0) if isinstance(audio, str) else len(audio) / SAMPLE_RATE
+        time.sleep(duration * self.realtime_factor)
+
+        segments = []
+        start = 0.0
+        while start < duration:
+            end = min(start + self.segment_length, duration)
+            segments.append({
+                "id": len(segments),
+                "seek": 0,
+                "start": start,
+                "end": end,
+                "text": f" segment {len(segments)}",
+                "tokens": [],
+                "temperature": 0.0,
+                "avg_logprob": -0.1,
+                "compression_ratio": 1.0,
+                "no_speech_prob": 0.0,
+            })
+            start = end
+        return {
+            "text": "".join(segment["text"] for segment in segments),
+            "segments": segments,
+            "language": "en",
+        }
+
+
+TRANSCRIPTION_BACKENDS: dict[str, type[TranscriptionBackend]] = {
+    MlxWhisperBackend.name: MlxWhisperBackend,
+    FasterWhisperBackend.name: FasterWhisperBackend,
+    FakeTranscriptionBackend.name: FakeTranscriptionBackend,
+}
+
+DEFAULT_TRANSCRIPTION_BACKEND = MlxWhisperBackend.name
+
+
+def get_transcription_backend(name: str = DEFAULT_TRANSCRIPTION_BACKEND) -> TranscriptionBackend:
+    if name not in TRANSCRIPTION_BACKENDS:
+        raise ValueError(f"Unknown transcription backend '{name}'. Available backends: {list(TRANSCRIPTION_BACKENDS)}.")
+    return TRANSCRIPTION_BACKENDS[name]()
+
+
+## -- AUDIO DURATION ----
+
+def get_audio_duration(filepath: str) -> float | None:
+    """Duration in seconds. Reads wav headers directly; other formats need `ffprobe` on the path. Returns `None` if unknown."""
+    if filepath.endswith(".wav"):
+        try:
+            with wave.open(filepath, mode="rb") as wav_file:
+                return wav_file.getnframes() / wav_file.getframerate()
+        except (wave.Error, EOFError):
+            pass  # <- truncated, or not PCM (e.g. float wavs); ffprobe may still read it
+
+    try:
+        probe = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", filepath],
+            capture_output=True, text=True, check=True
+        )
+        return float(probe.stdout.strip())
+    except (FileNotFoundError, subprocess.CalledProcessError, ValueError):
+        return None
+
+
+## -- SCHEDULER ----
+
+class TranscriptionJob(TypedDict):
+    id: str
+    filepath: str
+    duration: float | None
+    cached_audio_filepath: str | None  # <- decoded samples in the audio cache (see `audio_cache.py`), if any
+
+
+class TranscriptionResult(TypedDict):
+    id: str
+    filepath: str
+    output_filepath: str | None
+    audio_duration: float | None
+    transcribe_time: float
+    realtime_factor: float | None
+    error: str | None
+
+
+def create_transcription_job(audio_file_id: str, filepath: str, cached: CachedAudio | None = None) -> TranscriptionJob:
+    if cached is not None:
+        return TranscriptionJob(id=audio_file_id, filepath=filepath, duration=cached["duration"], cached_audio_filepath=cached["cache_filepath"])
+    return TranscriptionJob(id=audio_file_id, filepath=filepath, duration=get_audio_duration(filepath), cached_audio_filepath=None)
+
+
+def get_job_audio(job: TranscriptionJob) -> str | np.ndarray:
+    # memory mapped samples from the audio cache skip the ffmpeg decode the model would otherwise run on the filepath
+    if job["cached_audio_filepath"] is not None:
+        from audio_cache import load_cached_audio
+        return load_cached_audio(job["cached_audio_filepath"])
+    return job["filepath"]
+
+
+def order_longest_first(jobs: list[TranscriptionJob]) -> list[TranscriptionJob]:
+    """Longest-processing-time-first ordering, which keeps the makespan low when jobs are spread across workers.
+    Falls back on file size when a duration is unknown."""
+    return sorted(jobs, key=lambda job: (job["duration"] or 0.0, os.path.getsize(job["filepath"])), reverse=True)
+
+
+def record_transcription_metrics(result: TranscriptionResult) -> None:
+    # workers run in their own processes, so results are recorded by whoever collects them
+    if result["error"] is not None:
+        METRICS.increment("transcription", "errors")
+        return
+    METRICS.observe("transcription", "transcribe_time", result["transcribe_time"], id=result["id"])
+    if result["audio_duration"] is not None:
+        METRICS.observe("transcription", "audio_duration", result["audio_duration"], id=result["id"])
+    if result["realtime_factor"] is not None:
+        METRICS.observe("transcription", "realtime_factor", result["realtime_factor"], id=result["id"])
+
+
+def is_complete_transcription(filepath: str) -> bool:
+    # files half-written by a crashed run (before outputs were written atomically) fail to load
+    try:
+        with open(filepath, mode="r") as infile:
+            return "segments" in json.load(infile)
+    except (OSError, ValueError):
+        return False
+
+
+def write_transcription(transcribed: dict, output_filepath: str) -> None:
+    # written to a temp file and renamed, so a crash never leaves a half-written transcription behind
+    tmp_filepath = f"{output_filepath}.tmp"
+    with open(tmp_filepath, mode="w") as outfile:
+        json.dump(transcribed, outfile)
+        outfile.close()
+    os.replace(tmp_filepath, output_filepath)
+
+
+_worker_backend: TranscriptionBackend | None = None
+
+def init_worker(backend_name: str, model: str | None) -> None:
+    # runs once per worker process; the model stays loaded for every job that worker handles
+    global _worker_backend
+    _worker_backend = get_transcription_backend(backend_name)
+    _worker_backend.load(model or _worker_backend.default_model)
+
+
+def run_transcription_job(job: TranscriptionJob, output_dir: str) -> TranscriptionResult:
+    start_time = timer()
+    try:
+        transcribed = _worker_backend.transcribe(get_job_audio(job))
+        output_filepath = os.path.join(output_dir, f"{job['id']}.json")
+        write_transcription(transcribed, output_filepath)
+        error = None
+    except Exception as e:
+        output_filepath = None
+        error = f"{type(e).__name__}: {e}"
+    total_time = timer() - start_time
+
+    return TranscriptionResult(
+        id=job["id"],
+        filepath=job["filepath"],
+        output_filepath=output_filepath,
+        audio_duration=job["duration"],
+        transcribe_time=total_time,
+        realtime_factor=(total_time / job["duration"]) if job["duration"] else None,
+        error=error
+    )
+
+
+def run_transcription_jobs(jobs: list[TranscriptionJob], output_dir: str, backend_name: str = DEFAULT_TRANSCRIPTION_BACKEND, model: str | None = None, workers: int = 1) -> Iterator[TranscriptionResult]:
+    """Transcribe `jobs` longest-first across `workers` processes, each loading the model once. Results are yielded as jobs complete."""
+    assert isinstance(workers, int) and workers > 0, f"Input '{workers}' for argument `workers` must be a positive int."
+    jobs = order_longest_first(jobs)
+
+    if workers == 1:
+        init_worker(backend_name, model)
+        for job in jobs:
+            yield run_transcription_job(job, output_dir)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import get_context
+
+    # spawn rather than fork; model libraries generally aren't fork-safe
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"), initializer=init_worker, initargs=(backend_name, model)) as executor:
+        futures = [executor.submit(run_transcription_job, job, output_dir) for job in jobs]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+## -- CHUNKED SCHEDULER ----
+## -- each file is decoded once and split on silence, so a single long episode is spread across every worker
+
+def _transcribe_chunk(audio: np.ndarray) -> dict:
+    return _worker_backend.transcribe(audio)
+
+
+class _ChunkedJobState(TypedDict):
+    job: TranscriptionJob
+    chunks: list[AudioChunk]
+    transcriptions: list[dict | None]
+    remaining: int
+    start_time: float
+    error: str | None
+
+
+def _finish_chunked_job(state: _ChunkedJobState, output_dir: str) -> TranscriptionResult:
+    from audio_chunking import stitch_transcriptions
+    job = state["job"]
+    output_filepath = None
+    if state["error"] is None:
+        output_filepath = os.path.join(output_dir, f"{job['id']}.json")
+        write_transcription(stitch_transcriptions(state["chunks"], state["transcriptions"]), output_filepath)
+
+    total_time = timer() - state["start_time"]
+    return TranscriptionResult(
+        id=job["id"],
+        filepath=job["filepath"],
+        output_filepath=output_filepath,
+        audio_duration=job["duration"],
+        transcribe_time=total_time,
+        realtime_factor=(total_time / job["duration"]) if job["duration"] else None,
+        error=state["error"]
+    )
+
+
+def run_chunked_transcription_jobs(jobs: list[TranscriptionJob], output_dir: str, backend_name: str = DEFAULT_TRANSCRIPTION_BACKEND, model: str | None = None, workers: int = 1, max_chunk_s: float = 300.0, overlap_s: float = 1.0) -> Iterator[TranscriptionResult]:
+    """Like `run_transcription_jobs`, but transcribes silence-delimited chunks of each file in parallel and stitches them back together.
+    Only enough files are decoded to keep every worker busy, so memory doesn't grow with the size of the queue."""
+    assert isinstance(workers, int) and workers > 0, f"Input '{workers}' for argument `workers` must be a positive int."
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import get_context
+    from audio_chunking import SAMPLE_RATE, decode_audio, split_audio
+    from audio_cache import load_cached_audio
+
+    jobs = order_longest_first(jobs)
+    max_chunks_in_flight = 2 * workers
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"), initializer=init_worker, initargs=(backend_name, model)) as executor:
+        pending = {}  # <- future -> (job state, chunk index)
+
+        def collect_completed(futures) -> Iterator[TranscriptionResult]:
+            for future in futures:
+                state, chunk_index = pending.pop(future)
+                try:
+                    state["transcriptions"][chunk_index] = future.result()
+                except Exception as e:
+                    state["error"] = f"{type(e).__name__}: {e}"
+                state["remaining"] -= 1
+                if state["remaining"] == 0:
+                    yield _finish_chunked_job(state, output_dir)
+
+        for job in jobs:
+            start_time = timer()
+            try:
+                audio = load_cached_audio(job["cached_audio_filepath"]) if job["cached_audio_filepath"] else decode_audio(job["filepath"])
+                job["duration"] = len(audio) / SAMPLE_RATE
+                chunks, chunk_audio = split_audio(audio, max_chunk_s=max_chunk_s, overlap_s=overlap_s)
+            except Exception as e:
+                yield TranscriptionResult(id=job["id"], filepath=job["filepath"], output_filepath=None, audio_duration=job["duration"], transcribe_time=timer() - start_time, realtime_factor=None, error=f"{type(e).__name__}: {e}")
+                continue
+            del audio
+
+            state = _ChunkedJobState(job=job, chunks=chunks, transcriptions=[None] * len(chunks), remaining=len(chunks), start_time=start_time, error=None)
+            for chunk_index, samples in enumerate(chunk_audio):
+                while len(pending) >= max_chunks_in_flight:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    yield from collect_completed(done)
+                pending[executor.submit(_transcribe_chunk, samples)] = (state, chunk_index)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            yield from collect_completed(done)
@@ -1,31 +1,145 @@
-import time
+from __future__ import annotations
+
+import os
+import threading
 from pathlib import Path
-from typing import Any, Callable
-from functools import partial
+from typing import TYPE_CHECKING, Any, Callable
 from datetime import datetime
-from multiprocessing import Pool
+from dataclasses import dataclass
+from timeit import default_timer as timer
+from urllib.parse import urlparse
+
+from metrics import METRICS
+from work_queue import WorkQueue
 
-import requests
-from bs4 import BeautifulSoup
+if TYPE_CHECKING:
+    import requests
+    from bs4 import BeautifulSoup
+
+## NOTE: requests and bs4 are slow to import, so they're imported where they're used;
+## scripts that only parse args (or never touch the network) don't pay for them.
 
 DEFAULT_HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/111.0.0.0 Safari/537.36'
 }
 
+
+## -- SHARED HTTP SESSION ----
+
+@dataclass
+class SessionConfig:
+    pool_size: int = 16
+    max_retries: int = 5
+    backoff_factor: float = 0.5
+    retry_status_codes: tuple[int, ...] = (429, 500, 502, 503, 504)
+    timeout: tuple[float, float] = (10.0, 60.0)  # <- (connect, read) seconds
+
+
+SESSION_CONFIG = SessionConfig()
+
+_session: requests.Session | None = None
+_session_pid: int | None = None
+_session_lock = threading.Lock()
+
+
+def create_session(config: SessionConfig) -> requests.Session:
+    """Session with a keep-alive connection pool, retrying 429/5xx responses with exponential backoff."""
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retries = Retry(
+        total=config.max_retries,
+        backoff_factor=config.backoff_factor,
+        status_forcelist=config.retry_status_codes,
+        allowed_methods=["HEAD", "GET"],
+        respect_retry_after_header=True
+    )
+    adapter = HTTPAdapter(pool_connections=config.pool_size, pool_maxsize=config.pool_size, max_retries=retries)
+
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def configure_session(pool_size: int | None = None, max_retries: int | None = None, backoff_factor: float | None = None, timeout: tuple[float, float] | None = None) -> None:
+    """Override session settings. Takes effect the next time `get_session` is called."""
+    global _session
+    if pool_size is not None:
+        SESSION_CONFIG.pool_size = pool_size
+    if max_retries is not None:
+        SESSION_CONFIG.max_retries = max_retries
+    if backoff_factor is not None:
+        SESSION_CONFIG.backoff_factor = backoff_factor
+    if timeout is not None:
+        SESSION_CONFIG.timeout = timeout
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def get_session() -> requests.Session:
+    """Shared session for the current process. Forked worker processes create their own, rather than sharing the parent's sockets."""
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            _session = create_session(SESSION_CONFIG)
+            _session_pid = os.getpid()
+        return _session
+
+
+def http_get(url: str, raise_for_status: bool = False, **kwargs) -> requests.Response:
+    """GET through the shared session. Like `requests.get`, an error status is returned as a response unless
+    `raise_for_status` is set, in which case it raises `requests.HTTPError`; either way it's counted in the http metrics."""
+    import requests
+    kwargs.setdefault("timeout", SESSION_CONFIG.timeout)
+    host = urlparse(url).netloc
+    start_time = timer()
+    try:
+        resp = get_session().get(url, **kwargs)
+    except requests.RequestException:
+        METRICS.increment("http", "errors", host=host)
+        raise
+
+    # with `stream=True` this is time to headers; the body is read (and measured) by the caller
+    METRICS.observe("http", "fetch_latency", timer() - start_time, host=host, status=resp.status_code)
+    retries = getattr(resp.raw, "retries", None)
+    if retries is not None and retries.history:
+        METRICS.increment("http", "retries", len(retries.history), host=host)
+    if not kwargs.get("stream"):
+        METRICS.observe("http", "bytes", len(resp.content), host=host)
+
+    if not resp.ok:
+        METRICS.increment("http", "errors", host=host, status=resp.status_code)
+        if raise_for_status:
+            resp.raise_for_status()
+    return resp
+
+
 def get_html_from_url(url: str) -> str:
-    resp = requests.get(url, headers=DEFAULT_HEADERS)
+    """Raises `requests.HTTPError` for an error status, so an error page is never parsed (e.g. as a listing with no programmes)."""
+    resp = http_get(url, raise_for_status=True)
     return resp.content.decode("utf-8")
 
 
 def get_soup_from_url(url: str) -> BeautifulSoup:
+    from bs4 import BeautifulSoup
     raw_html = get_html_from_url(url)
     soup = BeautifulSoup(raw_html, features="lxml")
     return soup
 
-def get_soup_from_file(filepath: Path | str) -> BeautifulSoup:
+def read_html_from_file(filepath: Path | str) -> str:
     with open(filepath, mode="r") as infile:
         html_content = infile.read()
         infile.close()
+    return html_content
+
+def get_soup_from_file(filepath: Path | str) -> BeautifulSoup:
+    from bs4 import BeautifulSoup
+    html_content = read_html_from_file(filepath)
     return BeautifulSoup(html_content, features="lxml")
 
 def save_html_to_file(html: str, filepath: Path | str) -> None:
@@ -37,29 +151,27 @@ def save_html_to_file(html: str, filepath: Path | str) -> None:
 
 
 
-def crawl_func_with_sleep_time(url: str, func: Callable, sleep_time: int):
-    time.sleep(sleep_time)
-    print(f"| crawling '{url}'")
-    try:
-        return func(url)
-    except Exception as e:
-        print(f"Encountered the following error for url '{url}'...")
-        raise Exception(e)
-
-
+## -- CRAWLING ----
+## -- urls are fetched on the `work_queue.WorkQueue` thread pool rather than an asyncio loop: the fetchers are blocking
+## -- `requests` calls through the shared session, and the queue's one `RateLimiter` keeps each host within its rate
+## -- across every thread
 
-def crawl_pooler(crawl_func: Callable, target_urls: list[str], processes: int = 4, sleep_time: int | None = None) -> list:
-    assert isinstance(processes, int), f"Input '{processes}' for argument `processes` must be type int. Instead got type '{type(processes)}'."
+def get_host(url: str) -> str:
+    return urlparse(url).netloc
 
-    # if sleep time is provided create a partial function
-    if sleep_time is not None:
-        assert isinstance(sleep_time, int), f"Input for argument `sleep_time` must be either `None` or type Int. Instead got type '{type(sleep_time)}' for input '{sleep_time}'."
-        crawl_func = partial(crawl_func_with_sleep_time, func=crawl_func, sleep_time=sleep_time)
 
-    with Pool(processes) as p:
-        crawl_results = p.map(crawl_func, target_urls)
-        p.close()
-    return crawl_results
+def crawl_urls(crawl_func: Callable, target_urls: list[str], max_concurrency: int = 8, requests_per_second: float = 2.0, return_exceptions: bool = True) -> list:
+    """Crawl `target_urls` on `max_concurrency` threads, staying within `requests_per_second` for each host across every thread.
+    Results are returned in the same order as `target_urls`. With `return_exceptions`, a failed url returns its exception instead of aborting the crawl."""
+    assert isinstance(max_concurrency, int) and max_concurrency > 0, f"Input '{max_concurrency}' for argument `max_concurrency` must be a positive int."
+    results = [None] * len(target_urls)
+    with WorkQueue(crawl_func, workers=max_concurrency, requests_per_second=requests_per_second, rate_limit_key=get_host) as queue:
+        for result in queue.map(target_urls):
+            if result["error"] is not None and not return_exceptions:
+                queue.cancel()
+                raise result["error"]
+            results[result["index"]] = result["error"] if result["error"] is not None else result["result"]
+    return results
 
 
 ## -- UTILITIES ----
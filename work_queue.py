@@ -0,0 +1,241 @@
+import time
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Iterator, Literal, TypedDict
+from itertools import islice
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from timeit import default_timer as timer
+
+if TYPE_CHECKING:
+    import asyncio
+    from concurrent.futures import ProcessPoolExecutor
+
+
+## -- BOUNDED WORK QUEUE ----
+## -- runs `func` over a (possibly lazy) iterable of items on threads, processes or an event loop, with at most
+## -- `max_in_flight` items submitted but not yet handed back, so memory stays bounded however many items there are.
+## -- results stream back as they complete; a failing item is reported in its result instead of stopping the batch
+
+ExecutorBackend = Literal["thread", "process", "async"]
+
+_POLL_INTERVAL = 0.1  # <- seconds between checks for `cancel()` while waiting on workers
+
+
+class WorkResult(TypedDict):
+    index: int                # <- position of the item in the input
+    item: Any
+    result: Any
+    error: Exception | None
+    duration: float           # <- seconds spent in `func`, measured where it ran
+
+
+class RateLimiter:
+    """Token bucket per key (e.g. per host), refilling at `requests_per_second`. Shared by every worker, so the rate
+    doesn't scale with the number of workers."""
+
+    def __init__(self, requests_per_second: float, burst: float | None = None):
+        assert requests_per_second > 0, f"Input '{requests_per_second}' for argument `requests_per_second` must be greater than zero."
+        self.requests_per_second = requests_per_second
+        self.capacity = burst if burst is not None else max(1.0, requests_per_second)
+        self.buckets: dict[str, tuple[float, float]] = {}  # <- key -> (tokens, updated_at)
+        self.lock = threading.Lock()
+
+    def reserve(self, key: str = "") -> float:
+        """Takes a token and returns 0 if one is available, else returns the seconds until one will be (without taking it)."""
+        with self.lock:
+            now = time.monotonic()
+            tokens, updated_at = self.buckets.get(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated_at) * self.requests_per_second)
+            if tokens >= 1:
+                self.buckets[key] = (tokens - 1, now)
+                return 0.0
+            self.buckets[key] = (tokens, now)
+            return (1 - tokens) / self.requests_per_second
+
+
+def _run_chunk(func: Callable, chunk: list[tuple[int, Any]]) -> list[tuple[int, Any, Exception | None, float]]:
+    results = []
+    for index, item in chunk:
+        start_time = timer()
+        try:
+            results.append((index, func(item), None, timer() - start_time))
+        except Exception as e:
+            results.append((index, None, e, timer() - start_time))
+    return results
+
+
+async def _run_chunk_async(func: Callable, chunk: list[tuple[int, Any]]) -> list[tuple[int, Any, Exception | None, float]]:
+    results = []
+    for index, item in chunk:
+        start_time = timer()
+        try:
+            results.append((index, await func(item), None, timer() - start_time))
+        except Exception as e:
+            results.append((index, None, e, timer() - start_time))
+    return results
+
+
+class WorkQueue:
+    """
+    Usage:
+        with WorkQueue(fetch, workers=8, requests_per_second=2.0, rate_limit_key=get_host) as queue:
+            for result in queue.map(urls):
+                ...
+
+    `func` must be picklable (defined at module level) for `backend="process"`, and a coroutine function for
+    `backend="async"`. With `ordered`, results are handed back in input order instead of as they complete.
+    """
+
+    def __init__(
+        self,
+        func: Callable,
+        backend: ExecutorBackend = "thread",
+        workers: int = 4,
+        requests_per_second: float | None = None,
+        rate_limit_key: Callable[[Any], str] | None = None,
+        max_in_flight: int | None = None,
+        chunksize: int = 1,
+        ordered: bool = False,
+        initializer: Callable | None = None,
+        initargs: tuple = (),
+        mp_context: str | None = None
+    ):
+        assert backend in ("thread", "process", "async"), f"Unknown backend '{backend}'."
+        assert isinstance(workers, int) and workers > 0, f"Input '{workers}' for argument `workers` must be a positive int."
+        assert isinstance(chunksize, int) and chunksize > 0, f"Input '{chunksize}' for argument `chunksize` must be a positive int."
+        assert requests_per_second is None or chunksize == 1, "Rate limited work must be submitted one item at a time (`chunksize=1`)."
+        self.func = func
+        self.backend = backend
+        self.workers = workers
+        self.rate_limiter = RateLimiter(requests_per_second) if requests_per_second is not None else None
+        self.rate_limit_key = rate_limit_key
+        # when rate limited, only submit once a worker is free, so an item starts when its token is taken
+        self.max_in_flight = max_in_flight or (workers if requests_per_second is not None else 2 * workers * chunksize)
+        self.chunksize = chunksize
+        self.ordered = ordered
+        self.cancelled = threading.Event()
+
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.loop_thread: threading.Thread | None = None
+        self.executor: ThreadPoolExecutor | ProcessPoolExecutor | None = None
+        if backend == "thread":
+            self.executor = ThreadPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs)
+        elif backend == "process":
+            from concurrent.futures import ProcessPoolExecutor  # <- pulls in multiprocessing; thread and async queues skip it
+            from multiprocessing import get_context
+            self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=get_context(mp_context), initializer=initializer, initargs=initargs)
+        else:
+            assert initializer is None, "The async backend has no workers to initialise."
+            import asyncio  # <- likewise slow to import
+            self.loop = asyncio.new_event_loop()
+            self.loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+            self.loop_thread.start()
+
+    def _submit(self, chunk: list[tuple[int, Any]]) -> Future:
+        if self.loop is not None:
+            import asyncio
+            return asyncio.run_coroutine_threadsafe(_run_chunk_async(self.func, chunk), self.loop)
+        return self.executor.submit(_run_chunk, self.func, chunk)
+
+    def _get_chunk_results(self, future: Future, chunk: list[tuple[int, Any]]) -> list[WorkResult]:
+        if future.cancelled():
+            return []
+        items = dict(chunk)
+        try:
+            return [WorkResult(index=index, item=items[index], result=result, error=error, duration=duration) for index, result, error, duration in future.result()]
+        except Exception as e:
+            # the chunk itself failed, e.g. a worker process died or a result couldn't be pickled
+            return [WorkResult(index=index, item=item, result=None, error=e, duration=0.0) for index, item in chunk]
+
+    def map(self, items: Iterable) -> Iterator[WorkResult]:
+        """Stream a `WorkResult` for every item. Items are only pulled from `items` as there is room in flight.
+        After `cancel()`, items not yet started are dropped and the results of those already running are still handed back."""
+        self.cancelled.clear()
+        indexed_items = enumerate(items)
+        next_chunk = list(islice(indexed_items, self.chunksize))
+        in_flight: dict[Future, list[tuple[int, Any]]] = {}
+        num_unyielded = 0
+        completed: dict[int, WorkResult] = {}  # <- `ordered` only; results waiting on an earlier item
+        next_index = 0
+
+        try:
+            while True:
+                wait_time = _POLL_INTERVAL
+                while next_chunk and not self.cancelled.is_set() and num_unyielded < self.max_in_flight:
+                    if self.rate_limiter is not None:
+                        key = self.rate_limit_key(next_chunk[0][1]) if self.rate_limit_key is not None else ""
+                        token_wait = self.rate_limiter.reserve(key)
+                        if token_wait > 0:
+                            wait_time = min(wait_time, token_wait)
+                            break
+                    in_flight[self._submit(next_chunk)] = next_chunk
+                    num_unyielded += len(next_chunk)
+                    next_chunk = list(islice(indexed_items, self.chunksize))
+
+                if self.cancelled.is_set():
+                    next_chunk = []
+                    for future in list(in_flight):
+                        if future.cancel():
+                            num_unyielded -= len(in_flight.pop(future))
+
+                if not in_flight and not next_chunk:
+                    break
+
+                done, _ = wait(in_flight, timeout=wait_time, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for result in self._get_chunk_results(future, in_flight.pop(future)):
+                        if not self.ordered:
+                            num_unyielded -= 1
+                            yield result
+                            continue
+                        completed[result["index"]] = result
+                        while next_index in completed:
+                            num_unyielded -= 1
+                            yield completed.pop(next_index)
+                            next_index += 1
+
+            # after a cancel the dropped items leave gaps in the order; hand back whatever did complete
+            for index in sorted(completed):
+                yield completed.pop(index)
+        finally:
+            # reached early if the caller stops iterating; don't leave queued work behind
+            for future in in_flight:
+                future.cancel()
+
+    def cancel(self) -> None:
+        """Stop submitting items; safe to call from another thread or from inside the loop over `map`."""
+        self.cancelled.set()
+
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.loop_thread.join()
+            self.loop.close()
+            self.loop = None
+
+    def __enter__(self) -> "WorkQueue":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def run_work_queue(func: Callable, items: Iterable, **kwargs) -> Iterator[WorkResult]:
+    """One-off `WorkQueue(func, **kwargs).map(items)`; the workers are shut down once the results are exhausted."""
+    with WorkQueue(func, **kwargs) as queue:
+        yield from queue.map(items)
+
+
+class ThreadLocalStore:
+    """One store per thread, for sqlite-backed stores shared by a pool's worker threads."""
+
+    def __init__(self, factory: Callable[[], Any]):
+        self.factory = factory
+        self.local = threading.local()
+
+    def get(self) -> Any:
+        if not hasattr(self.local, "store"):
+            self.local.store = self.factory()
+        return self.local.store